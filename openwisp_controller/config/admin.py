@@ -41,7 +41,7 @@ from ..admin import MultitenantAdminMixin
 from ..pki.base import PkiReversionTemplatesMixin
 from . import settings as app_settings
 from .base.vpn import AbstractVpn
-from .utils import send_file
+from .utils import send_archive
 from .widgets import JsonSchemaWidget
 
 logger = logging.getLogger(__name__)
@@ -270,11 +270,7 @@ class BaseConfigAdmin(BaseAdmin):
             config = instance.config
         else:
             raise Http404()
-        config_archive = config.generate()
-        return send_file(
-            filename='{0}.tar.gz'.format(config.name),
-            contents=config_archive.getvalue(),
-        )
+        return send_archive(config)
 
     def context_view(self, request, pk):
         instance = get_object_or_404(self.model, pk=pk)
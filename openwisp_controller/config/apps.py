@@ -1,7 +1,8 @@
 from django.apps import AppConfig
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
-from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.utils.module_loading import import_string
 from django.utils.translation import ugettext_lazy as _
 from openwisp_notifications.types import (
     register_notification_type,
@@ -10,7 +11,7 @@ from openwisp_notifications.types import (
 from swapper import get_model_name, load_model
 
 from . import settings as app_settings
-from .signals import config_modified
+from .signals import config_modified, config_modified_bulk
 
 # ensure Device.hardware_id field is not flagged as unique
 # (because it's flagged as unique_together with organization)
@@ -29,6 +30,21 @@ class ConfigConfig(AppConfig):
         self.register_notification_types()
         self.add_ignore_notification_widget()
         self.enable_cache_invalidation()
+        self.load_backend_validators()
+
+    def load_backend_validators(self):
+        """
+        builds the JSON-schema validators of the configured
+        backends once, so that they're reused by each validation
+        """
+        from .utils import get_backend_validator
+
+        backends = list(app_settings.BACKENDS) + list(app_settings.VPN_BACKENDS)
+        for backend, label in backends:
+            try:
+                get_backend_validator(import_string(backend))
+            except ImportError:
+                continue
 
     def __setmodels__(self):
         self.device_model = load_model('config', 'Device')
@@ -42,6 +58,7 @@ class ConfigConfig(AppConfig):
         * enforcement of required templates
         * automatic vpn client management on m2m_changed
         * automatic vpn client removal
+        * recalculation of the checksum stored in the DB
         * cache invalidation
         """
         from . import handlers  # noqa
@@ -72,6 +89,15 @@ class ConfigConfig(AppConfig):
             sender=self.vpnclient_model,
             dispatch_uid='vpnclient.post_delete',
         )
+        config_modified.connect(
+            self.config_model.invalidate_checksum_db_receiver,
+            dispatch_uid='config.invalidate_checksum_db',
+        )
+        config_modified_bulk.connect(
+            self.config_model.invalidate_checksum_db_bulk_receiver,
+            sender=self.config_model,
+            dispatch_uid='config.invalidate_checksum_db_bulk',
+        )
 
     def add_default_menu_items(self):
         menu_setting = 'OPENWISP_DEFAULT_ADMIN_MENU_ITEMS'
@@ -150,14 +176,53 @@ class ConfigConfig(AppConfig):
         Triggers the cache invalidation for the
         device config checksum (view and model method)
         """
-        from .controller.views import DeviceChecksumView
+        from .controller.views import DeviceChecksumView, DeviceRegisterView
 
         post_save.connect(
             DeviceChecksumView.invalidate_get_device_cache,
             sender=self.device_model,
             dispatch_uid='invalidate_get_device_cache',
         )
+        post_delete.connect(
+            DeviceChecksumView.invalidate_get_device_cache,
+            sender=self.device_model,
+            dispatch_uid='invalidate_get_device_cache_delete',
+        )
+        post_delete.connect(
+            DeviceChecksumView.invalidate_config_device_cache,
+            sender=self.config_model,
+            dispatch_uid='invalidate_config_device_cache',
+        )
+        pre_save.connect(
+            DeviceChecksumView.organization_pre_save,
+            sender=load_model('openwisp_users', 'Organization'),
+            dispatch_uid='checksum_view_organization_pre_save',
+        )
+        post_save.connect(
+            DeviceChecksumView.invalidate_organization_devices_cache,
+            sender=load_model('openwisp_users', 'Organization'),
+            dispatch_uid='invalidate_organization_devices_cache',
+        )
+        post_save.connect(
+            DeviceRegisterView.invalidate_shared_secret_receiver,
+            sender=load_model('config', 'OrganizationConfigSettings'),
+            dispatch_uid='invalidate_shared_secret_cache',
+        )
+        post_delete.connect(
+            DeviceRegisterView.invalidate_shared_secret_receiver,
+            sender=load_model('config', 'OrganizationConfigSettings'),
+            dispatch_uid='invalidate_shared_secret_cache_delete',
+        )
+        post_save.connect(
+            DeviceRegisterView.invalidate_organization_shared_secret_receiver,
+            sender=load_model('openwisp_users', 'Organization'),
+            dispatch_uid='invalidate_organization_shared_secret_cache',
+        )
         config_modified.connect(
             DeviceChecksumView.invalidate_checksum_cache,
             dispatch_uid='invalidate_checksum_cache',
         )
+        config_modified_bulk.connect(
+            DeviceChecksumView.invalidate_checksum_cache_bulk,
+            dispatch_uid='invalidate_checksum_cache_bulk',
+        )
@@ -0,0 +1,217 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.core.cache import caches
+
+from . import settings as app_settings
+
+logger = logging.getLogger(__name__)
+
+
+class CacheArchiveStore(object):
+    """
+    stores configuration archives in the cache defined in
+    ``cache_alias``, which should be dedicated to archives,
+    when the total size of the stored archives exceeds
+    ``max_size`` (bytes) the archives are removed in the order
+    in which they have been stored (FIFO): reads are not tracked,
+    which would require writing to the cache at each download
+    """
+
+    timeout = 60 * 60 * 24 * 30
+    prefix = 'openwisp_controller.archive'
+
+    def __init__(self, cache_alias, max_size):
+        self.cache = caches[cache_alias]
+        self.max_size = max_size
+
+    def _get_key(self, suffix):
+        return f'{self.prefix}.{suffix}'
+
+    def _incr(self, name, delta=1):
+        key = self._get_key(name)
+        self.cache.add(key, 0, None)
+        return self.cache.incr(key, delta)
+
+    def get(self, checksum):
+        return self.cache.get(self._get_key(checksum))
+
+    def set(self, checksum, contents):
+        if not self.cache.add(self._get_key(checksum), contents, self.timeout):
+            return
+        # the stored archives are queued in numbered slots
+        # in order to know which ones are the oldest
+        size = len(contents)
+        index_key = self._get_key('index')
+        # the index may have been evicted from the cache,
+        # in that case the count of evicted slots restarts too
+        if self.cache.add(index_key, 0, None):
+            self.cache.set(self._get_key('evicted'), 0, None)
+        slot = self.cache.incr(index_key)
+        self.cache.set(self._get_key(f'slot-{slot}'), (checksum, size), None)
+        if self._incr('size', size) > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """
+        removes the first stored archives until
+        the total size is within ``max_size``
+        """
+        while self.cache.get(self._get_key('size'), 0) > self.max_size:
+            index = self.cache.get(self._get_key('index'), 0)
+            # each process evicts a different slot
+            slot = self._incr('evicted')
+            if slot > index:
+                # the counters have been evicted from the
+                # cache meanwhile, the accounting restarts
+                self.cache.set_many(
+                    {self._get_key('evicted'): index, self._get_key('size'): 0}, None,
+                )
+                break
+            slot_key = self._get_key(f'slot-{slot}')
+            entry = self.cache.get(slot_key)
+            if entry is None:
+                continue
+            checksum, size = entry
+            self.cache.delete_many([self._get_key(checksum), slot_key])
+            self._incr('size', -size)
+            logger.debug(f'evicted configuration archive {checksum}')
+
+
+class FileSystemArchiveStore(object):
+    """
+    stores configuration archives in a local directory,
+    when the total size exceeds ``max_size`` (bytes)
+    the least recently used archives are removed
+    """
+
+    suffix = '.tar.gz'
+    # the total size is tracked while writing and the directory
+    # (which may be shared with other processes) is scanned only
+    # when the size limit is exceeded or at most every ``scan_interval``
+    # seconds, eviction frees some more space than needed (see
+    # ``evict_ratio``) to avoid scanning again at the next write
+    scan_interval = 60
+    evict_ratio = 0.9
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._size = None
+        self._last_scan = None
+
+    def _get_path(self, checksum):
+        return os.path.join(self.path, f'{checksum}{self.suffix}')
+
+    def get(self, checksum):
+        path = self._get_path(checksum)
+        try:
+            with open(path, 'rb') as f:
+                contents = f.read()
+            # the modification time is used to track
+            # the least recently used archives
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return contents
+
+    def open(self, checksum):
+        """
+        returns the archive as a file object opened in binary
+        mode, which allows to stream it without loading it in
+        memory, or ``None`` if the archive is not available
+        """
+        path = self._get_path(checksum)
+        try:
+            archive = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted in the meantime, the open file is still readable
+            pass
+        return archive
+
+    def set(self, checksum, contents):
+        path = self._get_path(checksum)
+        if os.path.exists(path):
+            return
+        os.makedirs(self.path, exist_ok=True)
+        # write to a temporary file and then rename it to
+        # avoid that concurrent readers get incomplete archives
+        fd, temp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(contents)
+        os.replace(temp_path, path)
+        with self._lock:
+            if self._size is not None:
+                self._size += len(contents)
+            scan = (
+                self._size is None
+                or self._size > self.max_size
+                or time.monotonic() - self._last_scan > self.scan_interval
+            )
+        if scan:
+            self.evict()
+
+    def evict(self):
+        """
+        removes the least recently used archives if the total
+        size exceeds ``max_size``, until it's within the
+        fraction of ``max_size`` defined by ``evict_ratio``
+        """
+        archives = []
+        total_size = 0
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(self.suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            archives.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+        if total_size > self.max_size:
+            target_size = self.max_size * self.evict_ratio
+            for mtime, size, path in sorted(archives):
+                if total_size <= target_size:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+                logger.debug(f'evicted configuration archive {path}')
+        with self._lock:
+            self._size = total_size
+            self._last_scan = time.monotonic()
+
+
+_filesystem_stores = {}
+_filesystem_stores_lock = threading.Lock()
+
+
+def get_archive_store():
+    """
+    returns the archive store defined in
+    ``OPENWISP_CONTROLLER_ARCHIVE_STORE``
+    or ``None`` if the archive store is disabled
+    """
+    if app_settings.ARCHIVE_STORE == 'cache':
+        return CacheArchiveStore(
+            app_settings.ARCHIVE_STORE_CACHE, app_settings.ARCHIVE_STORE_MAX_SIZE
+        )
+    if app_settings.ARCHIVE_STORE == 'filesystem':
+        # the instances are reused in order to
+        # keep track of the size of the directory
+        key = (app_settings.ARCHIVE_STORE_DIR, app_settings.ARCHIVE_STORE_MAX_SIZE)
+        with _filesystem_stores_lock:
+            if key not in _filesystem_stores:
+                _filesystem_stores[key] = FileSystemArchiveStore(*key)
+            return _filesystem_stores[key]
+    return None
@@ -2,18 +2,26 @@ import collections
 import hashlib
 import json
 from copy import deepcopy
+from io import BytesIO
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.functional import cached_property
 from django.utils.module_loading import import_string
 from django.utils.translation import ugettext_lazy as _
 from jsonfield import JSONField
+from jsonschema.exceptions import ValidationError as JsonSchemaError
+from netjsonconfig.backends.base.backend import BaseBackend
 from netjsonconfig.exceptions import ValidationError as SchemaError
+from netjsonconfig.utils import merge_config
 
 from openwisp_utils.base import TimeStampedEditableModel
 
 from .. import settings as app_settings
+from ..archive_store import get_archive_store
+from ..exceptions import ChecksumNotReady
+from ..utils import get_backend_validator, sanitize_config
 
 
 class BaseModel(TimeStampedEditableModel):
@@ -103,11 +111,18 @@ class BaseConfig(BaseModel):
         calls ``validate`` method of netjsonconfig backend
         might trigger SchemaError
         """
-        # the following line is a trick needed to avoid cluttering
+        # the following line is needed to avoid cluttering
         # an eventual ``ValidationError`` message with ``OrderedDict``
         # which would make the error message hard to read
-        backend.config = json.loads(json.dumps(backend.config))
-        backend.validate()
+        backend.config = sanitize_config(backend.config)
+        # backends which customize the validation are left untouched
+        if type(backend).validate is not BaseBackend.validate:
+            backend.validate()
+            return
+        try:
+            get_backend_validator(type(backend)).validate(backend.config)
+        except JsonSchemaError as e:
+            raise SchemaError(e)
 
     @classmethod
     def clean_netjsonconfig_backend(cls, backend):
@@ -153,12 +168,13 @@ class BaseConfig(BaseModel):
         # expecting a many2many relationship
         if hasattr(self, 'templates'):
             if template_instances is None:
-                template_instances = self.templates.all()
-            templates_list = list()
-            for t in template_instances:
-                templates_list.append(t.config)
-                context.update(t.get_context())
-            kwargs['templates'] = templates_list
+                template_instances = list(self.templates.all())
+                templates_layer = self.get_templates_layer(template_instances)
+            else:
+                templates_layer = self._merge_templates(template_instances)
+            templates_config, templates_context = templates_layer
+            kwargs['templates'] = [templates_config] if template_instances else []
+            context.update(templates_context)
         # pass context to backend if get_context method is defined
         if hasattr(self, 'get_context'):
             context.update(self.get_context())
@@ -172,6 +188,44 @@ class BaseConfig(BaseModel):
             self._remove_duplicated_files(backend_instance)
         return backend_instance
 
+    _TEMPLATES_LAYER_CACHE_TIMEOUT = 60 * 60 * 24
+
+    def _get_templates_layer_cache_key(self, template_instances):
+        templates = ','.join(
+            f'{t.pk}:{t.modified.isoformat()}' for t in template_instances
+        )
+        digest = hashlib.md5(f'{self.backend}|{templates}'.encode()).hexdigest()
+        return f'openwisp_controller.templates_layer.{digest}'
+
+    def get_templates_layer(self, template_instances):
+        """
+        returns a tuple containing the configuration and the context
+        resulting from merging ``template_instances`` in order;
+        the result is cached, the cache key is derived from the
+        primary keys and modification times of the templates,
+        hence it changes automatically when any template is changed
+        """
+        if not template_instances:
+            return {}, {}
+        cache_key = self._get_templates_layer_cache_key(template_instances)
+        templates_layer = cache.get(cache_key)
+        if templates_layer is None:
+            templates_layer = self._merge_templates(template_instances)
+            cache.set(cache_key, templates_layer, self._TEMPLATES_LAYER_CACHE_TIMEOUT)
+        return templates_layer
+
+    def _merge_templates(self, template_instances):
+        """
+        merges templates in the same way netjsonconfig does
+        """
+        config = {}
+        context = {}
+        list_identifiers = self.backend_class.list_identifiers
+        for t in template_instances:
+            config = merge_config(config, deepcopy(t.config), list_identifiers)
+            context.update(t.get_context())
+        return config, context
+
     @classmethod
     def _remove_duplicated_files(cls, backend_instance):
         if 'files' not in backend_instance.config:
@@ -188,13 +242,69 @@ class BaseConfig(BaseModel):
         """
         return self.backend_instance.generate()
 
+    def get_archive(self):
+        """
+        returns the contents of the configuration archive;
+        if the archive store is enabled (see ``OPENWISP_CONTROLLER_ARCHIVE_STORE``)
+        and a cached checksum is available, the archive is looked up
+        in the archive store before generating it
+        """
+        archive_store = get_archive_store()
+        checksum = None
+        if archive_store and hasattr(self, 'get_cached_checksum'):
+            try:
+                checksum = self.get_cached_checksum()
+            except ChecksumNotReady:
+                pass
+        if checksum:
+            contents = archive_store.get(checksum)
+            if contents is not None:
+                return contents
+        contents = self.generate().getvalue()
+        if archive_store:
+            archive_store.set(hashlib.md5(contents).hexdigest(), contents)
+        return contents
+
+    def get_archive_file(self):
+        """
+        returns a tuple containing the checksum of the configuration and
+        the archive opened from the archive store as a file object, which
+        allows to stream it; returns ``None`` if the archive store
+        in use does not support streaming (only ``filesystem`` does)
+        """
+        archive_store = get_archive_store()
+        if not hasattr(archive_store, 'open'):
+            return None
+        if hasattr(self, 'get_cached_checksum'):
+            try:
+                checksum = self.get_cached_checksum()
+            except ChecksumNotReady:
+                checksum = None
+            archive = archive_store.open(checksum) if checksum else None
+            if archive is not None:
+                return checksum, archive
+        contents = self.generate().getvalue()
+        checksum = hashlib.md5(contents).hexdigest()
+        archive_store.set(checksum, contents)
+        archive = archive_store.open(checksum)
+        # the archive may be evicted right away if it's bigger
+        # than OPENWISP_CONTROLLER_ARCHIVE_STORE_MAX_SIZE
+        if archive is None:
+            archive = BytesIO(contents)
+        return checksum, archive
+
     @property
     def checksum(self):
         """
         returns checksum of configuration
+        (the archive is kept in the archive store, if enabled)
         """
         config = self.generate().getvalue()
-        return hashlib.md5(config).hexdigest()
+        checksum = hashlib.md5(config).hexdigest()
+        archive_store = get_archive_store()
+        if archive_store:
+            archive_store.set(checksum, config)
+        return checksum
 
     def json(self, dict=False, **kwargs):
         """
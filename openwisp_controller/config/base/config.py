@@ -2,8 +2,11 @@ import collections
 import logging
 
 from cache_memoize import cache_memoize
+from celery import group
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied, ValidationError
 from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from jsonfield import JSONField
 from model_utils import Choices
@@ -11,8 +14,14 @@ from model_utils.fields import StatusField
 from swapper import get_model_name
 
 from .. import settings as app_settings
+from ..exceptions import ChecksumNotReady
 from ..signals import config_modified, config_status_changed
 from ..sortedm2m.fields import SortedManyToManyField
+from ..tasks import (
+    get_checksum_task_cache_key,
+    update_config_checksum,
+    update_config_checksums,
+)
 from ..utils import get_default_templates_queryset
 from .base import BaseConfig
 
@@ -80,8 +89,24 @@ class AbstractConfig(BaseConfig):
         load_kwargs={'object_pairs_hook': collections.OrderedDict},
         dump_kwargs={'indent': 4},
     )
+    # filled automatically in the background,
+    # see ``update_checksum_db`` and ``get_cached_checksum``
+    checksum_db = models.CharField(
+        _('configuration checksum'),
+        max_length=32,
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    # updated also when the checksum is invalidated
+    checksum_updated = models.DateTimeField(
+        _('checksum last updated'), blank=True, null=True, editable=False
+    )
 
     _CHECKSUM_CACHE_TIMEOUT = 60 * 60 * 24 * 30  # 10 days
+    # the calculation of a missing checksum is scheduled
+    # again if it's not completed within this amount of seconds
+    _CHECKSUM_TASK_TIMEOUT = 60
 
     class Meta:
         abstract = True
@@ -95,6 +120,9 @@ class AbstractConfig(BaseConfig):
         self._initial_status = self.status
         self._send_config_modified_after_save = False
         self._send_config_status_changed = False
+        # see _schedule_checksum_db_update
+        self._checksum_db_update_scheduled = 0
+        self._checksum_db_update_covered = 0
 
     def __str__(self):
         if self._has_device():
@@ -134,10 +162,140 @@ class AbstractConfig(BaseConfig):
         """
         Handles caching,
         timeout=None means value is cached indefinitely
-        (invalidation handled on post_save/post_delete signal)
+        (invalidation handled on post_save/post_delete signal);
+        on cache miss the checksum stored in the database is used,
+        the configuration is never rendered on the request path:
+        if the checksum is not stored yet its calculation is
+        scheduled and ``ChecksumNotReady`` is raised
+        """
+        checksum = self._get_checksum_db()
+        if checksum:
+            return checksum
+        logger.debug(f'scheduling checksum calculation for config ID {self.pk}')
+        if cache.add(
+            get_checksum_task_cache_key(self.pk), True, self._CHECKSUM_TASK_TIMEOUT
+        ):
+            update_config_checksum.delay(self.pk)
+            # the task may have been executed already (eg: eager mode)
+            checksum = self._get_checksum_db()
+            if checksum:
+                return checksum
+        raise ChecksumNotReady(f'the checksum of config ID {self.pk} is not ready')
+
+    def _get_checksum_db(self):
+        return (
+            self.__class__.objects.filter(pk=self.pk)
+            .values_list('checksum_db', flat=True)
+            .first()
+        )
+
+    def update_checksum_db(self, checksum=None):
+        """
+        Stores the checksum in the database and updates
+        the cache used by ``get_cached_checksum``;
+        does not emit any ``post_save`` signal;
+        the checksum is discarded (and ``None`` is returned) if the
+        stored checksum has been invalidated after this instance was
+        loaded, because it may have been calculated from stale data
+        """
+        # invalidate_checksum_db updates checksum_updated
+        stamp = self.checksum_updated
+        if checksum is None:
+            checksum = self.checksum
+        checksum_updated = timezone.now()
+        updated = self.__class__.objects.filter(
+            pk=self.pk, checksum_updated=stamp
+        ).update(checksum_db=checksum, checksum_updated=checksum_updated)
+        if not updated:
+            logger.debug(f'discarded stale checksum of config ID {self.pk}')
+            return None
+        self.checksum_db = checksum
+        self.checksum_updated = checksum_updated
+        cache.set(
+            self.get_cached_checksum.get_cache_key(self),
+            checksum,
+            self._CHECKSUM_CACHE_TIMEOUT,
+        )
+        return checksum
+
+    def _schedule_checksum_db_update(self):
+        """
+        Recalculates the stored checksum in the background
+        once the current transaction is committed;
+        multiple calls in the same transaction launch one task
+        """
+        # each call is numbered: when the first callback of a commit runs,
+        # the calls made up to that moment are either part of the same
+        # commit or have been discarded by a rollback, hence the callbacks
+        # of the calls numbered up to then can be skipped
+        self._checksum_db_update_scheduled += 1
+        number = self._checksum_db_update_scheduled
+        pk = self.pk
+
+        def update():
+            if number <= self._checksum_db_update_covered:
+                return
+            self._checksum_db_update_covered = self._checksum_db_update_scheduled
+            update_config_checksum.delay(pk)
+
+        transaction.on_commit(update)
+
+    def invalidate_checksum_db(self):
         """
-        logger.debug(f'calculating checksum for config ID {self.pk}')
-        return self.checksum
+        Flags the stored checksum as stale (so that it's not
+        served anymore) and schedules its recalculation
+        """
+        self.checksum_db = None
+        # the checksums calculated before now are discarded
+        self.checksum_updated = timezone.now()
+        self.__class__.objects.filter(pk=self.pk).update(
+            checksum_db=None, checksum_updated=self.checksum_updated
+        )
+        self._schedule_checksum_db_update()
+
+    @classmethod
+    def invalidate_checksum_db_receiver(cls, instance, action=None, **kwargs):
+        """
+        Called from signal receiver (config_modified),
+        see config.apps.ConfigConfig.connect_signals
+        """
+        # handled in bulk by invalidate_checksum_db_bulk_receiver
+        if action == 'related_template_changed':
+            return
+        instance.invalidate_checksum_db()
+
+    @classmethod
+    def invalidate_checksum_db_bulk_receiver(cls, instances, **kwargs):
+        """
+        Called from signal receiver (config_modified_bulk),
+        flags the stored checksums of ``instances`` as stale
+        with one query and schedules their recalculation
+        """
+        pks = [instance.pk for instance in instances]
+        checksum_updated = timezone.now()
+        cls.objects.filter(pk__in=pks).update(
+            checksum_db=None, checksum_updated=checksum_updated
+        )
+        for instance in instances:
+            instance.checksum_db = None
+            instance.checksum_updated = checksum_updated
+        transaction.on_commit(lambda: cls._schedule_checksums_update(pks))
+
+    @classmethod
+    def _schedule_checksums_update(cls, pks):
+        """
+        Recalculates the stored checksums in the background,
+        the configs are split in chunks which are processed
+        in parallel by the celery workers, so that the checksums
+        are ready (and cached) before the devices ask for them
+        """
+        chunk_size = app_settings.CHECKSUM_PRECOMPUTE_CHUNK_SIZE
+        pks = [str(pk) for pk in pks]
+        tasks = []
+        for start in range(0, len(pks), chunk_size):
+            end = start + chunk_size
+            tasks.append(update_config_checksums.s(pks[start:end]))
+        group(tasks).apply_async()
 
     @classmethod
     def get_template_model(cls):
@@ -200,6 +358,9 @@ class AbstractConfig(BaseConfig):
             if not instance._just_created:
                 # sends only config modified signal
                 instance._send_config_modified_signal(action='m2m_templates_changed')
+            else:
+                # the stored checksum must be recalculated anyway
+                instance._schedule_checksum_db_update()
             if instance.status != 'modified':
                 # sends both status modified and config modified signals
                 instance.set_status_modified(send_config_modified_signal=False)
@@ -354,6 +515,7 @@ class AbstractConfig(BaseConfig):
         self._just_created = created
         result = super().save(*args, **kwargs)
         if created:
+            self._schedule_checksum_db_update()
             default_templates = self.get_default_templates()
             if default_templates:
                 self.templates.add(*default_templates)
@@ -415,42 +577,15 @@ class AbstractConfig(BaseConfig):
 
     def get_vpn_context(self):
         c = super().get_context()
-        for vpnclient in self.vpnclient_set.all().select_related('vpn', 'cert'):
-            vpn = vpnclient.vpn
-            vpn_id = vpn.pk.hex
-            context_keys = vpn._get_auto_context_keys()
-            ca = vpn.ca
-            cert = vpnclient.cert
-            # CA
-            ca_filename = 'ca-{0}-{1}.pem'.format(
-                ca.pk, ca.common_name.replace(' ', '_')
-            )
-            ca_path = '{0}/{1}'.format(app_settings.CERT_PATH, ca_filename)
-            # update context
-            c.update(
-                {
-                    context_keys['ca_path']: ca_path,
-                    context_keys['ca_contents']: ca.certificate,
-                }
-            )
-            # conditional needed for VPN without x509 authentication
-            # eg: simple password authentication
-            if cert:
-                # cert
-                cert_filename = 'client-{0}.pem'.format(vpn_id)
-                cert_path = '{0}/{1}'.format(app_settings.CERT_PATH, cert_filename)
-                # key
-                key_filename = 'key-{0}.pem'.format(vpn_id)
-                key_path = '{0}/{1}'.format(app_settings.CERT_PATH, key_filename)
-                # update context
-                c.update(
-                    {
-                        context_keys['cert_path']: cert_path,
-                        context_keys['cert_contents']: cert.certificate,
-                        context_keys['key_path']: key_path,
-                        context_keys['key_contents']: cert.private_key,
-                    }
-                )
+        # unsaved configurations do not have VPN clients yet
+        if self._state.adding:
+            return c
+        # VPN clients have been loaded with prefetch_related (bulk renders)
+        if 'vpnclient_set' in getattr(self, '_prefetched_objects_cache', {}):
+            for vpnclient in self.vpnclient_set.all():
+                c.update(vpnclient.get_context())
+        else:
+            c.update(self.vpn.through.get_cached_context(self))
         return c
 
     def get_context(self, system=False):
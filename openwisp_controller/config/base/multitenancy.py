@@ -30,5 +30,9 @@ class AbstractOrganizationConfigSettings(UUIDModel):
         verbose_name_plural = verbose_name
         abstract = True
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._initial_shared_secret = self.shared_secret
+
     def __str__(self):
         return self.organization.name
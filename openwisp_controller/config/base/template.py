@@ -1,6 +1,7 @@
 from collections import OrderedDict
 from copy import copy
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
 from django.utils.translation import ugettext_lazy as _
@@ -9,7 +10,9 @@ from swapper import get_model_name
 from taggit.managers import TaggableManager
 
 from ...base import ShareableOrgMixinUniqueName
+from .. import settings as app_settings
 from ..settings import DEFAULT_AUTO_CERT
+from ..signals import config_modified_bulk
 from ..tasks import update_template_related_config_status
 from .base import BaseConfig
 
@@ -124,23 +127,72 @@ class AbstractTemplate(ShareableOrgMixinUniqueName, BaseConfig):
                 lambda: update_template_related_config_status.delay(self.pk)
             )
 
+    _RELATED_CONFIG_STATUS_CURSOR_TIMEOUT = 60 * 60 * 24
+
+    def _get_related_config_status_cursor_key(self):
+        return f'openwisp_controller.template_fanout.{self.pk.hex}'
+
+    def _get_related_config_status_cursor(self):
+        """
+        returns the PK of the last related config processed by
+        ``_update_related_config_status`` for the current version
+        of the template, or ``None`` if it has not started yet
+        """
+        cursor = cache.get(self._get_related_config_status_cursor_key())
+        # progress recorded for a previous change of the template is ignored
+        if cursor and cursor['modified'] == self.modified:
+            return cursor['last_pk']
+        return None
+
     def _update_related_config_status(self):
+        """
+        flags related configs as modified and sends the related signals;
+        configs are processed in chunks ordered by PK and the progress is
+        recorded in the cache, so that if the execution is interrupted
+        it's resumed from the last processed chunk
+        """
+        chunk_size = app_settings.TEMPLATE_FANOUT_CHUNK_SIZE
+        cursor_key = self._get_related_config_status_cursor_key()
+        last_pk = self._get_related_config_status_cursor()
+        queryset = self.config_relations.select_related('device').order_by('pk')
+        while True:
+            if last_pk:
+                configs = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+            else:
+                configs = list(queryset[:chunk_size])
+            if not configs:
+                break
+            self._update_related_config_status_chunk(configs)
+            last_pk = configs[-1].pk
+            cache.set(
+                cursor_key,
+                {'modified': self.modified, 'last_pk': last_pk},
+                self._RELATED_CONFIG_STATUS_CURSOR_TIMEOUT,
+            )
+            if len(configs) < chunk_size:
+                break
+        cache.delete(cursor_key)
+
+    def _update_related_config_status_chunk(self, configs):
+        config_model = self.config_relations.model
         # use atomic to ensure any code bound to
         # be executed via transaction.on_commit
-        # is executed after the whole block
+        # is executed after the whole chunk
         with transaction.atomic():
-            changing_status = list(
-                self.config_relations.exclude(status='modified').values_list(
-                    'pk', flat=True
-                )
-            )
-            for config in self.config_relations.select_related('device').iterator():
+            for config in configs:
                 # config modified signal sent regardless
                 config._send_config_modified_signal(action='related_template_changed')
                 # config status changed signal sent only if status changed
-                if config.pk in changing_status:
+                if config.status != 'modified':
                     config._send_config_status_changed_signal()
-            self.config_relations.exclude(status='modified').update(status='modified')
+            config_modified_bulk.send(
+                sender=config_model,
+                instances=configs,
+                action='related_template_changed',
+            )
+            config_model.objects.filter(
+                pk__in=[config.pk for config in configs]
+            ).exclude(status='modified').update(status='modified')
 
     def clean(self, *args, **kwargs):
         """
@@ -1,6 +1,8 @@
 import collections
 import subprocess
+from hashlib import md5
 
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.db import models, transaction
 from django.utils.text import slugify
@@ -11,7 +13,8 @@ from openwisp_utils.base import KeyField
 
 from ...base import ShareableOrgMixinUniqueName
 from .. import settings as app_settings
-from ..tasks import create_vpn_dh
+from ..ffdhe import FFDHE_GROUPS
+from ..tasks import create_vpn_client_cert, create_vpn_dh
 from .base import BaseConfig
 
 
@@ -87,7 +90,9 @@ class AbstractVpn(ShareableOrgMixinUniqueName, BaseConfig):
         """
         if not self.cert:
             self.cert = self._auto_create_cert()
-        if not self.dh:
+        if not self.dh and app_settings.VPN_DH_GROUP:
+            self.dh = FFDHE_GROUPS[app_settings.VPN_DH_GROUP]
+        elif not self.dh:
             self.dh = self._placeholder_dh
         is_adding = self._state.adding
         super().save(*args, **kwargs)
@@ -228,12 +233,135 @@ class AbstractVpnClient(models.Model):
 
     def save(self, *args, **kwargs):
         """
-        automatically creates an x509 certificate when ``auto_cert`` is True
+        automatically creates an x509 certificate when ``auto_cert`` is True,
+        the certificate is issued in the background if
+        ``OPENWISP_CONTROLLER_VPN_CLIENT_CERT_ASYNC`` is ``True``
         """
+        schedule_cert = False
         if self.auto_cert:
-            cn = self._get_common_name()
-            self._auto_create_cert(name=self.config.device.name, common_name=cn)
+            if app_settings.VPN_CLIENT_CERT_ASYNC:
+                schedule_cert = not self.cert_id
+            else:
+                cn = self._get_common_name()
+                self._auto_create_cert(name=self.config.device.name, common_name=cn)
         super().save(*args, **kwargs)
+        if schedule_cert:
+            self._schedule_cert_creation([self.pk])
+
+    @classmethod
+    def _schedule_cert_creation(cls, pks):
+        """
+        issues the certificates of the specified VPN clients
+        in the background once the transaction is committed
+        """
+
+        def schedule():
+            for pk in pks:
+                create_vpn_client_cert.delay(pk)
+
+        transaction.on_commit(schedule)
+
+    def issue_cert(self):
+        """
+        issues the certificate of a VPN client which has been
+        created without it (see ``save``) and flags the configuration
+        as modified, so that the devices download the new certificate
+        """
+        cn = self._get_common_name()
+        with transaction.atomic():
+            cert = self._auto_create_cert(name=self.config.device.name, common_name=cn)
+            updated = self.__class__.objects.filter(pk=self.pk, cert=None).update(
+                cert=cert
+            )
+            # the client has been deleted or has got
+            # a certificate in the meantime
+            if not updated:
+                transaction.set_rollback(True)
+                return None
+        self.config.set_status_modified()
+        return cert
+
+    def get_context(self):
+        """
+        returns the context of the configuration of the device
+        needed to use the VPN (CA, certificate and private key)
+        """
+        vpn = self.vpn
+        context_keys = vpn._get_auto_context_keys()
+        ca = vpn.ca
+        cert = self.cert
+        # CA
+        ca_filename = 'ca-{0}-{1}.pem'.format(ca.pk, ca.common_name.replace(' ', '_'))
+        ca_path = '{0}/{1}'.format(app_settings.CERT_PATH, ca_filename)
+        c = {
+            context_keys['ca_path']: ca_path,
+            context_keys['ca_contents']: ca.certificate,
+        }
+        # conditional needed for VPN without x509 authentication
+        # eg: simple password authentication
+        if cert:
+            vpn_id = vpn.pk.hex
+            # cert
+            cert_filename = 'client-{0}.pem'.format(vpn_id)
+            cert_path = '{0}/{1}'.format(app_settings.CERT_PATH, cert_filename)
+            # key
+            key_filename = 'key-{0}.pem'.format(vpn_id)
+            key_path = '{0}/{1}'.format(app_settings.CERT_PATH, key_filename)
+            c.update(
+                {
+                    context_keys['cert_path']: cert_path,
+                    context_keys['cert_contents']: cert.certificate,
+                    context_keys['key_path']: key_path,
+                    context_keys['key_contents']: cert.private_key,
+                }
+            )
+        return c
+
+    _CONTEXT_CACHE_TIMEOUT = 60 * 60 * 24
+    # the modification time of the VPN, CA and certificate is part
+    # of the cache key, so that changes invalidate the cached context
+    _CONTEXT_CACHE_FIELDS = (
+        'pk',
+        'vpn_id',
+        'vpn__modified',
+        'vpn__ca_id',
+        'vpn__ca__modified',
+        'cert_id',
+        'cert__modified',
+    )
+
+    @classmethod
+    def _get_context_cache_key(cls, values):
+        digest = md5(':'.join(str(value) for value in values).encode()).hexdigest()
+        return f'openwisp_controller.vpn_context.{digest}'
+
+    @classmethod
+    def get_cached_context(cls, config):
+        """
+        returns the VPN context of ``config`` (see ``get_context``),
+        the context of each VPN client is cached, the cached
+        contexts are looked up with one lightweight query
+        and the missing ones are loaded with one query
+        """
+        rows = config.vpnclient_set.values_list(*cls._CONTEXT_CACHE_FIELDS)
+        keys = {row[0]: cls._get_context_cache_key(row) for row in rows}
+        if not keys:
+            return {}
+        contexts = cache.get_many(list(keys.values()))
+        missing = [pk for pk, key in keys.items() if key not in contexts]
+        if missing:
+            queryset = cls.objects.filter(pk__in=missing).select_related(
+                'vpn__ca', 'cert'
+            )
+            new_contexts = {
+                keys[client.pk]: client.get_context() for client in queryset
+            }
+            cache.set_many(new_contexts, cls._CONTEXT_CACHE_TIMEOUT)
+            contexts.update(new_contexts)
+        context = {}
+        for key in keys.values():
+            context.update(contexts.get(key, {}))
+        return context
 
     def _get_common_name(self):
         """
@@ -254,7 +382,8 @@ class AbstractVpnClient(models.Model):
         automatically deletes certificates when ``auto_cert`` is ``True``
         """
         instance = kwargs['instance']
-        if instance.auto_cert:
+        # the certificate may not have been issued yet
+        if instance.auto_cert and instance.cert:
             instance.cert.delete()
 
     def _auto_create_cert_extra(self, cert):
@@ -1,5 +1,7 @@
+import hashlib
 import json
 import logging
+import time
 import uuid
 from ipaddress import ip_address
 
@@ -8,13 +10,17 @@ from django.core.cache import cache
 from django.core.exceptions import FieldDoesNotExist, ValidationError
 from django.db import transaction
 from django.db.models import Q
+from django.http import Http404
 from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic.base import View
 from django.views.generic.detail import SingleObjectMixin
 from swapper import load_model
 
 from .. import settings as app_settings
+from ..dispatcher import send_controller_signal
+from ..exceptions import ChecksumNotReady
 from ..signals import checksum_requested, config_download_requested, device_registered
 from ..utils import (
     ControllerResponse,
@@ -72,7 +78,9 @@ class CsrfExtemptMixin(object):
 class UpdateLastIpMixin(object):
     def update_last_ip(self, device, request):
         result = update_last_ip(device, request)
-        if result:
+        # when the update is buffered, duplicates
+        # are removed by flush_ip_update_buffer
+        if result and not app_settings.IP_UPDATE_BUFFER:
             self._remove_duplicated_management_ip(device)
             self._remove_duplicated_last_ip(device)
         return result
@@ -128,6 +136,8 @@ class DeviceChecksumView(UpdateLastIpMixin, GetDeviceView):
     """
 
     def get(self, request, pk):
+        if app_settings.CHECKSUM_FAST_PATH:
+            return self.get_fast_path(request, pk)
         device = self.get_device()
         bad_request = forbid_unallowed(request, 'GET', 'key', device.key)
         if bad_request:
@@ -136,12 +146,79 @@ class DeviceChecksumView(UpdateLastIpMixin, GetDeviceView):
         # updates cache if ip addresses changed
         if updated:
             self.update_device_cache(device)
-        checksum_requested.send(
-            sender=device.__class__, instance=device, request=request
-        )
-        return ControllerResponse(
-            device.config.get_cached_checksum(), content_type='text/plain'
+        send_controller_signal(
+            checksum_requested,
+            sender=device.__class__,
+            instance=device,
+            request=request,
         )
+        return self.send_checksum(device.config)
+
+    # seconds after which devices should ask again
+    # for a checksum which is not ready yet
+    _CHECKSUM_RETRY_AFTER = 30
+
+    @classmethod
+    def send_checksum(cls, config):
+        """
+        returns the checksum of ``config``, or an error with
+        status ``503`` if the checksum has not been calculated
+        yet (it's calculated in the background)
+        """
+        try:
+            checksum = config.get_cached_checksum()
+        except ChecksumNotReady:
+            response = ControllerResponse(
+                'error: checksum not ready', content_type='text/plain', status=503
+            )
+            response['Retry-After'] = cls._CHECKSUM_RETRY_AFTER
+            return response
+        return ControllerResponse(checksum, content_type='text/plain')
+
+    def get_fast_path(self, request, pk):
+        """
+        Answers the request using only the compact record
+        returned by ``get_device_record``, the database is
+        queried only if the IP addresses of the device change
+        """
+        record = self.get_device_record()
+        if not record['organization_is_active']:
+            raise Http404()
+        bad_request = forbid_unallowed(request, 'GET', 'key', record['key'])
+        if bad_request:
+            return bad_request
+        ip = request.META.get('REMOTE_ADDR')
+        management_ip = request.GET.get('management_ip')
+        device = None
+        if record['last_ip'] != ip or record['management_ip'] != management_ip:
+            device = self.get_device()
+            if self.update_last_ip(device, request):
+                self.update_device_cache(device)
+                record.update(
+                    last_ip=device.last_ip, management_ip=device.management_ip
+                )
+                self.update_device_record_cache(record)
+        if checksum_requested.has_listeners(self.model):
+            device = device or self.get_device()
+            send_controller_signal(
+                checksum_requested,
+                sender=device.__class__,
+                instance=device,
+                request=request,
+            )
+        checksum = cache.get(record['checksum_cache_key'])
+        if checksum is None:
+            try:
+                config = Config.objects.select_related('device').get(
+                    pk=record['config_id']
+                )
+            except Config.DoesNotExist:
+                # the configuration has been deleted: the record is stale
+                self.get_device.invalidate(self)
+                self.get_device_record.invalidate(self)
+                raise Http404()
+            return self.send_checksum(config)
+        return ControllerResponse(checksum, content_type='text/plain')
 
     @cache_memoize(
         timeout=Config._CHECKSUM_CACHE_TIMEOUT, args_rewrite=get_device_args_rewrite
@@ -151,9 +228,62 @@ class DeviceChecksumView(UpdateLastIpMixin, GetDeviceView):
         logger.debug(f'retrieving device ID {pk} from DB')
         return self.get_object(pk=pk)
 
+    @cache_memoize(
+        timeout=Config._CHECKSUM_CACHE_TIMEOUT, args_rewrite=get_device_args_rewrite
+    )
+    def get_device_record(self):
+        """
+        Returns a compact representation of the device
+        which contains only the information needed by
+        ``get_fast_path``, retrieved with a single query
+        """
+        pk = self.kwargs['pk']
+        logger.debug(f'retrieving record of device ID {pk} from DB')
+        try:
+            values = (
+                self.model.objects.filter(pk=pk, config__isnull=False)
+                .values(*self._device_record_fields)
+                .first()
+            )
+        except ValidationError:
+            values = None
+        if values is None:
+            raise Http404()
+        return self.build_device_record(values)
+
+    _device_record_fields = (
+        'pk',
+        'key',
+        'last_ip',
+        'management_ip',
+        'organization__is_active',
+        'config__id',
+    )
+
+    @classmethod
+    def build_device_record(cls, values):
+        """
+        builds the record returned by ``get_device_record``
+        from the values of ``_device_record_fields``
+        """
+        config_id = values['config__id']
+        return {
+            'key': values['key'],
+            'last_ip': values['last_ip'],
+            'management_ip': values['management_ip'],
+            'organization_is_active': values['organization__is_active'],
+            'config_id': config_id,
+            'checksum_cache_key': Config.get_cached_checksum.get_cache_key(
+                Config(pk=config_id)
+            ),
+        }
+
     def update_device_cache(self, device):
         cache.set(self.get_device.get_cache_key(self), device)
 
+    def update_device_record_cache(self, record):
+        cache.set(self.get_device_record.get_cache_key(self), record)
+
     @classmethod
     def invalidate_get_device_cache(cls, instance, **kwargs):
         """
@@ -163,15 +293,205 @@ class DeviceChecksumView(UpdateLastIpMixin, GetDeviceView):
         pk = str(instance.pk.hex)
         view.kwargs = {'pk': pk}
         view.get_device.invalidate(view)
+        view.get_device_record.invalidate(view)
         logger.debug(f'invalidated view cache for device ID {pk}')
 
     @classmethod
-    def invalidate_checksum_cache(cls, instance, device, **kwargs):
+    def invalidate_config_device_cache(cls, instance, **kwargs):
+        """
+        Called from signal receiver which performs cache invalidation
+        when a configuration is deleted
+        """
+        cls.invalidate_get_device_cache(cls.model(pk=instance.device_id))
+
+    # amount of devices whose cache keys are deleted at once
+    # when the organization is enabled or disabled
+    _ORGANIZATION_INVALIDATION_BATCH_SIZE = 1000
+
+    @classmethod
+    def organization_pre_save(cls, instance, **kwargs):
+        """
+        Called from signal receiver, checks whether the
+        ``is_active`` flag of the organization is being changed
+        (see ``invalidate_organization_devices_cache``)
+        """
+        instance._is_active_changed = (
+            not instance._state.adding
+            and instance.__class__.objects.filter(pk=instance.pk)
+            .exclude(is_active=instance.is_active)
+            .exists()
+        )
+
+    @classmethod
+    def invalidate_organization_devices_cache(cls, instance, **kwargs):
         """
         Called from signal receiver which performs cache invalidation
+        when an organization is enabled or disabled
         """
+        if not getattr(instance, '_is_active_changed', True):
+            return
+        view = cls()
+        keys = []
+        for pk in (
+            cls.model.objects.filter(organization=instance)
+            .values_list('pk', flat=True)
+            .iterator()
+        ):
+            view.kwargs = {'pk': pk.hex}
+            keys.append(view.get_device.get_cache_key(view))
+            keys.append(view.get_device_record.get_cache_key(view))
+            if len(keys) >= cls._ORGANIZATION_INVALIDATION_BATCH_SIZE * 2:
+                cache.delete_many(keys)
+                keys = []
+        cache.delete_many(keys)
+        instance._is_active_changed = False
+        logger.debug(f'invalidated view cache for devices of organization {instance}')
+
+    @classmethod
+    def invalidate_checksum_cache(cls, instance, device, action=None, **kwargs):
+        """
+        Called from signal receiver which performs cache invalidation
+        """
+        # handled in bulk by invalidate_checksum_cache_bulk
+        if action == 'related_template_changed':
+            return
         instance.get_cached_checksum.invalidate(instance)
 
+    @classmethod
+    def invalidate_checksum_cache_bulk(cls, instances, **kwargs):
+        """
+        Called from signal receiver (config_modified_bulk)
+        which performs cache invalidation of multiple configs
+        """
+        cache.delete_many(
+            [
+                instance.get_cached_checksum.get_cache_key(instance)
+                for instance in instances
+            ]
+        )
+
+
+class DeviceChecksumBulkView(CsrfExtemptMixin, View):
+    """
+    returns the configuration checksums of multiple devices,
+    expects a JSON body like:
+    ``{"devices": [{"id": "<device-id>", "key": "<device-key>"}]}``;
+    checksums are read from the cache with
+    bulk queries for the missing ones
+    """
+
+    model = Device
+    checksum_view_class = DeviceChecksumView
+
+    def post(self, request, *args, **kwargs):
+        try:
+            devices = json.loads(request.body)['devices']
+            keys = {str(device['id']): str(device['key']) for device in devices}
+        except (ValueError, KeyError, TypeError):
+            error = 'error: invalid request body\n'
+            return invalid_response(request, error, status=400)
+        max_devices = app_settings.BULK_CHECKSUM_MAX_DEVICES
+        if len(keys) > max_devices:
+            error = f'error: too many devices, the maximum is {max_devices}\n'
+            return invalid_response(request, error, status=400)
+        records = self.get_device_records(list(keys))
+        errors = {}
+        for pk, key in keys.items():
+            record = records.get(pk)
+            if record is None or not record['organization_is_active']:
+                errors[pk] = 'not found'
+            elif record['key'] != key:
+                errors[pk] = 'wrong key'
+        records = {pk: records[pk] for pk in keys if pk not in errors}
+        checksums = self.get_checksums(records)
+        for pk in records:
+            if pk not in checksums:
+                errors[pk] = 'checksum not ready'
+        if checksum_requested.has_listeners(self.model):
+            for device in self.model.objects.filter(pk__in=list(records)):
+                send_controller_signal(
+                    checksum_requested,
+                    sender=device.__class__,
+                    instance=device,
+                    request=request,
+                )
+        return ControllerResponse(
+            json.dumps({'checksums': checksums, 'errors': errors}),
+            content_type='application/json',
+        )
+
+    def get_device_records(self, pks):
+        """
+        returns the records of the devices (see
+        ``DeviceChecksumView.get_device_record``), the records
+        which are not cached are retrieved with a single query
+        """
+        cache_keys = {}
+        for pk in pks:
+            view = self.checksum_view_class()
+            view.kwargs = {'pk': pk}
+            cache_keys[pk] = view.get_device_record.get_cache_key(view)
+        cached = cache.get_many(list(cache_keys.values()))
+        records = {pk: cached[key] for pk, key in cache_keys.items() if key in cached}
+        missing = {}
+        for pk in pks:
+            if pk in records:
+                continue
+            try:
+                missing[uuid.UUID(pk)] = pk
+            except ValueError:
+                continue
+        if not missing:
+            return records
+        queryset = self.model.objects.filter(
+            pk__in=list(missing), config__isnull=False
+        ).values(*self.checksum_view_class._device_record_fields)
+        new_records = {}
+        for values in queryset:
+            pk = missing[values['pk']]
+            records[pk] = self.checksum_view_class.build_device_record(values)
+            new_records[cache_keys[pk]] = records[pk]
+        cache.set_many(new_records, Config._CHECKSUM_CACHE_TIMEOUT)
+        return records
+
+    def get_checksums(self, records):
+        """
+        returns the cached checksums of the configurations of the
+        devices, missing checksums are retrieved from the database
+        with a single query, the checksums which are not stored yet
+        are calculated in the background and left out
+        """
+        cache_keys = {
+            pk: record['checksum_cache_key'] for pk, record in records.items()
+        }
+        cached = cache.get_many(list(cache_keys.values()))
+        checksums = {}
+        missing = {}
+        for pk, key in cache_keys.items():
+            if key in cached:
+                checksums[pk] = cached[key]
+            else:
+                missing[records[pk]['config_id']] = pk
+        if not missing:
+            return checksums
+        stored = {}
+        for config_id, checksum in Config.objects.filter(
+            pk__in=list(missing), checksum_db__isnull=False
+        ).values_list('pk', 'checksum_db'):
+            pk = missing.pop(config_id)
+            checksums[pk] = checksum
+            stored[cache_keys[pk]] = checksum
+        cache.set_many(stored, Config._CHECKSUM_CACHE_TIMEOUT)
+        # checksums which have not been stored yet
+        for config in Config.objects.filter(pk__in=list(missing)).select_related(
+            'device'
+        ):
+            try:
+                checksums[missing[config.pk]] = config.get_cached_checksum()
+            except ChecksumNotReady:
+                continue
+        return checksums
+
 
 class DeviceDownloadConfigView(GetDeviceView):
     """
@@ -183,8 +503,11 @@ class DeviceDownloadConfigView(GetDeviceView):
         bad_request = forbid_unallowed(request, 'GET', 'key', device.key)
         if bad_request:
             return bad_request
-        config_download_requested.send(
-            sender=device.__class__, instance=device, request=request
+        send_controller_signal(
+            config_download_requested,
+            sender=device.__class__,
+            instance=device,
+            request=request,
         )
         return send_device_config(device.config, request)
 
@@ -294,7 +617,9 @@ class DeviceRegisterView(UpdateLastIpMixin, CsrfExtemptMixin, View):
         """
         queryset = config.get_template_model().objects.all()
         # filter templates of the same organization or shared templates
-        return queryset.filter(Q(organization=self.organization) | Q(organization=None))
+        return queryset.filter(
+            Q(organization_id=self.organization_id) | Q(organization=None)
+        )
 
     def add_tagged_templates(self, config, request):
         """
@@ -327,24 +652,100 @@ class DeviceRegisterView(UpdateLastIpMixin, CsrfExtemptMixin, View):
             if invalid_response:
                 return invalid_response
 
+    # shared secret lookups are cached in the shared cache only, so that
+    # the invalidation performed by any process is effective on all of them
+    _SHARED_SECRET_CACHE_TIMEOUT = 60 * 60 * 24
+    # unrecognized secrets are cached for a short time
+    _SHARED_SECRET_NEGATIVE_TIMEOUT = 60
+
+    @classmethod
+    def _get_shared_secret_cache_key(cls, secret):
+        # the secret itself is not used in the cache key
+        digest = hashlib.md5(str(secret).encode()).hexdigest()
+        return f'openwisp_controller.shared_secret.{digest}'
+
+    @classmethod
+    def get_shared_secret_record(cls, secret):
+        """
+        returns a tuple containing the organization ID, the organization
+        ``is_active`` and ``registration_enabled`` flags of the
+        organization which has the specified ``shared_secret``,
+        or ``None`` if the secret is not recognized
+        """
+        cache_key = cls._get_shared_secret_cache_key(secret)
+        record = cache.get(cache_key)
+        if record is None:
+            record = (
+                cls.org_config_settings_model.objects.filter(shared_secret=secret)
+                .values_list(
+                    'organization_id', 'organization__is_active', 'registration_enabled'
+                )
+                .first()
+            )
+            # a falsy value is cached for unrecognized secrets
+            timeout = (
+                cls._SHARED_SECRET_CACHE_TIMEOUT
+                if record
+                else cls._SHARED_SECRET_NEGATIVE_TIMEOUT
+            )
+            cache.set(cache_key, record or False, timeout)
+        if not record:
+            return None
+        return tuple(record)
+
+    @classmethod
+    def invalidate_shared_secret_cache(cls, *secrets):
+        cache.delete_many(
+            [cls._get_shared_secret_cache_key(secret) for secret in secrets]
+        )
+
+    @classmethod
+    def invalidate_shared_secret_receiver(cls, instance, **kwargs):
+        """
+        Called from signal receiver which performs cache invalidation
+        when the configuration settings of an organization are changed
+        """
+        cls.invalidate_shared_secret_cache(
+            instance.shared_secret, instance._initial_shared_secret
+        )
+        instance._initial_shared_secret = instance.shared_secret
+
+    @classmethod
+    def invalidate_organization_shared_secret_receiver(cls, instance, **kwargs):
+        """
+        Called from signal receiver which performs cache invalidation
+        when an organization is changed (eg: it gets disabled)
+        """
+        secrets = cls.org_config_settings_model.objects.filter(
+            organization=instance
+        ).values_list('shared_secret', flat=True)
+        cls.invalidate_shared_secret_cache(*secrets)
+
+    @cached_property
+    def organization(self):
+        return (
+            self.org_config_settings_model.objects.select_related('organization')
+            .get(organization_id=self.organization_id)
+            .organization
+        )
+
     def forbidden(self, request):
         """
         ensures request is authorized:
             - secret matches an organization's shared_secret
             - the organization has registration_enabled set to True
         """
-        try:
-            secret = request.POST.get('secret')
-            org_settings = self.org_config_settings_model.objects.select_related(
-                'organization'
-            ).get(shared_secret=secret, organization__is_active=True)
-        except self.org_config_settings_model.DoesNotExist:
+        secret = request.POST.get('secret')
+        record = self.get_shared_secret_record(secret)
+        if not record or not record[1]:
             return invalid_response(request, 'error: unrecognized secret', status=403)
-        if not org_settings.registration_enabled:
+        organization_id, is_active, registration_enabled = record
+        if not registration_enabled:
             return invalid_response(request, 'error: registration disabled', status=403)
-        # set an organization attribute as a side effect
-        # this attribute will be used in ``init_object``
-        self.organization = org_settings.organization
+        # set an organization_id attribute as a side effect
+        # this attribute will be used to load ``organization``
+        # (used in ``init_object``) only when needed
+        self.organization_id = organization_id
 
     def post(self, request, *args, **kwargs):
         """
@@ -364,6 +765,97 @@ class DeviceRegisterView(UpdateLastIpMixin, CsrfExtemptMixin, View):
         key = None
         if app_settings.CONSISTENT_REGISTRATION:
             key = request.POST.get('key')
+        if key and app_settings.REGISTRATION_COALESCING:
+            return self.coalesced_register(request, key)
+        return self.register(request, key)
+
+    # concurrent registrations of the same device are coalesced with a lock
+    # stored in the cache, the lock expires automatically in case the process
+    # holding it dies, waiting requests give up after a few seconds and ask
+    # the device to retry later, so that the workers are not kept busy
+    _REGISTRATION_LOCK_TIMEOUT = 30
+    _REGISTRATION_WAIT_TIMEOUT = 3
+    _REGISTRATION_RETRY_AFTER = 5
+    _REGISTRATION_POLL_INTERVAL = 0.05
+
+    @classmethod
+    def _get_registration_cache_keys(cls, key):
+        digest = hashlib.md5(str(key).encode()).hexdigest()
+        prefix = f'openwisp_controller.registration.{digest}'
+        return f'{prefix}.lock', f'{prefix}.result'
+
+    def _get_registration_fingerprint(self, request):
+        items = sorted(request.POST.items())
+        items.append(('REMOTE_ADDR', request.META.get('REMOTE_ADDR')))
+        return hashlib.md5(json.dumps(items).encode()).hexdigest()
+
+    def coalesced_register(self, request, key):
+        """
+        performs the registration while holding a lock on ``key``:
+        identical registrations received while the lock is held wait
+        for the ongoing one and return its response, registrations
+        with different parameters are performed one at a time;
+        requests which can't acquire the lock within
+        ``_REGISTRATION_WAIT_TIMEOUT`` seconds get a ``503`` response
+        """
+        lock_key, result_key = self._get_registration_cache_keys(key)
+        fingerprint = self._get_registration_fingerprint(request)
+        token = uuid.uuid4().hex
+        timeout = self._REGISTRATION_LOCK_TIMEOUT
+        deadline = time.monotonic() + self._REGISTRATION_WAIT_TIMEOUT
+        # token of the lock held by the registration we're waiting for
+        awaited = None
+        while True:
+            if awaited:
+                response = self._get_coalesced_response(
+                    result_key, awaited, fingerprint
+                )
+                if response:
+                    return response
+            if cache.add(lock_key, token, timeout):
+                break
+            awaited = cache.get(lock_key) or awaited
+            if time.monotonic() > deadline:
+                logger.warning(f'Timed out waiting for the registration lock of {key}')
+                response = ControllerResponse(
+                    'error: registration in progress, retry later',
+                    content_type='text/plain',
+                    status=503,
+                )
+                response['Retry-After'] = self._REGISTRATION_RETRY_AFTER
+                return response
+            time.sleep(self._REGISTRATION_POLL_INTERVAL)
+        try:
+            # the awaited registration may have completed right before
+            # the lock has been acquired
+            response = awaited and self._get_coalesced_response(
+                result_key, awaited, fingerprint
+            )
+            if response:
+                return response
+            response = self.register(request, key)
+            if response.status_code == 201:
+                cache.set(
+                    result_key,
+                    (token, fingerprint, response.content.decode()),
+                    timeout,
+                )
+            return response
+        finally:
+            # the lock may have expired and may have been acquired by another request
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    def _get_coalesced_response(self, result_key, token, fingerprint):
+        result = cache.get(result_key)
+        if not result or result[0] != token or result[1] != fingerprint:
+            return None
+        return ControllerResponse(result[2], content_type='text/plain', status=201)
+
+    def register(self, request, key):
+        """
+        registers the device (creating it if necessary) and returns the response
+        """
         # try retrieving existing Device first
         # (key is not None only if CONSISTENT_REGISTRATION is enabled)
         new = False
@@ -450,7 +942,9 @@ class VpnChecksumView(GetVpnView):
         bad_request = forbid_unallowed(request, 'GET', 'key', vpn.key)
         if bad_request:
             return bad_request
-        checksum_requested.send(sender=vpn.__class__, instance=vpn, request=request)
+        send_controller_signal(
+            checksum_requested, sender=vpn.__class__, instance=vpn, request=request
+        )
         return ControllerResponse(vpn.checksum, content_type='text/plain')
 
 
@@ -464,13 +958,17 @@ class VpnDownloadConfigView(GetVpnView):
         bad_request = forbid_unallowed(request, 'GET', 'key', vpn.key)
         if bad_request:
             return bad_request
-        config_download_requested.send(
-            sender=vpn.__class__, instance=vpn, request=request
+        send_controller_signal(
+            config_download_requested,
+            sender=vpn.__class__,
+            instance=vpn,
+            request=request,
         )
         return send_vpn_config(vpn, request)
 
 
 device_checksum = DeviceChecksumView.as_view()
+device_checksum_bulk = DeviceChecksumBulkView.as_view()
 device_download_config = DeviceDownloadConfigView.as_view()
 device_update_info = DeviceUpdateInfoView.as_view()
 device_report_status = DeviceReportStatusView.as_view()
@@ -0,0 +1,276 @@
+import logging
+import queue
+import threading
+import time
+import weakref
+from collections import defaultdict
+
+from django.apps import apps
+from django.db import close_old_connections
+from django.http import HttpRequest, QueryDict
+
+from . import settings as app_settings
+from . import signals
+from .tasks import dispatch_controller_signals
+
+logger = logging.getLogger(__name__)
+
+# signals sent by the controller views which
+# can be dispatched asynchronously
+ASYNC_SIGNALS = {
+    signals.checksum_requested: 'checksum_requested',
+    signals.config_download_requested: 'config_download_requested',
+}
+# request headers passed to the receivers when the
+# signals are dispatched by the celery workers
+REQUEST_META = (
+    'REMOTE_ADDR',
+    'REMOTE_HOST',
+    'HTTP_HOST',
+    'HTTP_USER_AGENT',
+    'HTTP_X_FORWARDED_FOR',
+    'SERVER_NAME',
+    'SERVER_PORT',
+    'QUERY_STRING',
+)
+
+_timings = defaultdict(lambda: {'calls': 0, 'total': 0.0, 'max': 0.0})
+_timings_lock = threading.Lock()
+
+
+def get_receiver_name(receiver):
+    module = getattr(receiver, '__module__', None)
+    name = getattr(receiver, '__qualname__', None) or repr(receiver)
+    return f'{module}.{name}' if module else name
+
+
+def get_receiver_timings():
+    """
+    returns the timings of the receivers of the signals
+    dispatched by this process, eg:
+    ``{"<receiver>": {"calls": 10, "total": 0.1, "max": 0.02}}``
+    """
+    with _timings_lock:
+        return {name: dict(timing) for name, timing in _timings.items()}
+
+
+def reset_receiver_timings():
+    with _timings_lock:
+        _timings.clear()
+
+
+def _record_timing(signal, receiver, elapsed):
+    name = get_receiver_name(receiver)
+    with _timings_lock:
+        timing = _timings[name]
+        timing['calls'] += 1
+        timing['total'] += elapsed
+        timing['max'] = max(timing['max'], elapsed)
+    threshold = app_settings.SIGNAL_RECEIVER_SLOW_THRESHOLD
+    if threshold is not None and elapsed > threshold:
+        logger.warning(
+            f'receiver {name} of signal {ASYNC_SIGNALS.get(signal, signal)} '
+            f'took {elapsed:.3f} seconds'
+        )
+
+
+def get_receivers(signal, sender):
+    """
+    returns the live receivers of ``signal`` which are
+    connected to ``sender`` or to any sender (like
+    ``Signal.send``, which doesn't expose them)
+    """
+    receivers = []
+    for (_, sender_id), receiver in (entry[:2] for entry in signal.receivers):
+        if sender_id not in (id(None), id(sender)):
+            continue
+        # weak references (the default) of receivers which have
+        # been garbage collected are removed by the signal lazily
+        if isinstance(receiver, weakref.ReferenceType):
+            receiver = receiver()
+            if receiver is None:
+                continue
+        receivers.append(receiver)
+    return receivers
+
+
+def dispatch(signal, sender, **kwargs):
+    """
+    like ``Signal.send`` but records the
+    execution time of each receiver
+    """
+    if not signal.has_listeners(sender):
+        return []
+    responses = []
+    for receiver in get_receivers(signal, sender):
+        start = time.perf_counter()
+        try:
+            response = receiver(signal=signal, sender=sender, **kwargs)
+        finally:
+            _record_timing(signal, receiver, time.perf_counter() - start)
+        responses.append((receiver, response))
+    return responses
+
+
+def send_controller_signal(signal, sender, instance, request):
+    """
+    sends one of the ``ASYNC_SIGNALS`` according to
+    ``OPENWISP_CONTROLLER_ASYNC_SIGNALS``: synchronously
+    or through the background dispatcher
+    """
+    if app_settings.ASYNC_SIGNALS is None:
+        return dispatch(signal, sender, instance=instance, request=request)
+    if not signal.has_listeners(sender):
+        return
+    # the request object is bound to the thread which handles it,
+    # only the data needed by the receivers is queued
+    dispatcher.put((signal, sender, instance, serialize_request(request)))
+
+
+def serialize_request(request):
+    """
+    extracts from ``request`` the data passed to the receivers
+    of the signals dispatched asynchronously: the method, the
+    path, the query string (without the ``key`` parameter)
+    and the headers listed in ``REQUEST_META``
+    """
+    query = request.GET.copy()
+    query.pop('key', None)
+    return {
+        'method': request.method,
+        'path': request.path,
+        'GET': query.urlencode(),
+        'META': {key: request.META[key] for key in REQUEST_META if key in request.META},
+    }
+
+
+def serialize_event(event):
+    """
+    converts an event in a format which can be passed to celery
+    """
+    signal, sender, instance, request_data = event
+    return {
+        'signal': ASYNC_SIGNALS[signal],
+        'sender': sender._meta.label_lower,
+        'instance': str(instance.pk),
+        'request': request_data,
+    }
+
+
+def _deserialize_request(data):
+    request = HttpRequest()
+    request.method = data['method']
+    request.path = data['path']
+    request.GET = QueryDict(data['GET'])
+    request.META.update(data['META'])
+    return request
+
+
+def dispatch_serialized(events):
+    """
+    dispatches events serialized with ``serialize_event``,
+    instances are retrieved with one query per model
+    """
+    pks = defaultdict(set)
+    for event in events:
+        pks[event['sender']].add(event['instance'])
+    instances = {}
+    for label, model_pks in pks.items():
+        model = apps.get_model(label)
+        for pk, instance in model.objects.in_bulk(list(model_pks)).items():
+            instances[(label, str(pk))] = instance
+    for event in events:
+        instance = instances.get((event['sender'], event['instance']))
+        if instance is None:
+            continue
+        _dispatch_safely(
+            (
+                getattr(signals, event['signal']),
+                instance.__class__,
+                instance,
+                event['request'],
+            )
+        )
+
+
+def _dispatch_safely(event):
+    signal, sender, instance, request_data = event
+    request = _deserialize_request(request_data)
+    try:
+        dispatch(signal, sender, instance=instance, request=request)
+    except Exception:
+        logger.exception(
+            f'error while dispatching {ASYNC_SIGNALS[signal]} for {instance}'
+        )
+
+
+class SignalDispatcher(object):
+    """
+    collects the signals sent by the controller views
+    and dispatches them in batches from a background
+    thread, either in process or through celery
+    """
+
+    batch_size = 100
+    max_queue_size = 10000
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=self.max_queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, event):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            logger.warning(
+                f'signal dispatcher queue is full, {ASYNC_SIGNALS[event[0]]} dropped'
+            )
+
+    def flush(self):
+        """
+        blocks until the queued events have been processed
+        """
+        self.queue.join()
+
+    def _ensure_started(self):
+        # the thread is started again in forked processes
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='openwisp-controller-signals', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            events = [self.queue.get()]
+            while len(events) < self.batch_size:
+                try:
+                    events.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.process(events)
+            except Exception:
+                logger.exception('error while processing controller signals')
+            finally:
+                close_old_connections()
+                for event in events:
+                    self.queue.task_done()
+
+    def process(self, events):
+        if app_settings.ASYNC_SIGNALS == 'celery':
+            dispatch_controller_signals.delay(
+                [serialize_event(event) for event in events]
+            )
+            return
+        for event in events:
+            _dispatch_safely(event)
+
+
+dispatcher = SignalDispatcher()
@@ -0,0 +1,7 @@
+class ChecksumNotReady(Exception):
+    """
+    raised when the checksum of a configuration has not been
+    calculated yet (it's calculated in the background)
+    """
+
+    pass
@@ -0,0 +1,276 @@
+import logging
+from collections import defaultdict
+
+from django.core.exceptions import (
+    NON_FIELD_ERRORS,
+    FieldDoesNotExist,
+    ObjectDoesNotExist,
+    ValidationError,
+)
+from django.db import transaction
+from django.utils.translation import ugettext_lazy as _
+from swapper import load_model
+
+from openwisp_utils.base import KeyField
+
+from . import settings as app_settings
+from .signals import devices_imported
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceImporter(object):
+    """
+    creates devices and their configurations in bulk
+    (see ``import_devices``)
+    """
+
+    def __init__(self, organization, backend=None, templates=None, batch_size=None):
+        self.device_model = load_model('config', 'Device')
+        self.config_model = load_model('config', 'Config')
+        self.organization = organization
+        self.backend = backend or app_settings.DEFAULT_BACKEND
+        self.batch_size = batch_size or app_settings.DEVICE_IMPORT_BATCH_SIZE
+        self.templates = self.get_templates(templates or [])
+        # all the configurations share the same backend and templates,
+        # hence the whole model validation is performed on the first
+        # one, the others are validated against the backend schema only
+        self._config_validated = False
+
+    def get_templates(self, templates):
+        """
+        returns the templates assigned to each device:
+        default (and required) templates followed by ``templates``
+        """
+        config = self.config_model(
+            backend=self.backend,
+            device=self.device_model(organization=self.organization),
+        )
+        result = list(config.get_default_templates())
+        for template in templates:
+            if template not in result:
+                result.append(template)
+        invalids = [
+            template.name
+            for template in result
+            if template.organization_id not in [None, self.organization.pk]
+        ]
+        if invalids:
+            raise ValidationError(
+                _(
+                    'The following templates are owned by organizations '
+                    'which do not match the organization of this '
+                    'configuration: {0}'
+                ).format(', '.join(invalids))
+            )
+        invalids = [
+            template.name for template in result if template.backend != self.backend
+        ]
+        if invalids:
+            raise ValidationError(
+                _(
+                    'The following templates use a backend which does '
+                    'not match the backend of this configuration: {0}'
+                ).format(', '.join(invalids))
+            )
+        return result
+
+    def _get_unique_fields(self):
+        fields = ['name', 'mac_address']
+        if app_settings.HARDWARE_ID_ENABLED:
+            fields.append('hardware_id')
+        return fields
+
+    def _get_shared_secret(self):
+        try:
+            return self.organization.config_settings.shared_secret
+        except ObjectDoesNotExist:
+            return None
+
+    def build_device(self, row, shared_secret):
+        """
+        returns a validated ``Device`` instance (and
+        related ``Config`` instance) from ``row``
+        """
+        options = dict(row)
+        config_options = {
+            'backend': self.backend,
+            'config': options.pop('config', None) or {},
+            'context': options.pop('context', None) or {},
+        }
+        for attr in options.keys():
+            try:
+                self.device_model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                raise ValidationError({attr: _('unknown field')})
+        if not options.get('hardware_id'):
+            options['hardware_id'] = None
+        device = self.device_model(organization=self.organization, **options)
+        # uniqueness is checked in bulk in ``_validate_unique``
+        device.full_clean(exclude=['organization'], validate_unique=False)
+        if not device.key:
+            if shared_secret:
+                device.key = device.generate_key(shared_secret)
+            else:
+                device.key = KeyField.default_callable()
+        config = self.config_model(device=device, **config_options)
+        config.clean_fields(exclude=['device'])
+        if not isinstance(config.context, dict):
+            raise ValidationError(
+                {'context': _('the supplied value is not a JSON object')}
+            )
+        # templates can't be assigned to unsaved configurations,
+        # the backend instance validated by ``clean`` includes them
+        config.backend_instance = config.get_backend_instance(
+            template_instances=self.templates
+        )
+        try:
+            if not self._config_validated:
+                config.clean()
+                self._config_validated = True
+            else:
+                config.clean_netjsonconfig_backend(config.backend_instance)
+        except ValidationError as e:
+            if not hasattr(e, 'error_dict'):
+                e = ValidationError({'config': e.messages})
+            raise e
+        return device
+
+    def _validate_unique(self, devices, seen, errors):
+        """
+        checks the uniqueness of ``devices`` among each other
+        and against the database with one query per field
+        """
+        unique_fields = self._get_unique_fields()
+        for field in unique_fields + ['key']:
+            values = [getattr(device, field) for index, device in devices]
+            queryset = self.device_model.objects.filter(
+                **{f'{field}__in': [value for value in values if value]}
+            )
+            if field != 'key':
+                queryset = queryset.filter(organization=self.organization)
+            existing = set(queryset.values_list(field, flat=True))
+            unique_check = (field,) if field == 'key' else (field, 'organization')
+            for index, device in devices:
+                value = getattr(device, field)
+                if not value:
+                    continue
+                if value in existing or value in seen[field]:
+                    error = device.unique_error_message(self.device_model, unique_check)
+                    errors[index].extend(error.messages)
+                seen[field].add(value)
+
+    def _get_messages(self, error):
+        messages = []
+        for field, field_messages in error.message_dict.items():
+            if field != NON_FIELD_ERRORS:
+                field_messages = [f'{field}: {m}' for m in field_messages]
+            messages.extend(field_messages)
+        return messages
+
+    def validate(self, rows):
+        """
+        validates ``rows`` in batches and returns the list
+        of devices which would be created, raises ``ValidationError``
+        containing the error messages of each invalid row (by index)
+        """
+        devices = []
+        errors = defaultdict(list)
+        seen = defaultdict(set)
+        shared_secret = self._get_shared_secret()
+        for start in range(0, len(rows), self.batch_size):
+            end = start + self.batch_size
+            batch = []
+            for index, row in enumerate(rows[start:end], start):
+                try:
+                    batch.append((index, self.build_device(row, shared_secret)))
+                except ValidationError as e:
+                    errors[index] = self._get_messages(e)
+            self._validate_unique(batch, seen, errors)
+            devices.extend(device for index, device in batch)
+        if errors:
+            raise ValidationError(dict(errors))
+        return devices
+
+    def _create_batch(self, devices):
+        configs = [device.config for device in devices]
+        self.device_model.objects.bulk_create(devices)
+        self.config_model.objects.bulk_create(configs)
+        # templates (the sort value is the position of the template)
+        through_model = self.config_model.templates.through
+        sort_field_name = through_model._sort_field_name
+        through_model.objects.bulk_create(
+            [
+                through_model(
+                    config_id=config.pk,
+                    template_id=template.pk,
+                    **{sort_field_name: position},
+                )
+                for config in configs
+                for position, template in enumerate(self.templates, 1)
+            ]
+        )
+        # vpn clients (certificates are generated one by one,
+        # or in the background if VPN_CLIENT_CERT_ASYNC is enabled)
+        vpn_client_model = self.config_model.vpn.through
+        clients = []
+        for template in self.templates:
+            if template.type != 'vpn':
+                continue
+            for config in configs:
+                client = vpn_client_model(
+                    config=config, vpn=template.vpn, auto_cert=template.auto_cert
+                )
+                if client.auto_cert and not app_settings.VPN_CLIENT_CERT_ASYNC:
+                    client._auto_create_cert(
+                        name=config.device.name, common_name=client._get_common_name(),
+                    )
+                clients.append(client)
+        vpn_client_model.objects.bulk_create(clients)
+        if clients and app_settings.VPN_CLIENT_CERT_ASYNC:
+            # primary keys are not set by bulk_create on every database
+            pks = vpn_client_model.objects.filter(
+                config__in=configs, auto_cert=True, cert=None
+            ).values_list('pk', flat=True)
+            vpn_client_model._schedule_cert_creation(list(pks))
+
+    def create(self, devices):
+        """
+        creates ``devices`` (previously validated with ``validate``)
+        and their configurations, templates and VPN clients in bulk
+        """
+        with transaction.atomic():
+            for start in range(0, len(devices), self.batch_size):
+                end = start + self.batch_size
+                self._create_batch(devices[start:end])
+            devices_imported.send(
+                sender=self.device_model,
+                instances=devices,
+                organization=self.organization,
+            )
+            config_pks = [device.config.pk for device in devices]
+            transaction.on_commit(
+                lambda: self.config_model._schedule_checksums_update(config_pks)
+            )
+        logger.info(f'imported {len(devices)} devices in {self.organization}')
+        return devices
+
+
+def import_devices(organization, rows, backend=None, templates=None, batch_size=None):
+    """
+    creates devices of ``organization`` in bulk, ``rows`` is a list of
+    dictionaries containing the fields of each device (eg: ``name``,
+    ``mac_address``) and optionally its ``config`` and ``context``;
+    default and required templates are assigned automatically,
+    ``templates`` are assigned to each device after those;
+    all the rows are validated before creating any device, if any
+    row is invalid ``ValidationError`` is raised;
+    returns the list of created devices
+    """
+    importer = DeviceImporter(
+        organization, backend=backend, templates=templates, batch_size=batch_size
+    )
+    devices = importer.validate(list(rows))
+    if not devices:
+        return devices
+    return importer.create(devices)
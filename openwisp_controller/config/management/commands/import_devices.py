@@ -0,0 +1,81 @@
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from swapper import load_model
+
+from ...importer import import_devices
+
+Organization = load_model('openwisp_users', 'Organization')
+Template = load_model('config', 'Template')
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates devices in bulk from a CSV file, the header of the file '
+        'must contain the device fields (eg: name, mac_address), the '
+        'columns "config" and "context" may contain JSON objects'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='path of the CSV file')
+        parser.add_argument(
+            '--organization', required=True, help='slug of the organization'
+        )
+        parser.add_argument('--backend', help='configuration backend')
+        parser.add_argument(
+            '--template',
+            action='append',
+            default=[],
+            dest='templates',
+            help='name of a template assigned to each device (can be repeated)',
+        )
+        parser.add_argument('--batch-size', type=int, help='devices per batch')
+
+    def handle(self, *args, **options):
+        try:
+            organization = Organization.objects.get(slug=options['organization'])
+        except Organization.DoesNotExist:
+            raise CommandError(f'organization "{options["organization"]}" not found')
+        templates = []
+        for name in options['templates']:
+            # templates of the organization take precedence over shared ones
+            template = (
+                Template.objects.filter(name=name, organization=organization).first()
+                or Template.objects.filter(name=name, organization=None).first()
+            )
+            if template is None:
+                raise CommandError(f'template "{name}" not found')
+            templates.append(template)
+        rows = self._read_rows(options['file'])
+        try:
+            devices = import_devices(
+                organization,
+                rows,
+                backend=options['backend'],
+                templates=templates,
+                batch_size=options['batch_size'],
+            )
+        except ValidationError as e:
+            if not hasattr(e, 'error_dict'):
+                raise CommandError('; '.join(e.messages))
+            for index, errors in sorted(e.message_dict.items()):
+                # the header is the first line of the file
+                self.stderr.write(f'line {index + 2}: {"; ".join(errors)}')
+            raise CommandError('no device was imported')
+        self.stdout.write(f'{len(devices)} devices imported')
+
+    def _read_rows(self, path):
+        rows = []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                row = {key: value for key, value in row.items() if value != ''}
+                for key in ['config', 'context']:
+                    if key in row:
+                        try:
+                            row[key] = json.loads(row[key])
+                        except ValueError:
+                            raise CommandError(f'invalid JSON in column "{key}"')
+                rows.append(row)
+        return rows
@@ -1,4 +1,6 @@
 import logging
+import os
+import tempfile
 
 from django.conf import settings
 from django.utils.translation import ugettext_lazy as _
@@ -41,12 +43,53 @@ DEFAULT_VPN_BACKEND = get_settings_value('DEFAULT_VPN_BACKEND', VPN_BACKENDS[0][
 REGISTRATION_ENABLED = get_settings_value('REGISTRATION_ENABLED', True)
 CONSISTENT_REGISTRATION = get_settings_value('CONSISTENT_REGISTRATION', True)
 REGISTRATION_SELF_CREATION = get_settings_value('REGISTRATION_SELF_CREATION', True)
+REGISTRATION_COALESCING = get_settings_value('REGISTRATION_COALESCING', False)
+CHECKSUM_FAST_PATH = get_settings_value('CHECKSUM_FAST_PATH', False)
+BULK_CHECKSUM_MAX_DEVICES = get_settings_value('BULK_CHECKSUM_MAX_DEVICES', 1000)
+TEMPLATE_FANOUT_CHUNK_SIZE = get_settings_value('TEMPLATE_FANOUT_CHUNK_SIZE', 1000)
+CHECKSUM_PRECOMPUTE_CHUNK_SIZE = get_settings_value(
+    'CHECKSUM_PRECOMPUTE_CHUNK_SIZE', 100
+)
+DEVICE_IMPORT_BATCH_SIZE = get_settings_value('DEVICE_IMPORT_BATCH_SIZE', 500)
+ASYNC_SIGNALS = get_settings_value('ASYNC_SIGNALS', None)
+assert ASYNC_SIGNALS in [
+    None,
+    'thread',
+    'celery',
+], 'OPENWISP_CONTROLLER_ASYNC_SIGNALS must be one of None, "thread" or "celery"'
+SIGNAL_RECEIVER_SLOW_THRESHOLD = get_settings_value(
+    'SIGNAL_RECEIVER_SLOW_THRESHOLD', 0.5
+)
+IP_UPDATE_BUFFER = get_settings_value('IP_UPDATE_BUFFER', False)
+IP_UPDATE_BUFFER_MAX_STALENESS = get_settings_value(
+    'IP_UPDATE_BUFFER_MAX_STALENESS', 60
+)
+ARCHIVE_STORE = get_settings_value('ARCHIVE_STORE', None)
+assert ARCHIVE_STORE in [
+    None,
+    'cache',
+    'filesystem',
+], 'OPENWISP_CONTROLLER_ARCHIVE_STORE must be one of None, "cache" or "filesystem"'
+ARCHIVE_STORE_DIR = get_settings_value(
+    'ARCHIVE_STORE_DIR',
+    os.path.join(tempfile.gettempdir(), 'openwisp-controller-archives'),
+)
+ARCHIVE_STORE_MAX_SIZE = get_settings_value('ARCHIVE_STORE_MAX_SIZE', 100 * 1024 * 1024)
+ARCHIVE_STORE_CACHE = get_settings_value(
+    'ARCHIVE_STORE_CACHE', 'openwisp_controller_archives'
+)
 
 CONTEXT = get_settings_value('CONTEXT', {})
 assert isinstance(CONTEXT, dict), 'OPENWISP_CONTROLLER_CONTEXT must be a dictionary'
 DEFAULT_AUTO_CERT = get_settings_value('DEFAULT_AUTO_CERT', True)
 CERT_PATH = get_settings_value('CERT_PATH', '/etc/x509')
 COMMON_NAME_FORMAT = get_settings_value('COMMON_NAME_FORMAT', '{mac_address}-{name}')
+VPN_CLIENT_CERT_ASYNC = get_settings_value('VPN_CLIENT_CERT_ASYNC', False)
+VPN_DH_GROUP = get_settings_value('VPN_DH_GROUP', None)
+assert VPN_DH_GROUP in [None, 'ffdhe2048', 'ffdhe3072', 'ffdhe4096'], (
+    'OPENWISP_CONTROLLER_VPN_DH_GROUP must be one of '
+    'None, "ffdhe2048", "ffdhe3072" or "ffdhe4096"'
+)
 MANAGEMENT_IP_DEVICE_LIST = get_settings_value('MANAGEMENT_IP_DEVICE_LIST', True)
 CONFIG_BACKEND_FIELD_SHOWN = get_settings_value('CONFIG_BACKEND_FIELD_SHOWN', True)
 
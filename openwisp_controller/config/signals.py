@@ -7,7 +7,11 @@ config_status_changed = Signal(providing_args=['instance'])
 config_modified = Signal(
     providing_args=['instance', 'device', 'config', 'previous_status', 'action']
 )
+# sent once per chunk of configs by the fan-out of template changes
+config_modified_bulk = Signal(providing_args=['instances', 'action'])
 device_registered = Signal(providing_args=['instance', 'is_new'])
+# sent once by the bulk import of devices
+devices_imported = Signal(providing_args=['instances', 'organization'])
 management_ip_changed = Signal(
     providing_args=['instance', 'management_ip', 'old_management_ip']
 )
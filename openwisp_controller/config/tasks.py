@@ -1,7 +1,9 @@
 import logging
+import time
 
 from celery import shared_task
 from celery.exceptions import SoftTimeLimitExceeded
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from swapper import load_model
 
@@ -23,9 +25,19 @@ def update_template_related_config_status(template_pk):
             f'update_template_related_config_status("{template_pk}") failed: {e}'
         )
         return
+    cursor = template._get_related_config_status_cursor()
     try:
         template._update_related_config_status()
     except SoftTimeLimitExceeded:
+        # resume from the last processed chunk if any progress has been made
+        if template._get_related_config_status_cursor() != cursor:
+            logger.info(
+                'soft time limit hit while executing '
+                f'_update_related_config_status for {template} '
+                f'(ID: {template_pk}), resuming in a new task'
+            )
+            update_template_related_config_status.delay(template_pk)
+            return
         logger.error(
             'soft time limit hit while executing '
             f'_update_related_config_status for {template} '
@@ -33,6 +45,62 @@ def update_template_related_config_status(template_pk):
         )
 
 
+def get_checksum_task_cache_key(config_pk):
+    """
+    key of the lock which avoids scheduling ``update_config_checksum``
+    many times from the request path (see ``get_cached_checksum``)
+    """
+    return f'openwisp_controller.config.checksum_task.{config_pk}'
+
+
+@shared_task(soft_time_limit=1200)
+def update_config_checksum(config_pk):
+    """
+    Calculates the checksum of the specified config
+    and stores it in the database and in the cache
+    """
+    Config = load_model('config', 'Config')
+    try:
+        config = Config.objects.select_related('device').get(pk=config_pk)
+    except ObjectDoesNotExist as e:
+        logger.warning(f'update_config_checksum("{config_pk}") failed: {e}')
+        return
+    try:
+        config.update_checksum_db()
+    except SoftTimeLimitExceeded:
+        logger.error(
+            'soft time limit hit while calculating the '
+            f'checksum of {config} (ID: {config_pk})'
+        )
+    finally:
+        cache.delete(get_checksum_task_cache_key(config.pk))
+
+
+@shared_task(soft_time_limit=1200)
+def update_config_checksums(config_pks):
+    """
+    Calculates and stores the checksums of the specified configs,
+    used after the checksums have been invalidated in bulk;
+    checksums which have already been recalculated are skipped
+    """
+    Config = load_model('config', 'Config')
+    # VPN clients are prefetched for the whole chunk
+    # (iterator() would ignore prefetch_related)
+    queryset = (
+        Config.objects.filter(pk__in=config_pks, checksum_db__isnull=True)
+        .select_related('device')
+        .prefetch_related('vpnclient_set__vpn__ca', 'vpnclient_set__cert')
+    )
+    try:
+        for config in queryset:
+            config.update_checksum_db()
+    except SoftTimeLimitExceeded:
+        logger.error(
+            'soft time limit hit while calculating '
+            f'the checksums of {len(config_pks)} configs'
+        )
+
+
 @shared_task(soft_time_limit=1200)
 def create_vpn_dh(vpn_pk):
     """
@@ -40,6 +108,7 @@ def create_vpn_dh(vpn_pk):
     """
     Vpn = load_model('config', 'Vpn')
     vpn = Vpn.objects.get(pk=vpn_pk)
+    start = time.monotonic()
     try:
         vpn.dh = Vpn.dhparam(2048)
     except SoftTimeLimitExceeded:
@@ -48,5 +117,74 @@ def create_vpn_dh(vpn_pk):
             f'parameters for VPN Server {vpn} (ID: {vpn_pk})'
         )
     else:
+        elapsed = time.monotonic() - start
+        logger.info(
+            f'DH parameters for VPN Server {vpn} (ID: {vpn_pk}) '
+            f'generated in {elapsed:.2f} seconds'
+        )
         vpn.full_clean()
         vpn.save()
+        return elapsed
+
+
+@shared_task(soft_time_limit=1200)
+def create_vpn_client_cert(vpnclient_pk):
+    """
+    Issues the x509 certificate of a VPN client
+    (see ``OPENWISP_CONTROLLER_VPN_CLIENT_CERT_ASYNC``)
+    """
+    VpnClient = load_model('config', 'VpnClient')
+    try:
+        client = VpnClient.objects.select_related('config__device', 'vpn__ca').get(
+            pk=vpnclient_pk
+        )
+    except ObjectDoesNotExist as e:
+        logger.warning(f'create_vpn_client_cert("{vpnclient_pk}") failed: {e}')
+        return
+    if client.cert_id:
+        return
+    try:
+        client.issue_cert()
+    except SoftTimeLimitExceeded:
+        logger.error(
+            'soft time limit hit while issuing the certificate '
+            f'of VPN client {vpnclient_pk} of {client.config}'
+        )
+
+
+@shared_task(soft_time_limit=1200)
+def flush_ip_updates():
+    """
+    Writes the buffered ``last_ip`` and ``management_ip``
+    updates to the database, can be scheduled periodically
+    with celery beat (see ``OPENWISP_CONTROLLER_IP_UPDATE_BUFFER``)
+    """
+    from . import settings as app_settings
+    from .utils import flush_ip_update_buffer
+
+    try:
+        result = flush_ip_update_buffer()
+    except SoftTimeLimitExceeded:
+        logger.error('soft time limit hit while flushing the ip update buffer')
+        return
+    # another flush is in progress, try again later
+    # to avoid leaving updates in the buffer too long
+    if result is None:
+        flush_ip_updates.apply_async(
+            countdown=app_settings.IP_UPDATE_BUFFER_MAX_STALENESS
+        )
+
+
+@shared_task(soft_time_limit=1200)
+def dispatch_controller_signals(events):
+    """
+    Dispatches the signals of the controller views
+    queued when ``OPENWISP_CONTROLLER_ASYNC_SIGNALS``
+    is set to ``"celery"``
+    """
+    from .dispatcher import dispatch_serialized
+
+    try:
+        dispatch_serialized(events)
+    except SoftTimeLimitExceeded:
+        logger.error('soft time limit hit while dispatching controller signals')
@@ -1,6 +1,10 @@
+import os
+from collections import OrderedDict
 from copy import deepcopy
+from tempfile import TemporaryDirectory
 from unittest.mock import patch
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db.transaction import atomic
 from django.test import TestCase
@@ -11,8 +15,12 @@ from openwisp_users.tests.utils import TestOrganizationMixin
 from openwisp_utils.tests import catch_signal
 
 from .. import settings as app_settings
+from ..archive_store import CacheArchiveStore, FileSystemArchiveStore, get_archive_store
 from ..base.config import logger as config_model_logger
+from ..exceptions import ChecksumNotReady
 from ..signals import config_modified, config_status_changed
+from ..tasks import get_checksum_task_cache_key
+from ..utils import BackendValidator, get_backend_validator, sanitize_config
 from .utils import CreateConfigTemplateMixin, TestVpnX509Mixin
 
 Config = load_model('config', 'Config')
@@ -135,7 +143,7 @@ class TestConfig(
             with patch('django.core.cache.cache.set') as mocked_set:
                 checksum = c.get_cached_checksum()
                 self.assertEqual(len(checksum), 32)
-                mocked_set.assert_called_once()
+                mocked_set.assert_called()
 
         with self.subTest('check cache get'):
             with patch(
@@ -147,6 +155,7 @@ class TestConfig(
         with self.subTest('ensure fresh checksum is calculated when cache is clear'):
             with patch.object(config_model_logger, 'debug') as mocked_debug:
                 c.get_cached_checksum.invalidate(c)
+                Config.objects.filter(pk=c.pk).update(checksum_db=None)
                 self.assertEqual(len(c.get_cached_checksum()), 32)
                 mocked_debug.assert_called_once()
 
@@ -178,6 +187,283 @@ class TestConfig(
                 self.assertEqual(c.get_cached_checksum(), c.checksum)
                 mocked_debug.assert_called_once()
 
+    def test_update_checksum_db(self):
+        c = self._create_config(organization=self._get_org())
+        self.assertIsNone(c.checksum_db)
+        self.assertIsNone(c.checksum_updated)
+        checksum = c.update_checksum_db()
+        self.assertEqual(checksum, c.checksum)
+        c.refresh_from_db()
+        self.assertEqual(c.checksum_db, checksum)
+        self.assertIsNotNone(c.checksum_updated)
+
+        with self.subTest('stored checksum is used when cache is clear'):
+            c.get_cached_checksum.invalidate(c)
+            with patch.object(config_model_logger, 'debug') as mocked_debug:
+                with patch.object(Config, 'generate') as mocked_generate:
+                    with self.assertNumQueries(1):
+                        self.assertEqual(c.get_cached_checksum(), checksum)
+                    mocked_generate.assert_not_called()
+                mocked_debug.assert_not_called()
+
+        with self.subTest('stored checksum is invalidated when config changes'):
+            c.config['general']['timezone'] = 'Europe/Rome'
+            c.full_clean()
+            c.save()
+            c.refresh_from_db()
+            self.assertIsNone(c.checksum_db)
+            del c.backend_instance
+            with patch.object(config_model_logger, 'debug') as mocked_debug:
+                self.assertEqual(c.get_cached_checksum(), c.checksum)
+                mocked_debug.assert_called_once()
+
+        task_path = 'openwisp_controller.config.base.config.update_config_checksum'
+
+        with self.subTest('missing checksum is not calculated on the request path'):
+            c.invalidate_checksum_db()
+            c.get_cached_checksum.invalidate(c)
+            with patch(f'{task_path}.delay') as mocked_delay:
+                with patch.object(Config, 'generate') as mocked_generate:
+                    with self.assertRaises(ChecksumNotReady):
+                        c.get_cached_checksum()
+                    # the calculation is scheduled only once
+                    with self.assertRaises(ChecksumNotReady):
+                        c.get_cached_checksum()
+                    mocked_generate.assert_not_called()
+                mocked_delay.assert_called_once_with(c.pk)
+            cache.delete(get_checksum_task_cache_key(c.pk))
+
+        with self.subTest('stale checksum is discarded'):
+            stale = Config.objects.get(pk=c.pk)
+            stale.config['general']['timezone'] = 'Europe/Berlin'
+            # the configuration is changed while the checksum is calculated
+            c.invalidate_checksum_db()
+            self.assertIsNone(stale.update_checksum_db())
+            stale.refresh_from_db()
+            self.assertIsNone(stale.checksum_db)
+            checksum = c.update_checksum_db()
+            self.assertIsNotNone(checksum)
+            self.assertEqual(Config.objects.get(pk=c.pk).checksum_db, checksum)
+
+    def test_schedule_checksum_db_update(self):
+        c = self._create_config(organization=self._get_org())
+        callbacks = []
+        task_path = 'openwisp_controller.config.base.config.update_config_checksum'
+        with patch(
+            'django.db.transaction.on_commit', side_effect=callbacks.append
+        ), patch(f'{task_path}.delay') as mocked_delay:
+            with self.subTest('one task per transaction'):
+                c.invalidate_checksum_db()
+                c.invalidate_checksum_db()
+                for callback in callbacks:
+                    callback()
+                mocked_delay.assert_called_once_with(c.pk)
+
+            with self.subTest('scheduled again after commit'):
+                callbacks.clear()
+                mocked_delay.reset_mock()
+                c.invalidate_checksum_db()
+                for callback in callbacks:
+                    callback()
+                mocked_delay.assert_called_once_with(c.pk)
+
+            with self.subTest('scheduled again after rollback'):
+                callbacks.clear()
+                mocked_delay.reset_mock()
+                c.invalidate_checksum_db()
+                # rollback: the callbacks are discarded
+                callbacks.clear()
+                c.invalidate_checksum_db()
+                for callback in callbacks:
+                    callback()
+                mocked_delay.assert_called_once_with(c.pk)
+
+    def test_archive_store_filesystem(self):
+        c = self._create_config(organization=self._get_org())
+        with TemporaryDirectory() as path:
+            with patch.object(
+                app_settings, 'ARCHIVE_STORE', 'filesystem'
+            ), patch.object(app_settings, 'ARCHIVE_STORE_DIR', path):
+                checksum = c.update_checksum_db()
+                archive_path = os.path.join(path, f'{checksum}.tar.gz')
+                self.assertTrue(os.path.exists(archive_path))
+                with patch.object(Config, 'generate') as mocked_generate:
+                    contents = c.get_archive()
+                    mocked_generate.assert_not_called()
+                self.assertEqual(contents, c.generate().getvalue())
+
+                with self.subTest('archive is generated if missing'):
+                    os.remove(archive_path)
+                    self.assertEqual(c.get_archive(), contents)
+                    self.assertTrue(os.path.exists(archive_path))
+
+    def test_archive_store_cache(self):
+        c = self._create_config(organization=self._get_org())
+        with patch.object(app_settings, 'ARCHIVE_STORE', 'cache'):
+            checksum = c.update_checksum_db()
+            contents = c.generate().getvalue()
+            store = CacheArchiveStore(
+                app_settings.ARCHIVE_STORE_CACHE, app_settings.ARCHIVE_STORE_MAX_SIZE
+            )
+            self.assertEqual(store.get(checksum), contents)
+            with patch.object(Config, 'generate') as mocked_generate:
+                self.assertEqual(c.get_archive(), contents)
+                mocked_generate.assert_not_called()
+
+    def test_archive_store_disabled(self):
+        c = self._create_config(organization=self._get_org())
+        self.assertIsNone(get_archive_store())
+        with patch.object(Config, 'get_cached_checksum') as mocked_checksum:
+            self.assertEqual(c.get_archive(), c.generate().getvalue())
+            mocked_checksum.assert_not_called()
+
+    def test_archive_store_filesystem_eviction(self):
+        with TemporaryDirectory() as path:
+            store = FileSystemArchiveStore(path, max_size=12)
+            store.set('a' * 32, b'12345')
+            store.set('b' * 32, b'12345')
+            # make sure modification times differ
+            os.utime(os.path.join(path, f'{"a" * 32}.tar.gz'), (1, 1))
+            os.utime(os.path.join(path, f'{"b" * 32}.tar.gz'), (2, 2))
+            # the first archive becomes the most recently used
+            self.assertEqual(store.get('a' * 32), b'12345')
+            store.set('c' * 32, b'12345')
+            self.assertIsNone(store.get('b' * 32))
+            self.assertEqual(store.get('a' * 32), b'12345')
+            self.assertEqual(store.get('c' * 32), b'12345')
+            self.assertEqual(len(os.listdir(path)), 2)
+
+    def test_archive_store_filesystem_scan(self):
+        with TemporaryDirectory() as path:
+            store = FileSystemArchiveStore(path, max_size=20)
+            with patch('os.scandir', wraps=os.scandir) as mocked_scandir:
+                for char in 'abcd':
+                    store.set(char * 32, b'12345')
+                # the directory is scanned only at the first write
+                self.assertEqual(mocked_scandir.call_count, 1)
+                store.set('e' * 32, b'12345')
+                # the size limit has been exceeded
+                self.assertEqual(mocked_scandir.call_count, 2)
+                self.assertEqual(len(os.listdir(path)), 3)
+                store.set('f' * 32, b'12345')
+                self.assertEqual(mocked_scandir.call_count, 2)
+                with patch.object(FileSystemArchiveStore, 'scan_interval', -1):
+                    store.set('g' * 32, b'12345')
+                self.assertEqual(mocked_scandir.call_count, 3)
+
+    def test_archive_store_cache_eviction(self):
+        store = CacheArchiveStore(app_settings.ARCHIVE_STORE_CACHE, max_size=10)
+        store.cache.clear()
+        store.set('a' * 32, b'12345')
+        store.set('b' * 32, b'12345')
+        store.set('c' * 32, b'12345')
+        self.assertIsNone(store.get('a' * 32))
+        self.assertEqual(store.get('b' * 32), b'12345')
+        self.assertEqual(store.get('c' * 32), b'12345')
+
+        with self.subTest('counters evicted from the cache'):
+            store.cache.delete_many([store._get_key('index'), store._get_key('size')])
+            store.set('d' * 32, b'12345')
+            store.set('e' * 32, b'12345')
+            store.set('f' * 32, b'12345')
+            self.assertIsNone(store.get('d' * 32))
+            self.assertEqual(store.get('e' * 32), b'12345')
+            self.assertEqual(store.get('f' * 32), b'12345')
+
+    def test_archive_store_default_cache_not_used(self):
+        c = self._create_config(organization=self._get_org())
+        with patch.object(app_settings, 'ARCHIVE_STORE', 'cache'):
+            checksum = c.update_checksum_db()
+        self.assertIsNone(cache.get(f'{CacheArchiveStore.prefix}.{checksum}'))
+
+    def test_templates_layer_cache(self):
+        org = self._get_org()
+        t1 = self._create_template(name='t1', organization=org)
+        t2 = self._create_template(
+            name='t2',
+            organization=org,
+            config={'interfaces': [{'name': 'eth1', 'type': 'ethernet'}]},
+            default_values={'ssid': 'test'},
+        )
+        c = self._create_config(organization=org)
+        c.templates.add(t1, t2)
+        expected = OpenWrt(
+            config=c.get_config(),
+            templates=[t1.config, t2.config],
+            context=dict(t2.get_context(), **c.get_context()),
+        ).config
+        templates = list(c.templates.all())
+        cache.delete(c._get_templates_layer_cache_key(templates))
+
+        with self.subTest('templates are merged on cache miss'):
+            with patch.object(
+                Config, '_merge_templates', wraps=c._merge_templates
+            ) as mocked_merge:
+                self.assertEqual(c.get_backend_instance().config, expected)
+                mocked_merge.assert_called_once()
+
+        with self.subTest('merged templates are cached'):
+            with patch.object(Config, '_merge_templates') as mocked_merge:
+                self.assertEqual(c.get_backend_instance().config, expected)
+                self.assertEqual(c.get_templates_layer(templates)[1]['ssid'], 'test')
+                mocked_merge.assert_not_called()
+
+        with self.subTest('cache key changes when a template is changed'):
+            t2.config['interfaces'][0]['name'] = 'eth2'
+            t2.full_clean()
+            t2.save()
+            backend_instance = c.get_backend_instance()
+            interfaces = [i['name'] for i in backend_instance.config['interfaces']]
+            self.assertIn('eth2', interfaces)
+            self.assertNotIn('eth1', interfaces)
+
+        with self.subTest('cache key depends on the order of the templates'):
+            reversed_templates = list(reversed(templates))
+            self.assertNotEqual(
+                c._get_templates_layer_cache_key(templates),
+                c._get_templates_layer_cache_key(reversed_templates),
+            )
+
+    def test_backend_validator(self):
+        c = self._create_config(organization=self._get_org())
+        validator = get_backend_validator(OpenWrt)
+        self.assertIs(get_backend_validator(OpenWrt), validator)
+
+        with self.subTest('cached validator is used'):
+            with patch.object(
+                BackendValidator, 'validate', autospec=True
+            ) as mocked_validate:
+                c.full_clean()
+                mocked_validate.assert_called_once()
+                self.assertIs(mocked_validate.call_args[0][0], validator)
+
+        with self.subTest('configuration is sanitized'):
+            config = OrderedDict(
+                [('general', OrderedDict(hostname='test')), ('list', (1, 2))]
+            )
+            config[1] = 'one'
+            sanitized = sanitize_config(config)
+            self.assertEqual(
+                sanitized, {'general': {'hostname': 'test'}, 'list': [1, 2], '1': 'one'}
+            )
+            self.assertIs(type(sanitized['general']), dict)
+
+        with self.subTest('validation errors are reported'):
+            c.config = {'interfaces': [{'name': 'eth0', 'type': 'wrong'}]}
+            del c.backend_instance
+            with self.assertRaisesRegex(
+                ValidationError, 'Invalid configuration triggered by "#/interfaces/0"'
+            ):
+                c.full_clean()
+
+        with self.subTest('integers and booleans are not confused'):
+            validator.validate({'general': {'hostname': 'test'}, 'interfaces': []})
+            self.assertTrue(validator.is_type(1, 'integer'))
+            self.assertFalse(validator.is_type(True, 'integer'))
+            self.assertFalse(validator.is_type(1.5, 'integer'))
+            self.assertTrue(validator.is_type(1.5, 'number'))
+            self.assertFalse(validator.is_type(False, 'number'))
+
     def test_backend_import_error(self):
         """
         see issue #5
@@ -1,25 +1,40 @@
+import json
+import os
+import threading
+import time
 from hashlib import md5
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
 from unittest.mock import patch
 
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase
 from django.urls import reverse
 from swapper import load_model
 
 from openwisp_users.tests.utils import TestOrganizationMixin
 from openwisp_utils.tests import capture_any_output, catch_signal
 
+from .. import settings as app_settings
 from ..base.config import logger as config_model_logger
-from ..controller.views import DeviceChecksumView
+from ..controller import views
+from ..controller.views import DeviceChecksumView, DeviceRegisterView
 from ..controller.views import logger as controller_views_logger
+from ..dispatcher import dispatcher, get_receiver_timings, get_receivers
+from ..dispatcher import logger as dispatcher_logger
+from ..dispatcher import reset_receiver_timings
 from ..signals import (
     checksum_requested,
     config_download_requested,
     config_modified,
     config_status_changed,
     device_registered,
+    management_ip_changed,
 )
+from ..tasks import get_checksum_task_cache_key
+from ..utils import flush_ip_update_buffer, get_controller_urls
 from .utils import CreateConfigTemplateMixin, TestVpnX509Mixin
 
 TEST_MACADDR = '00:11:22:33:44:55'
@@ -132,7 +147,8 @@ class TestController(
         url = reverse('controller:device_checksum', args=[d.pk])
 
         with self.subTest('first request does not return value from cache'):
-            with self.assertNumQueries(3):
+            # the checksum is calculated by the background task (eager mode)
+            with self.assertNumQueries(7):
                 with patch.object(
                     controller_views_logger, 'debug'
                 ) as mocked_view_debug:
@@ -193,6 +209,257 @@ class TestController(
                 self.assertEqual(d.config.get_cached_checksum(), d.config.checksum)
                 mocked_debug.assert_called_once()
 
+    @capture_any_output()
+    @patch('openwisp_controller.config.settings.CHECKSUM_FAST_PATH', True)
+    def test_device_checksum_fast_path(self):
+        d = self._create_device_config()
+        url = reverse('controller:device_checksum', args=[d.pk])
+        params = {'key': d.key, 'management_ip': '10.0.0.2'}
+
+        with self.subTest('first request updates the addresses'):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content.decode(), d.config.checksum)
+            self._check_header(response)
+            d.refresh_from_db()
+            self.assertEqual(d.last_ip, '127.0.0.1')
+            self.assertEqual(d.management_ip, '10.0.0.2')
+
+        with self.subTest('cold cache needs one query'):
+            response = self.client.get(url, params)
+            self.assertEqual(response.content.decode(), d.config.checksum)
+            with self.assertNumQueries(0):
+                response = self.client.get(url, params)
+            self.assertEqual(response.content.decode(), d.config.checksum)
+
+        with self.subTest('wrong key'):
+            with self.assertNumQueries(0):
+                response = self.client.get(url, {'key': 'wrong'})
+            self.assertEqual(response.status_code, 403)
+
+        with self.subTest('change of management_ip is saved'):
+            response = self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.3'})
+            self.assertEqual(response.status_code, 200)
+            d.refresh_from_db()
+            self.assertEqual(d.management_ip, '10.0.0.3')
+
+        with self.subTest('config change is reflected'):
+            old_checksum = d.config.checksum
+            d.config.config['general']['timezone'] = 'Europe/Rome'
+            d.config.full_clean()
+            d.config.save()
+            config = Config.objects.get(pk=d.config.pk)
+            self.assertNotEqual(config.checksum, old_checksum)
+            response = self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.3'})
+            self.assertEqual(response.content.decode(), config.checksum)
+
+        with self.subTest('signal is emitted if there are listeners'):
+            with catch_signal(checksum_requested) as handler:
+                response = self.client.get(
+                    url, {'key': d.key, 'management_ip': '10.0.0.3'}
+                )
+                handler.assert_called_once_with(
+                    sender=Device,
+                    signal=checksum_requested,
+                    instance=d,
+                    request=response.wsgi_request,
+                )
+
+        with self.subTest('organization changes not affecting is_active'):
+            org = d.organization
+            org.name = 'changed'
+            with patch.object(controller_views_logger, 'debug') as mocked_debug:
+                org.save()
+            mocked_debug.assert_not_called()
+            with self.assertNumQueries(0):
+                response = self.client.get(
+                    url, {'key': d.key, 'management_ip': '10.0.0.3'}
+                )
+            self.assertEqual(response.status_code, 200)
+
+        with self.subTest('disabled organization'):
+            org.is_active = False
+            with patch.object(
+                DeviceChecksumView, '_ORGANIZATION_INVALIDATION_BATCH_SIZE', 1
+            ):
+                org.save()
+            response = self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.3'})
+            self.assertEqual(response.status_code, 404)
+            org.is_active = True
+            org.save()
+            response = self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.3'})
+            self.assertEqual(response.status_code, 200)
+
+        with self.subTest('stale record of deleted configuration'):
+            view = DeviceChecksumView()
+            view.kwargs = {'pk': d.pk.hex}
+            record = view.get_device_record()
+            Config.objects.filter(pk=d.config.pk).delete()
+            # the record is stale (eg: expired checksum, missed invalidation)
+            view.update_device_record_cache(record)
+            cache.delete(record['checksum_cache_key'])
+            response = self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.3'})
+            self.assertEqual(response.status_code, 404)
+            self.assertIsNone(cache.get(view.get_device_record.get_cache_key(view)))
+
+        with self.subTest('deleted configuration'):
+            self._create_config(device=d)
+            response = self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.3'})
+            self.assertEqual(response.status_code, 200)
+            d.config.delete()
+            response = self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.3'})
+            self.assertEqual(response.status_code, 404)
+
+        with self.subTest('deleted device'):
+            self._create_config(device=d)
+            response = self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.3'})
+            self.assertEqual(response.status_code, 200)
+            d.delete()
+            response = self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.3'})
+            self.assertEqual(response.status_code, 404)
+
+    def test_get_controller_urls_without_bulk_checksum_view(self):
+        names = [
+            name
+            for name in dir(views)
+            if name.startswith(('device_', 'vpn_')) and name != 'device_checksum_bulk'
+        ]
+        views_module = SimpleNamespace(**{name: getattr(views, name) for name in names})
+        url_names = [pattern.name for pattern in get_controller_urls(views_module)]
+        self.assertNotIn('device_checksum_bulk', url_names)
+        self.assertIn('device_checksum', url_names)
+        url_names = [pattern.name for pattern in get_controller_urls(views)]
+        self.assertEqual(url_names[0], 'device_checksum_bulk')
+
+    @capture_any_output()
+    def test_device_checksum_bulk(self):
+        d1 = self._create_device_config()
+        d2 = self._create_device(name='bulk2', mac_address='00:11:22:33:44:66')
+        self._create_config(device=d2)
+        d3 = self._create_device(name='bulk3', mac_address='00:11:22:33:44:77')
+        self._create_config(device=d3)
+        # device without configuration
+        d4 = self._create_device(name='bulk4', mac_address='00:11:22:33:44:88')
+        url = reverse('controller:device_checksum_bulk')
+        d1.config.update_checksum_db()
+        payload = {
+            'devices': [
+                {'id': str(d1.pk), 'key': d1.key},
+                {'id': d2.pk.hex, 'key': d2.key},
+                {'id': str(d3.pk), 'key': 'wrong'},
+                {'id': str(d4.pk), 'key': d4.key},
+                {'id': 'wrong', 'key': 'wrong'},
+            ]
+        }
+        expected = {
+            'checksums': {
+                str(d1.pk): Config.objects.get(pk=d1.config.pk).checksum,
+                d2.pk.hex: Config.objects.get(pk=d2.config.pk).checksum,
+            },
+            'errors': {
+                str(d3.pk): 'wrong key',
+                str(d4.pk): 'not found',
+                'wrong': 'not found',
+            },
+        }
+        cache.clear()
+
+        with self.subTest('cold cache'):
+            response = self.client.post(
+                url, json.dumps(payload), content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+            self._check_header(response)
+            self.assertEqual(response.json(), expected)
+
+        with self.subTest('warm cache'):
+            # only the device without configuration is looked up again
+            with self.assertNumQueries(1):
+                response = self.client.post(
+                    url, json.dumps(payload), content_type='application/json'
+                )
+            self.assertEqual(response.json(), expected)
+
+        with self.subTest('stored checksums are retrieved in bulk'):
+            cache.clear()
+            Config.objects.get(pk=d2.config.pk).update_checksum_db()
+            cache.clear()
+            with patch.object(Config, 'generate') as mocked_generate:
+                # device records + checksums
+                with self.assertNumQueries(2):
+                    response = self.client.post(
+                        url, json.dumps(payload), content_type='application/json'
+                    )
+                mocked_generate.assert_not_called()
+            self.assertEqual(response.json(), expected)
+
+        with self.subTest('signal is emitted if there are listeners'):
+            with catch_signal(checksum_requested) as handler:
+                response = self.client.post(
+                    url, json.dumps(payload), content_type='application/json'
+                )
+            self.assertEqual(handler.call_count, 2)
+
+        with self.subTest('invalid body'):
+            for body in ['{"devices": [1]}', '[]', 'wrong', '{"devices": [{}]}']:
+                response = self.client.post(url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+
+        with self.subTest('too many devices'):
+            with patch(
+                'openwisp_controller.config.settings.BULK_CHECKSUM_MAX_DEVICES', 2
+            ):
+                response = self.client.post(
+                    url, json.dumps(payload), content_type='application/json'
+                )
+            self.assertEqual(response.status_code, 400)
+
+        with self.subTest('GET not allowed'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 405)
+
+    @patch('openwisp_controller.config.base.config.update_config_checksum.delay')
+    def test_device_checksum_not_ready(self, mocked_delay):
+        d = self._create_device_config()
+        url = reverse('controller:device_checksum', args=[d.pk])
+        with patch.object(Config, 'generate') as mocked_generate:
+            response = self.client.get(url, {'key': d.key})
+            mocked_generate.assert_not_called()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+        self._check_header(response)
+        mocked_delay.assert_called_once_with(d.config.pk)
+
+        with self.subTest('bulk checksum view'):
+            payload = {'devices': [{'id': str(d.pk), 'key': d.key}]}
+            response = self.client.post(
+                reverse('controller:device_checksum_bulk'),
+                json.dumps(payload),
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json(),
+                {'checksums': {}, 'errors': {str(d.pk): 'checksum not ready'}},
+            )
+
+        with self.subTest('checksum is served once calculated'):
+            cache.delete(get_checksum_task_cache_key(d.config.pk))
+            checksum = Config.objects.get(pk=d.config.pk).update_checksum_db()
+            response = self.client.get(url, {'key': d.key})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content.decode(), checksum)
+
+    @patch('openwisp_controller.config.settings.CHECKSUM_FAST_PATH', True)
+    def test_device_checksum_fast_path_404(self):
+        d = self._create_device()
+        url = reverse('controller:device_checksum', args=[d.pk])
+        response = self.client.get(url, {'key': d.key})
+        self.assertEqual(response.status_code, 404)
+        url = reverse('controller:device_checksum', args=[f'{d.pk}-wrong'])
+        response = self.client.get(url, {'key': d.key})
+        self.assertEqual(response.status_code, 404)
+
     def test_device_checksum_requested_signal_is_emitted(self):
         d = self._create_device_config()
         url = reverse('controller:device_checksum', args=[d.pk])
@@ -205,6 +472,105 @@ class TestController(
                 request=response.wsgi_request,
             )
 
+    @patch('openwisp_controller.config.settings.ASYNC_SIGNALS', 'thread')
+    def test_controller_signals_thread(self):
+        d = self._create_device_config()
+        threads = []
+        requests = []
+
+        def receiver(request, **kwargs):
+            threads.append(threading.current_thread())
+            requests.append(request)
+
+        checksum_requested.connect(receiver, sender=Device)
+        self.addCleanup(checksum_requested.disconnect, receiver, sender=Device)
+        url = reverse('controller:device_checksum', args=[d.pk])
+        response = self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.2'})
+        self.assertEqual(response.status_code, 200)
+        dispatcher.flush()
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.current_thread())
+        # the receivers don't get the request object of the view
+        self.assertIsNot(requests[0], response.wsgi_request)
+        self.assertEqual(requests[0].path, url)
+        self.assertEqual(requests[0].META['REMOTE_ADDR'], '127.0.0.1')
+        self.assertEqual(requests[0].GET.get('management_ip'), '10.0.0.2')
+        self.assertNotIn('key', requests[0].GET)
+
+        with self.subTest('receiver errors are logged'):
+            checksum_requested.disconnect(receiver, sender=Device)
+            with catch_signal(checksum_requested) as handler:
+                handler.side_effect = ValueError('receiver error')
+                with patch.object(dispatcher_logger, 'exception') as mocked_exception:
+                    response = self.client.get(
+                        url, {'key': d.key, 'management_ip': '10.0.0.2'}
+                    )
+                    self.assertEqual(response.status_code, 200)
+                    dispatcher.flush()
+                    mocked_exception.assert_called_once()
+                handler.assert_called_once()
+
+    @patch('openwisp_controller.config.settings.ASYNC_SIGNALS', 'celery')
+    def test_controller_signals_celery(self):
+        d = self._create_device_config()
+        url = reverse('controller:device_download_config', args=[d.pk])
+        with patch.object(dispatcher, 'put') as mocked_put:
+            response = self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.2'})
+            self.assertEqual(response.status_code, 200)
+            mocked_put.assert_not_called()
+        with catch_signal(config_download_requested) as handler:
+            with patch.object(dispatcher, 'put') as mocked_put:
+                self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.2'})
+            handler.assert_not_called()
+            event = mocked_put.call_args[0][0]
+            # the celery task is executed in this thread
+            dispatcher.process([event])
+            handler.assert_called_once()
+            kwargs = handler.call_args[1]
+            self.assertEqual(kwargs['sender'], Device)
+            self.assertEqual(kwargs['instance'], d)
+            request = kwargs['request']
+            self.assertEqual(request.path, url)
+            self.assertEqual(request.META['REMOTE_ADDR'], '127.0.0.1')
+            self.assertEqual(request.GET.get('management_ip'), '10.0.0.2')
+            self.assertNotIn('key', request.GET)
+
+    def test_controller_signals_receivers(self):
+        def receiver(**kwargs):
+            pass
+
+        def other_receiver(**kwargs):
+            pass
+
+        checksum_requested.connect(receiver, sender=Device)
+        self.addCleanup(checksum_requested.disconnect, receiver, sender=Device)
+        checksum_requested.connect(other_receiver, sender=Config)
+        self.addCleanup(checksum_requested.disconnect, other_receiver, sender=Config)
+        with catch_signal(checksum_requested) as handler:
+            receivers = get_receivers(checksum_requested, Device)
+        self.assertEqual(receivers, [receiver, handler])
+
+    def test_controller_signals_receiver_timings(self):
+        d = self._create_device_config()
+        url = reverse('controller:device_checksum', args=[d.pk])
+        reset_receiver_timings()
+        with catch_signal(checksum_requested):
+            self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.2'})
+            self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.2'})
+        timings = get_receiver_timings()
+        self.assertEqual(len(timings), 1)
+        timing = list(timings.values())[0]
+        self.assertEqual(timing['calls'], 2)
+        self.assertGreaterEqual(timing['max'], 0)
+
+        with self.subTest('slow receivers are logged'):
+            with patch(
+                'openwisp_controller.config.settings.SIGNAL_RECEIVER_SLOW_THRESHOLD', 0
+            ), patch.object(dispatcher_logger, 'warning') as mocked_warning:
+                with catch_signal(checksum_requested):
+                    self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.2'})
+                mocked_warning.assert_called_once()
+
     def test_device_checksum_bad_uuid(self):
         d = self._create_device_config()
         pk = '{}-wrong'.format(d.pk)
@@ -265,6 +631,88 @@ class TestController(
         self.assertIsNotNone(d.last_ip)
         self.assertIsNone(d.management_ip)
 
+    @capture_any_output()
+    def test_device_download_config_etag(self):
+        d = self._create_device_config()
+        url = reverse('controller:device_download_config', args=[d.pk])
+        params = {'key': d.key, 'management_ip': '10.0.0.2'}
+        checksum = d.config.get_cached_checksum()
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"{checksum}"')
+
+        with self.subTest('matching If-None-Match does not generate config'):
+            with patch.object(Config, 'generate') as mocked_generate:
+                response = self.client.get(
+                    url, params, HTTP_IF_NONE_MATCH=f'"{checksum}"'
+                )
+                mocked_generate.assert_not_called()
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], f'"{checksum}"')
+            self.assertEqual(response.content, b'')
+            self._check_header(response)
+
+        with self.subTest('ip addresses are updated also with 304'):
+            response = self.client.get(
+                url,
+                {'key': d.key, 'management_ip': '10.0.0.3'},
+                HTTP_IF_NONE_MATCH=f'"{checksum}"',
+            )
+            self.assertEqual(response.status_code, 304)
+            d.refresh_from_db()
+            self.assertEqual(d.management_ip, '10.0.0.3')
+
+        with self.subTest('outdated If-None-Match'):
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH='"outdated"')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['ETag'], f'"{checksum}"')
+
+        with self.subTest('wrong key'):
+            response = self.client.get(
+                url, {'key': 'wrong'}, HTTP_IF_NONE_MATCH=f'"{checksum}"'
+            )
+            self.assertEqual(response.status_code, 403)
+
+    def test_device_download_config_streaming(self):
+        d = self._create_device_config()
+        url = reverse('controller:device_download_config', args=[d.pk])
+        contents = d.config.generate().getvalue()
+        checksum = md5(contents).hexdigest()
+        with TemporaryDirectory() as path, patch.object(
+            app_settings, 'ARCHIVE_STORE', 'filesystem'
+        ), patch.object(app_settings, 'ARCHIVE_STORE_DIR', path):
+            response = self.client.get(url, {'key': d.key})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            self.assertEqual(b''.join(response.streaming_content), contents)
+            self.assertEqual(response['ETag'], f'"{checksum}"')
+            self.assertEqual(response['Content-Length'], str(len(contents)))
+            self.assertEqual(
+                response['Content-Disposition'], 'attachment; filename=test.tar.gz'
+            )
+            self._check_header(response)
+            response.close()
+
+            with self.subTest('stored archive is streamed'):
+                with patch.object(Config, 'generate') as mocked_generate:
+                    response = self.client.get(url, {'key': d.key})
+                    mocked_generate.assert_not_called()
+                self.assertEqual(b''.join(response.streaming_content), contents)
+                response.close()
+
+            with self.subTest('archive bigger than the store'):
+                with patch.object(app_settings, 'ARCHIVE_STORE_MAX_SIZE', 1):
+                    os.remove(os.path.join(path, f'{checksum}.tar.gz'))
+                    response = self.client.get(url, {'key': d.key})
+                self.assertEqual(b''.join(response.streaming_content), contents)
+                self.assertEqual(os.listdir(path), [])
+
+        with self.subTest('archive is not streamed with other archive stores'):
+            with patch.object(app_settings, 'ARCHIVE_STORE', 'cache'):
+                response = self.client.get(url, {'key': d.key})
+            self.assertFalse(response.streaming)
+            self.assertEqual(response.content, contents)
+
     def test_device_download_config_bad_uuid(self):
         d = self._create_device_config()
         pk = '{}-wrong'.format(d.pk)
@@ -1031,6 +1479,64 @@ class TestController(
         )
         self.assertContains(response, 'error: unrecognized secret', status_code=403)
 
+    @capture_any_output()
+    def test_register_shared_secret_cache(self):
+        org = self._get_org()
+        params = {
+            'secret': TEST_ORG_SHARED_SECRET,
+            'name': TEST_MACADDR_NAME,
+            'mac_address': TEST_MACADDR,
+            'backend': 'netjsonconfig.OpenWrt',
+        }
+        self.client.post(self.register_url, params)
+        view = DeviceRegisterView
+
+        with self.subTest('secret lookup is cached'):
+            with self.assertNumQueries(0):
+                record = view.get_shared_secret_record(TEST_ORG_SHARED_SECRET)
+            self.assertEqual(record, (org.pk, True, True))
+
+        with self.subTest('secret lookup is cached in the shared cache only'):
+            cache_key = view._get_shared_secret_cache_key(TEST_ORG_SHARED_SECRET)
+            self.assertEqual(tuple(cache.get(cache_key)), (org.pk, True, True))
+            # simulates the invalidation performed by another process
+            cache.delete(cache_key)
+            with self.assertNumQueries(1):
+                view.get_shared_secret_record(TEST_ORG_SHARED_SECRET)
+
+        with self.subTest('unrecognized secrets are cached'):
+            wrong_params = dict(
+                params, secret='WRONG', name='wrong', mac_address='00:11:22:33:44:99'
+            )
+            response = self.client.post(self.register_url, wrong_params)
+            self.assertContains(response, 'unrecognized secret', status_code=403)
+            with self.assertNumQueries(0):
+                response = self.client.post(self.register_url, wrong_params)
+            self.assertContains(response, 'unrecognized secret', status_code=403)
+
+        with self.subTest('cache is invalidated when settings are changed'):
+            org.config_settings.registration_enabled = False
+            org.config_settings.save()
+            response = self.client.post(self.register_url, params)
+            self.assertContains(
+                response, 'error: registration disabled', status_code=403
+            )
+
+        with self.subTest('old secret is invalidated when secret is changed'):
+            org.config_settings.registration_enabled = True
+            org.config_settings.shared_secret = 'WRONG'
+            org.config_settings.save()
+            response = self.client.post(self.register_url, params)
+            self.assertContains(response, 'unrecognized secret', status_code=403)
+            response = self.client.post(self.register_url, wrong_params)
+            self.assertEqual(response.status_code, 201)
+
+        with self.subTest('cache is invalidated when organization is disabled'):
+            org.is_active = False
+            org.save()
+            response = self.client.post(self.register_url, wrong_params)
+            self.assertContains(response, 'unrecognized secret', status_code=403)
+
     def test_checksum_404_disabled_org(self):
         org = self._create_org(is_active=False)
         c = self._create_config(organization=org)
@@ -1092,12 +1598,13 @@ class TestController(
         c2 = self._create_config(device=d2)
         org2 = self._create_org(name='org2', shared_secret='123456')
         c3 = self._create_config(organization=org2)
-        with self.assertNumQueries(6):
+        # includes the calculation of the checksum (background task, eager mode)
+        with self.assertNumQueries(10):
             self.client.get(
                 reverse('controller:device_checksum', args=[c3.device.pk]),
                 {'key': c3.device.key, 'management_ip': '192.168.1.99'},
             )
-        with self.assertNumQueries(6):
+        with self.assertNumQueries(10):
             self.client.get(
                 reverse('controller:device_checksum', args=[c1.device.pk]),
                 {'key': c1.device.key, 'management_ip': '192.168.1.99'},
@@ -1110,7 +1617,7 @@ class TestController(
             )
         # triggers more queries because devices with conflicting addresses
         # need to be updated, luckily it does not happen often
-        with self.assertNumQueries(8):
+        with self.assertNumQueries(12):
             self.client.get(
                 reverse('controller:device_checksum', args=[c2.device.pk]),
                 {'key': c2.device.key, 'management_ip': '192.168.1.99'},
@@ -1133,6 +1640,121 @@ class TestController(
             cached_device1 = view.get_device()
             self.assertIsNone(cached_device1.management_ip)
 
+    @patch('openwisp_controller.config.settings.IP_UPDATE_BUFFER', True)
+    def test_ip_update_buffer(self):
+        org1 = self._get_org()
+        c1 = self._create_config(organization=org1)
+        d2 = self._create_device(
+            organization=org1, name='testdup', mac_address='00:11:22:33:66:77'
+        )
+        c2 = self._create_config(device=d2)
+        org2 = self._create_org(name='org2', shared_secret='123456')
+        c3 = self._create_config(organization=org2)
+        # c1 already has the address which is going to be taken by c2
+        Device.objects.filter(pk=c1.device.pk).update(
+            last_ip='127.0.0.1', management_ip='192.168.1.99'
+        )
+        path = 'openwisp_controller.config.utils.flush_ip_updates.apply_async'
+
+        with self.subTest('updates are buffered'):
+            with patch(path) as mocked_apply_async:
+                for config in [c2, c3, c2]:
+                    self.client.get(
+                        reverse('controller:device_checksum', args=[config.device.pk]),
+                        {'key': config.device.key, 'management_ip': '192.168.1.99'},
+                    )
+                    self.client.get(
+                        reverse('controller:device_checksum', args=[config.device.pk]),
+                        {'key': config.device.key, 'management_ip': '192.168.1.99'},
+                    )
+                mocked_apply_async.assert_called_once_with(countdown=60)
+            c2.device.refresh_from_db()
+            c3.device.refresh_from_db()
+            self.assertIsNone(c2.device.last_ip)
+            self.assertIsNone(c3.device.management_ip)
+
+        with self.subTest('flush writes the updates in bulk'):
+            with catch_signal(management_ip_changed) as handler:
+                self.assertEqual(flush_ip_update_buffer(), 2)
+            self.assertEqual(handler.call_count, 3)
+            c1.device.refresh_from_db()
+            c2.device.refresh_from_db()
+            c3.device.refresh_from_db()
+            self.assertIsNone(c1.device.management_ip)
+            self.assertEqual(c2.device.last_ip, '127.0.0.1')
+            self.assertEqual(c2.device.management_ip, '192.168.1.99')
+            # other organization is not affected
+            self.assertEqual(c3.device.last_ip, '127.0.0.1')
+            self.assertEqual(c3.device.management_ip, '192.168.1.99')
+            view = DeviceChecksumView()
+            view.kwargs = {'pk': str(c1.device.pk)}
+            self.assertIsNone(view.get_device().management_ip)
+
+        with self.subTest('empty buffer'):
+            with self.assertNumQueries(0):
+                self.assertEqual(flush_ip_update_buffer(), 0)
+
+        with self.subTest('concurrent flush is skipped'):
+            cache.add('openwisp_controller.ip_buffer.flush-running', True)
+            self.assertIsNone(flush_ip_update_buffer())
+            cache.delete('openwisp_controller.ip_buffer.flush-running')
+
+        with self.subTest('flush is scheduled again after a flush'):
+            with patch(path) as mocked_apply_async:
+                self.client.get(
+                    reverse('controller:device_checksum', args=[c2.device.pk]),
+                    {'key': c2.device.key, 'management_ip': '192.168.1.98'},
+                )
+                mocked_apply_async.assert_called_once()
+            self.assertEqual(flush_ip_update_buffer(), 1)
+            c2.device.refresh_from_db()
+            self.assertEqual(c2.device.management_ip, '192.168.1.98')
+
+        with self.subTest('index evicted from the cache'):
+            cache.delete('openwisp_controller.ip_buffer.index')
+            with patch(path):
+                self.client.get(
+                    reverse('controller:device_checksum', args=[c2.device.pk]),
+                    {'key': c2.device.key, 'management_ip': '192.168.1.97'},
+                )
+            self.assertEqual(flush_ip_update_buffer(), 1)
+            c2.device.refresh_from_db()
+            self.assertEqual(c2.device.management_ip, '192.168.1.97')
+
+        with self.subTest('index evicted while a flush is running'):
+            with patch(path):
+                self.client.get(
+                    reverse('controller:device_checksum', args=[c2.device.pk]),
+                    {'key': c2.device.key, 'management_ip': '192.168.1.96'},
+                )
+            # the flushed count is left higher than the restarted index
+            cache.set('openwisp_controller.ip_buffer.flushed', 50)
+            self.assertEqual(flush_ip_update_buffer(), 1)
+            c2.device.refresh_from_db()
+            self.assertEqual(c2.device.management_ip, '192.168.1.96')
+
+        with self.subTest('pending flag does not outlive the flush interval'):
+            with patch.object(cache, 'add', wraps=cache.add) as mocked_add, patch(path):
+                self.client.get(
+                    reverse('controller:device_checksum', args=[c2.device.pk]),
+                    {'key': c2.device.key, 'management_ip': '192.168.1.95'},
+                )
+            pending_key = f'openwisp_controller.ip_buffer.pending-{c2.device.pk.hex}'
+            mocked_add.assert_any_call(pending_key, True, 60)
+            # the slot is lost and the pending flag expires
+            index = cache.get('openwisp_controller.ip_buffer.index')
+            cache.delete_many(
+                [pending_key, f'openwisp_controller.ip_buffer.slot-{index}']
+            )
+            with patch(path):
+                self.client.get(
+                    reverse('controller:device_checksum', args=[c2.device.pk]),
+                    {'key': c2.device.key, 'management_ip': '192.168.1.94'},
+                )
+            self.assertEqual(flush_ip_update_buffer(), 1)
+            c2.device.refresh_from_db()
+            self.assertEqual(c2.device.management_ip, '192.168.1.94')
+
     # simulate public IP by mocking the
     # method which tells us if the ip is private or not
     @patch('ipaddress.IPv4Address.is_private', False)
@@ -1184,3 +1806,159 @@ class TestController(
             handler.assert_called_once_with(
                 sender=Device, signal=device_registered, instance=device, is_new=True
             )
+
+
+class TestControllerTransaction(
+    CreateConfigTemplateMixin, TestOrganizationMixin, TransactionTestCase
+):
+    """
+    tests for config.controller which need concurrent requests
+    """
+
+    def setUp(self):
+        self.register_url = reverse('controller:device_register')
+        org = self._create_org()
+        OrganizationConfigSettings.objects.create(
+            organization=org, shared_secret=TEST_ORG_SHARED_SECRET
+        )
+        # ensures the shared secret is read from the cache by the threads
+        DeviceRegisterView.get_shared_secret_record(TEST_ORG_SHARED_SECRET)
+
+    def tearDown(self):
+        DeviceRegisterView.invalidate_shared_secret_cache(TEST_ORG_SHARED_SECRET)
+
+    def _register_concurrently(self, params_list):
+        barrier = threading.Barrier(len(params_list))
+        responses = [None] * len(params_list)
+
+        def register(index, params):
+            barrier.wait()
+            try:
+                responses[index] = Client().post(self.register_url, params)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=register, args=(index, params))
+            for index, params in enumerate(params_list)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def _get_slow_register(self, delay):
+        register = DeviceRegisterView.register
+
+        def slow_register(view, request, key):
+            time.sleep(delay)
+            return register(view, request, key)
+
+        return slow_register
+
+    @patch.object(app_settings, 'REGISTRATION_COALESCING', True)
+    def test_register_concurrent_coalesced(self):
+        params = {
+            'secret': TEST_ORG_SHARED_SECRET,
+            'name': TEST_MACADDR_NAME,
+            'mac_address': TEST_MACADDR,
+            'key': TEST_CONSISTENT_KEY,
+            'backend': 'netjsonconfig.OpenWrt',
+        }
+        count = 20
+        delay = 0.3
+        with patch.object(
+            DeviceRegisterView, 'register', self._get_slow_register(delay)
+        ), catch_signal(device_registered) as handler:
+            start = time.perf_counter()
+            responses = self._register_concurrently([params] * count)
+            elapsed = time.perf_counter() - start
+        # the registration is performed only once
+        handler.assert_called_once()
+        self.assertEqual(Device.objects.count(), 1)
+        device = Device.objects.first()
+        self.assertEqual(device.key, TEST_CONSISTENT_KEY)
+        # all the requests get the same successful response
+        for response in responses:
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.content, responses[0].content)
+        self.assertIn(f'uuid: {device.pk.hex}', responses[0].content.decode())
+        self.assertIn('is-new: 1', responses[0].content.decode())
+
+        with self.subTest('throughput'):
+            # baseline: one registration which is not coalesced, measured
+            # in the same environment to tolerate slow machines (eg: CI)
+            with patch.object(
+                DeviceRegisterView, 'register', self._get_slow_register(delay)
+            ), patch.object(app_settings, 'REGISTRATION_COALESCING', False):
+                start = time.perf_counter()
+                response = self.client.post(self.register_url, params)
+                baseline = time.perf_counter() - start
+            self.assertEqual(response.status_code, 201)
+            # performing the registrations one by one would take count * baseline
+            self.assertLess(elapsed, baseline * count / 4)
+
+        with self.subTest('subsequent registrations are not coalesced'):
+            with catch_signal(device_registered) as handler:
+                response = self.client.post(self.register_url, params)
+            handler.assert_called_once()
+            self.assertContains(response, 'is-new: 0', status_code=201)
+
+    @patch.object(app_settings, 'REGISTRATION_COALESCING', True)
+    @patch.object(DeviceRegisterView, '_REGISTRATION_WAIT_TIMEOUT', 0.1)
+    def test_register_concurrent_wait_timeout(self):
+        params = {
+            'secret': TEST_ORG_SHARED_SECRET,
+            'name': TEST_MACADDR_NAME,
+            'mac_address': TEST_MACADDR,
+            'key': TEST_CONSISTENT_KEY,
+            'backend': 'netjsonconfig.OpenWrt',
+        }
+        params_list = [dict(params, model=f'model-{i}') for i in range(2)]
+        with patch.object(
+            DeviceRegisterView, 'register', self._get_slow_register(0.5)
+        ), patch.object(controller_views_logger, "warning") as mocked_warning:
+            responses = self._register_concurrently(params_list)
+        mocked_warning.assert_called_once()
+        self.assertEqual(Device.objects.count(), 1)
+        status_codes = sorted(response.status_code for response in responses)
+        self.assertEqual(status_codes, [201, 503])
+        response = [r for r in responses if r.status_code == 503][0]
+        self.assertEqual(response['Retry-After'], '5')
+
+    @patch.object(app_settings, 'REGISTRATION_COALESCING', True)
+    def test_register_concurrent_different_params(self):
+        params = {
+            'secret': TEST_ORG_SHARED_SECRET,
+            'name': TEST_MACADDR_NAME,
+            'mac_address': TEST_MACADDR,
+            'key': TEST_CONSISTENT_KEY,
+            'backend': 'netjsonconfig.OpenWrt',
+        }
+        params_list = [dict(params, model=f'model-{i}') for i in range(4)]
+        with patch.object(
+            DeviceRegisterView, 'register', self._get_slow_register(0.05)
+        ), catch_signal(device_registered) as handler:
+            responses = self._register_concurrently(params_list)
+        # the registrations are performed one at a time
+        self.assertEqual(handler.call_count, 4)
+        self.assertEqual(Device.objects.count(), 1)
+        contents = sorted(response.content.decode() for response in responses)
+        self.assertEqual(len([c for c in contents if 'is-new: 1' in c]), 1)
+        for response in responses:
+            self.assertEqual(response.status_code, 201)
+
+    @patch.object(app_settings, 'REGISTRATION_COALESCING', False)
+    def test_register_coalescing_disabled(self):
+        params = {
+            'secret': TEST_ORG_SHARED_SECRET,
+            'name': TEST_MACADDR_NAME,
+            'mac_address': TEST_MACADDR,
+            'key': TEST_CONSISTENT_KEY,
+            'backend': 'netjsonconfig.OpenWrt',
+        }
+        with patch.object(DeviceRegisterView, 'coalesced_register') as mocked:
+            response = self.client.post(self.register_url, params)
+        mocked.assert_not_called()
+        self.assertEqual(response.status_code, 201)
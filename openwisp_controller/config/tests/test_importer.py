@@ -0,0 +1,216 @@
+import json
+import os
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from swapper import load_model
+
+from openwisp_users.tests.utils import TestOrganizationMixin
+from openwisp_utils.tests import catch_signal
+
+from .. import settings as app_settings
+from ..importer import import_devices
+from ..signals import devices_imported
+from ..tasks import create_vpn_client_cert
+from .utils import CreateConfigTemplateMixin, TestVpnX509Mixin
+
+Config = load_model('config', 'Config')
+Device = load_model('config', 'Device')
+OrganizationConfigSettings = load_model('config', 'OrganizationConfigSettings')
+VpnClient = load_model('config', 'VpnClient')
+
+TEST_ORG_SHARED_SECRET = 'functional_testing_secret'
+
+
+class TestDeviceImporter(
+    CreateConfigTemplateMixin, TestVpnX509Mixin, TestOrganizationMixin, TestCase
+):
+    """
+    tests for the bulk import of devices
+    """
+
+    def _get_rows(self, count, **kwargs):
+        rows = []
+        for i in range(count):
+            row = {'name': f'device-{i}', 'mac_address': f'00:11:22:33:44:{i:02x}'}
+            row.update(kwargs)
+            rows.append(row)
+        return rows
+
+    def test_import_devices(self):
+        org = self._get_org()
+        OrganizationConfigSettings.objects.create(
+            organization=org, shared_secret=TEST_ORG_SHARED_SECRET
+        )
+        required = self._create_template(name='required', required=True)
+        default = self._create_template(name='default', default=True)
+        extra = self._create_template(name='extra', organization=org)
+        self._create_template(name='other')
+        vpn = self._create_vpn()
+        vpn_template = self._create_template(
+            name='vpn', type='vpn', vpn=vpn, auto_cert=True, config={}
+        )
+        rows = self._get_rows(5, context={'ssid': 'test'})
+        with catch_signal(devices_imported) as handler, mock.patch(
+            'django.db.transaction.on_commit', side_effect=lambda func: func()
+        ):
+            devices = import_devices(
+                org, rows, templates=[extra, vpn_template], batch_size=2
+            )
+        handler.assert_called_once()
+        self.assertEqual(handler.call_args[1]['instances'], devices)
+        self.assertEqual(handler.call_args[1]['organization'], org)
+        self.assertEqual(Device.objects.filter(organization=org).count(), 5)
+        self.assertEqual(Config.objects.count(), 5)
+        for device, row in zip(devices, rows):
+            device.refresh_from_db()
+            self.assertEqual(device.name, row['name'])
+            self.assertEqual(device.key, device.generate_key(TEST_ORG_SHARED_SECRET))
+            config = device.config
+            self.assertEqual(config.status, 'modified')
+            self.assertEqual(config.context, {'ssid': 'test'})
+            self.assertEqual(
+                list(config.templates.all()), [required, default, extra, vpn_template]
+            )
+            client = config.vpnclient_set.get()
+            self.assertEqual(client.vpn, vpn)
+            self.assertIsNotNone(client.cert)
+            self.assertEqual(client.cert.organization, org)
+            # the checksum is calculated in the background
+            self.assertEqual(config.checksum_db, config.checksum)
+
+    @mock.patch.object(app_settings, 'VPN_CLIENT_CERT_ASYNC', True)
+    def test_import_devices_vpn_client_cert_async(self):
+        org = self._get_org()
+        vpn = self._create_vpn()
+        template = self._create_template(
+            name='vpn', type='vpn', vpn=vpn, auto_cert=True, config={}
+        )
+        with mock.patch(
+            'django.db.transaction.on_commit', side_effect=lambda func: func()
+        ), mock.patch.object(create_vpn_client_cert, 'delay') as delay:
+            devices = import_devices(org, self._get_rows(3), templates=[template])
+        clients = VpnClient.objects.filter(config__device__in=devices)
+        self.assertEqual(clients.count(), 3)
+        self.assertFalse(clients.exclude(cert=None).exists())
+        self.assertEqual(
+            sorted(call[0][0] for call in delay.call_args_list),
+            sorted(clients.values_list('pk', flat=True)),
+        )
+
+    def test_import_devices_validation(self):
+        org = self._get_org()
+        self._create_device(organization=org, name='existing')
+        rows = self._get_rows(3)
+        rows[0]['mac_address'] = 'wrong'
+        rows[1]['name'] = 'existing'
+        rows.append(self._get_rows(3)[2])
+        with self.assertRaises(ValidationError) as context_manager:
+            import_devices(org, rows, batch_size=2)
+        errors = context_manager.exception.message_dict
+        self.assertEqual(sorted(errors.keys()), [0, 1, 3])
+        self.assertIn('mac_address:', errors[0][0])
+        self.assertIn('Name', errors[1][0])
+        self.assertEqual(len(errors[3]), 2)
+        self.assertEqual(Device.objects.count(), 1)
+
+        with self.subTest('invalid configuration'):
+            rows = self._get_rows(1, config={'interfaces': [{'name': 'eth0'}]})
+            with self.assertRaises(ValidationError) as context_manager:
+                import_devices(org, rows)
+            self.assertIn('config:', context_manager.exception.message_dict[0][0])
+
+        with self.subTest('templates of other organizations'):
+            org2 = self._create_org(name='org2', slug='org2')
+            template = self._create_template(organization=org2)
+            with self.assertRaises(ValidationError):
+                import_devices(org, self._get_rows(1), templates=[template])
+
+        with self.subTest('templates of other backends'):
+            template = self._create_template(
+                name='other-backend', backend='netjsonconfig.OpenWisp'
+            )
+            with self.assertRaises(ValidationError) as context_manager:
+                import_devices(org, self._get_rows(1), templates=[template])
+            self.assertIn('other-backend', context_manager.exception.messages[0])
+
+        with self.subTest('unknown fields'):
+            with self.assertRaises(ValidationError) as context_manager:
+                import_devices(org, self._get_rows(1, wrong='wrong'))
+            self.assertIn('wrong:', context_manager.exception.message_dict[0][0])
+        self.assertEqual(Device.objects.count(), 1)
+
+    def test_import_devices_config_clean(self):
+        org = self._get_org()
+        with self.subTest('the first configuration is fully validated'):
+            with mock.patch.object(
+                Config, 'clean', autospec=True, side_effect=Config.clean
+            ) as clean:
+                import_devices(org, self._get_rows(3))
+            clean.assert_called_once()
+        with self.subTest('errors raised by clean are reported'):
+            error = ValidationError({'context': 'invalid'})
+            with mock.patch.object(Config, 'clean', side_effect=error):
+                with self.assertRaises(ValidationError) as context_manager:
+                    import_devices(org, self._get_rows(1, name='other'))
+            self.assertEqual(
+                context_manager.exception.message_dict, {0: ['context: invalid']}
+            )
+        self.assertEqual(Device.objects.count(), 3)
+
+    def test_import_devices_queries(self):
+        org = self._get_org()
+        self._create_template(name='default', default=True)
+        self._create_template(name='extra')
+        with mock.patch.object(Config, '_schedule_checksums_update'):
+            with self.assertNumQueries(11):
+                import_devices(org, self._get_rows(10))
+            # the number of queries does not depend on the number of devices
+            org.refresh_from_db()
+            with self.assertNumQueries(11):
+                import_devices(org, self._get_rows(30)[10:])
+
+    def test_import_devices_command(self):
+        org = self._get_org()
+        template = self._create_template(name='extra')
+        with TemporaryDirectory() as path:
+            csv_path = os.path.join(path, 'devices.csv')
+            with open(csv_path, 'w') as f:
+                f.write('name,mac_address,model,context\n')
+                f.write('device-1,00:11:22:33:44:01,TP-Link,\n')
+                context = json.dumps({'ssid': 'test'}).replace('"', '""')
+                f.write(f'device-2,00:11:22:33:44:02,,"{context}"\n')
+            stdout = StringIO()
+            call_command(
+                'import_devices',
+                csv_path,
+                organization=org.slug,
+                templates=['extra'],
+                stdout=stdout,
+            )
+            self.assertIn('2 devices imported', stdout.getvalue())
+            device = Device.objects.get(name='device-1')
+            self.assertEqual(device.model, 'TP-Link')
+            self.assertEqual(list(device.config.templates.all()), [template])
+            device = Device.objects.get(name='device-2')
+            self.assertEqual(device.config.context, {'ssid': 'test'})
+
+            with self.subTest('invalid rows'):
+                stderr = StringIO()
+                with self.assertRaises(CommandError):
+                    call_command(
+                        'import_devices',
+                        csv_path,
+                        organization=org.slug,
+                        stderr=stderr,
+                    )
+                self.assertIn('line 2:', stderr.getvalue())
+                self.assertIn('line 3:', stderr.getvalue())
+
+            with self.subTest('organization not found'):
+                with self.assertRaises(CommandError):
+                    call_command('import_devices', csv_path, organization='wrong')
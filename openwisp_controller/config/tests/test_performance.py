@@ -0,0 +1,119 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from swapper import load_model
+
+from openwisp_users.tests.utils import TestOrganizationMixin
+
+from ...tests.utils import TestAdminMixin
+from .utils import QueryBudgetMixin, add_fleet_devices, create_fleet
+
+Config = load_model('config', 'Config')
+Organization = load_model('openwisp_users', 'Organization')
+OrganizationConfigSettings = load_model('config', 'OrganizationConfigSettings')
+
+TEST_ORG_SHARED_SECRET = 'functional_testing_secret'
+
+
+class TestQueryBudget(
+    QueryBudgetMixin, TestAdminMixin, TestOrganizationMixin, TestCase,
+):
+    """
+    query budgets of the hot paths of the controller and the admin,
+    measured on a small fleet of devices (see ``create_fleet``)
+    which is then doubled: the budgets must not change with the
+    size of the fleet, otherwise there's a N+1 query problem;
+    if a change increases the number of queries on purpose
+    the budgets shall be updated accordingly
+    """
+
+    app_label = 'config'
+    # the budgets are checked with each of these fleet sizes
+    fleet_sizes = (20, 40)
+
+    @classmethod
+    def setUpTestData(cls):
+        org = Organization.objects.create(name='fleet', slug='fleet')
+        OrganizationConfigSettings.objects.create(
+            organization=org, shared_secret=TEST_ORG_SHARED_SECRET
+        )
+        cls.fleet = create_fleet(org, devices=cls.fleet_sizes[0])
+
+    def setUp(self):
+        # the devices added by each test are rolled back
+        self.fleet = dict(self.fleet, devices=list(self.fleet['devices']))
+        # the budgets are measured with cold caches
+        self._clear_caches()
+
+    def _clear_caches(self):
+        cache.clear()
+        ContentType.objects.clear_cache()
+
+    def _get_fleet_sizes(self):
+        """
+        yields each of ``fleet_sizes``, after having
+        added the missing devices to the fleet
+        """
+        for size in self.fleet_sizes:
+            add_fleet_devices(self.fleet, size - len(self.fleet['devices']))
+            self._clear_caches()
+            yield size
+
+    def test_checksum_view(self):
+        for size in self._get_fleet_sizes():
+            device = self.fleet['devices'][-1]
+            url = reverse('controller:device_checksum', args=[device.pk])
+            params = {'key': device.key}
+            # the checksum is precalculated in the background when
+            # the configuration changes, it's never calculated by the view
+            Config.objects.get(device=device).update_checksum_db()
+            # each device of the fleet sends its requests from a different address
+            remote_addr = f'10.0.0.{size}'
+            with self.assertQueryBudget(3, f'checksum view (cold cache, {size})'):
+                response = self.client.get(url, params, REMOTE_ADDR=remote_addr)
+            self.assertEqual(response.status_code, 200)
+            with self.assertQueryBudget(0, f'checksum view ({size})'):
+                response = self.client.get(url, params, REMOTE_ADDR=remote_addr)
+            self.assertEqual(response.status_code, 200)
+
+    def test_register_view(self):
+        url = reverse('controller:device_register')
+        for size in self._get_fleet_sizes():
+            device = self.fleet['devices'][-1]
+            params = {
+                'secret': TEST_ORG_SHARED_SECRET,
+                'name': device.name,
+                'mac_address': device.mac_address,
+                'key': device.key,
+                'backend': 'netjsonconfig.OpenWrt',
+                'model': 'TP-Link TL-WDR4300 v2',
+            }
+            with self.assertQueryBudget(20, f'register view (existing device, {size})'):
+                response = self.client.post(url, params)
+            self.assertEqual(response.status_code, 201)
+            del params['key']
+            params.update(
+                {'name': f'new-device-{size}', 'mac_address': f'00:11:22:ff:ff:{size}'}
+            )
+            with self.assertQueryBudget(17, f'register view (new device, {size})'):
+                response = self.client.post(url, params)
+            self.assertEqual(response.status_code, 201)
+
+    def test_device_admin_changelist(self):
+        self._create_admin()
+        self._login()
+        url = reverse(f'admin:{self.app_label}_device_changelist')
+        for size in self._get_fleet_sizes():
+            with self.assertQueryBudget(10, f'device admin changelist ({size})'):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['cl'].result_count, size)
+
+    def test_template_update_related_config_status(self):
+        template = self.fleet['templates'][0]
+        for size in self._get_fleet_sizes():
+            Config.objects.update(status='applied')
+            with self.assertQueryBudget(6, f'template related config status ({size})'):
+                template._update_related_config_status()
+            self.assertEqual(Config.objects.filter(status='modified').count(), size)
@@ -3,6 +3,7 @@ from unittest import mock
 
 from celery.exceptions import SoftTimeLimitExceeded
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.db import transaction
 from django.test import TestCase, TransactionTestCase
@@ -13,9 +14,13 @@ from openwisp_users.tests.utils import TestOrganizationMixin
 from openwisp_utils.tests import catch_signal
 
 from .. import settings as app_settings
-from ..signals import config_modified, config_status_changed
+from ..signals import config_modified, config_modified_bulk, config_status_changed
 from ..tasks import logger as task_logger
-from ..tasks import update_template_related_config_status
+from ..tasks import (
+    update_config_checksum,
+    update_config_checksums,
+    update_template_related_config_status,
+)
 from .utils import CreateConfigTemplateMixin, TestVpnX509Mixin
 
 Config = load_model('config', 'Config')
@@ -527,7 +532,9 @@ class TestTemplateTransaction(
             with catch_signal(config_status_changed) as handler:
                 t.config['interfaces'][0]['name'] = 'eth2'
                 t.full_clean()
-                with self.assertNumQueries(8):
+                # includes the recalculation of the checksum stored in the DB,
+                # related configs are processed in bulk
+                with self.assertNumQueries(12):
                     t.save()
                 c.refresh_from_db()
                 handler.assert_not_called()
@@ -679,3 +686,184 @@ class TestTemplateTransaction(
             template.save()
             mocked_error.assert_called_once()
         mocked_update_related_config_status.assert_called_once()
+
+    def test_related_config_status_chunks(self):
+        t = self._create_template()
+        configs = []
+        for i in range(3):
+            c = self._create_config(
+                device=self._create_device(
+                    name=f'test-{i}', mac_address=f'00:11:22:33:44:0{i}'
+                )
+            )
+            c.templates.add(t)
+            configs.append(c)
+        Config.objects.update(status='applied')
+        t.config['interfaces'][0]['name'] = 'eth1'
+        t.full_clean()
+
+        with mock.patch.object(app_settings, 'TEMPLATE_FANOUT_CHUNK_SIZE', 2):
+            with catch_signal(config_modified_bulk) as handler:
+                t.save()
+        self.assertEqual(handler.call_count, 2)
+        chunks = [call[1]['instances'] for call in handler.call_args_list]
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        self.assertEqual(
+            [config.pk for chunk in chunks for config in chunk],
+            sorted(config.pk for config in configs),
+        )
+        self.assertEqual(handler.call_args[1]['action'], 'related_template_changed')
+        self.assertEqual(Config.objects.filter(status='modified').count(), 3)
+        self.assertIsNone(t._get_related_config_status_cursor())
+        for c in configs:
+            c.refresh_from_db()
+            self.assertEqual(c.checksum_db, Config.objects.get(pk=c.pk).checksum)
+
+    def test_related_config_checksums_precomputed(self):
+        t = self._create_template()
+        configs = []
+        for i in range(3):
+            c = self._create_config(
+                device=self._create_device(
+                    name=f'test-{i}', mac_address=f'00:11:22:33:44:0{i}'
+                )
+            )
+            c.templates.add(t)
+            configs.append(c)
+        t.config['interfaces'][0]['name'] = 'eth1'
+        t.full_clean()
+
+        with self.subTest('checksums are recalculated in parallel chunks'):
+            with mock.patch.object(
+                app_settings, 'CHECKSUM_PRECOMPUTE_CHUNK_SIZE', 2
+            ), mock.patch.object(
+                update_config_checksums, 'run', wraps=update_config_checksums.run
+            ) as mocked_run:
+                t.save()
+            self.assertEqual(mocked_run.call_count, 2)
+            chunks = [call[0][0] for call in mocked_run.call_args_list]
+            self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+            for c in configs:
+                c.refresh_from_db()
+                checksum = Config.objects.get(pk=c.pk).checksum
+                self.assertEqual(c.checksum_db, checksum)
+
+        with self.subTest('checksums are cached'):
+            with self.assertNumQueries(0):
+                for c in configs:
+                    self.assertEqual(c.get_cached_checksum(), c.checksum_db)
+
+        with self.subTest('checksums already recalculated are skipped'):
+            with mock.patch.object(Config, 'update_checksum_db') as mocked_update:
+                update_config_checksums([str(c.pk) for c in configs])
+            mocked_update.assert_not_called()
+
+    def test_related_config_status_resume(self):
+        t = self._create_template()
+        configs = []
+        for i in range(3):
+            c = self._create_config(
+                device=self._create_device(
+                    name=f'test-{i}', mac_address=f'00:11:22:33:44:0{i}'
+                )
+            )
+            c.templates.add(t)
+            configs.append(c)
+        configs.sort(key=lambda config: config.pk)
+        Config.objects.update(status='applied')
+        t.refresh_from_db()
+        original_chunk = Template._update_related_config_status_chunk
+        calls = []
+
+        def interrupted_chunk(template, chunk):
+            # the time limit is hit while processing the second chunk
+            if calls:
+                raise SoftTimeLimitExceeded()
+            calls.append(chunk)
+            return original_chunk(template, chunk)
+
+        with self.subTest('interrupted execution is resumed in a new task'):
+            with mock.patch.object(app_settings, 'TEMPLATE_FANOUT_CHUNK_SIZE', 1):
+                with mock.patch.object(
+                    Template, '_update_related_config_status_chunk', interrupted_chunk
+                ):
+                    with mock.patch.object(
+                        update_template_related_config_status, 'delay'
+                    ) as mocked_delay:
+                        with mock.patch.object(task_logger, 'error') as mocked_error:
+                            update_template_related_config_status(t.pk)
+            mocked_delay.assert_called_once_with(t.pk)
+            mocked_error.assert_not_called()
+            self.assertEqual(t._get_related_config_status_cursor(), configs[0].pk)
+            statuses = [Config.objects.get(pk=c.pk).status for c in configs]
+            self.assertEqual(statuses, ['modified', 'applied', 'applied'])
+
+        with self.subTest('processed configs are skipped when resuming'):
+            with catch_signal(config_modified_bulk) as handler:
+                update_template_related_config_status(t.pk)
+            handler.assert_called_once()
+            self.assertEqual(
+                [config.pk for config in handler.call_args[1]['instances']],
+                [c.pk for c in configs[1:]],
+            )
+            self.assertEqual(Config.objects.filter(status='modified').count(), 3)
+            self.assertIsNone(t._get_related_config_status_cursor())
+
+        with self.subTest('progress of a previous change is ignored'):
+            cache_key = t._get_related_config_status_cursor_key()
+            cache.set(cache_key, {'modified': t.modified, 'last_pk': configs[0].pk})
+            self.assertEqual(t._get_related_config_status_cursor(), configs[0].pk)
+            t.config['interfaces'][0]['name'] = 'eth3'
+            t.full_clean()
+            t.save()
+            self.assertIsNone(t._get_related_config_status_cursor())
+            cache.set(cache_key, {'modified': t.modified, 'last_pk': configs[0].pk})
+            t.refresh_from_db()
+            t.config['interfaces'][0]['name'] = 'eth4'
+            t.full_clean()
+            with catch_signal(config_modified_bulk) as handler:
+                t.save()
+            handler.assert_called_once()
+            self.assertEqual(len(handler.call_args[1]['instances']), 3)
+            self.assertIsNone(t._get_related_config_status_cursor())
+
+    def test_checksum_db_updated(self):
+        t = self._create_template()
+        c = self._create_config(device=self._create_device(name='test-checksum'))
+
+        with self.subTest('checksum is stored when config is created'):
+            c.refresh_from_db()
+            self.assertEqual(c.checksum_db, Config.objects.get(pk=c.pk).checksum)
+            self.assertIsNotNone(c.checksum_updated)
+
+        with self.subTest('checksum is updated when templates change'):
+            old_checksum = c.checksum_db
+            c.templates.add(t)
+            c.refresh_from_db()
+            self.assertNotEqual(c.checksum_db, old_checksum)
+            self.assertEqual(c.checksum_db, Config.objects.get(pk=c.pk).checksum)
+
+        with self.subTest('checksum is updated when related templates change'):
+            old_checksum = c.checksum_db
+            t.config['interfaces'][0]['name'] = 'eth1'
+            t.full_clean()
+            t.save()
+            c.refresh_from_db()
+            self.assertNotEqual(c.checksum_db, old_checksum)
+            self.assertEqual(c.checksum_db, Config.objects.get(pk=c.pk).checksum)
+            self.assertEqual(c.get_cached_checksum(), c.checksum_db)
+
+        with self.subTest('checksum is updated when context changes'):
+            old_checksum = c.checksum_db
+            c.context = {'ifname': 'eth2'}
+            c.config = {'interfaces': [{'name': '{{ ifname }}', 'type': 'ethernet'}]}
+            c.full_clean()
+            c.save()
+            c.refresh_from_db()
+            self.assertNotEqual(c.checksum_db, old_checksum)
+            self.assertEqual(c.checksum_db, Config.objects.get(pk=c.pk).checksum)
+
+    @mock.patch.object(task_logger, 'warning')
+    def test_update_config_checksum_task_failure(self, mocked_warning):
+        update_config_checksum.delay(uuid.uuid4())
+        mocked_warning.assert_called_once()
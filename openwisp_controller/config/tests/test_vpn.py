@@ -1,3 +1,6 @@
+import os
+import subprocess
+from tempfile import TemporaryDirectory
 from unittest import mock
 
 from celery.exceptions import SoftTimeLimitExceeded
@@ -9,7 +12,8 @@ from openwisp_users.tests.utils import TestOrganizationMixin
 
 from ...vpn_backends import OpenVpn
 from .. import settings as app_settings
-from ..tasks import create_vpn_dh
+from ..ffdhe import FFDHE_GROUPS
+from ..tasks import create_vpn_client_cert, create_vpn_dh
 from .utils import CreateConfigTemplateMixin, TestVpnX509Mixin
 
 Config = load_model('config', 'Config')
@@ -244,6 +248,59 @@ class TestVpn(
         self.assertEqual(v.get_context(), expected)
         self.assertNotEqual(v.get_context(), app_settings.CONTEXT)
 
+    def test_config_vpn_context_cache(self):
+        org = self._get_org()
+        c = self._create_config(organization=org)
+        vpns = []
+        for i in range(3):
+            vpn = self._create_vpn(name=f'vpn{i}', host=f'vpn{i}.test.com')
+            template = self._create_template(
+                name=f'vpn{i}', type='vpn', vpn=vpn, auto_cert=True, config={}
+            )
+            c.templates.add(template)
+            vpns.append(vpn)
+        context = c.get_vpn_context()
+        for vpn in vpns:
+            client = c.vpnclient_set.get(vpn=vpn)
+            keys = vpn._get_auto_context_keys()
+            self.assertEqual(context[keys['ca_contents']], vpn.ca.certificate)
+            self.assertEqual(context[keys['cert_contents']], client.cert.certificate)
+            self.assertEqual(context[keys['key_contents']], client.cert.private_key)
+
+        with self.subTest('contexts are cached'):
+            with self.assertNumQueries(1):
+                self.assertEqual(c.get_vpn_context(), context)
+
+        with self.subTest('cache is invalidated when a certificate changes'):
+            client = c.vpnclient_set.get(vpn=vpns[0])
+            client.cert.renew()
+            keys = vpns[0]._get_auto_context_keys()
+            with self.assertNumQueries(2):
+                new_context = c.get_vpn_context()
+            self.assertEqual(
+                new_context[keys['cert_contents']], client.cert.certificate
+            )
+            self.assertNotEqual(
+                new_context[keys['cert_contents']], context[keys['cert_contents']]
+            )
+
+        with self.subTest('cache is invalidated when a CA changes'):
+            ca = vpns[1].ca
+            ca.renew()
+            keys = vpns[1]._get_auto_context_keys()
+            new_context = c.get_vpn_context()
+            self.assertEqual(new_context[keys['ca_contents']], ca.certificate)
+            self.assertNotEqual(
+                new_context[keys['ca_contents']], context[keys['ca_contents']]
+            )
+
+        with self.subTest('prefetched VPN clients'):
+            c = Config.objects.prefetch_related(
+                'vpnclient_set__vpn__ca', 'vpnclient_set__cert'
+            ).get(pk=c.pk)
+            with self.assertNumQueries(0):
+                self.assertEqual(c.get_vpn_context(), new_context)
+
     @mock.patch('openwisp_controller.config.base.vpn.AbstractVpn.dhparam')
     def test_dh(self, mocked_dhparam):
         mocked_dhparam.return_value = self._dh
@@ -415,7 +472,80 @@ class TestVpnTransaction(
     @mock.patch.object(Vpn, 'dhparam')
     def test_update_vpn_dh(self, dhparam):
         dhparam.return_value = self._dh
-        vpn = self._create_vpn(dh='')
+        with mock.patch('logging.Logger.info') as mocked_info:
+            vpn = self._create_vpn(dh='')
         vpn.refresh_from_db()
         self.assertNotEqual(vpn.dh, Vpn._placeholder_dh)
         dhparam.assert_called_once()
+        # the generation time is reported
+        self.assertIn('generated in', mocked_info.call_args[0][0])
+
+    @mock.patch.object(app_settings, 'VPN_DH_GROUP', 'ffdhe2048')
+    @mock.patch.object(create_vpn_dh, 'delay')
+    def test_vpn_dh_group(self, delay):
+        vpn = self._create_vpn(dh='')
+        vpn.refresh_from_db()
+        self.assertEqual(vpn.dh, FFDHE_GROUPS['ffdhe2048'])
+        delay.assert_not_called()
+        # the parameters are valid
+        with TemporaryDirectory() as path:
+            dh_path = os.path.join(path, 'dh.pem')
+            with open(dh_path, 'w') as f:
+                f.write(vpn.dh)
+            output = subprocess.check_output(
+                ['openssl', 'dhparam', '-in', dh_path, '-check', '-noout'],
+                stderr=subprocess.STDOUT,
+            )
+        self.assertIn(b'DH parameters appear to be ok', output)
+
+    @mock.patch.object(app_settings, 'VPN_CLIENT_CERT_ASYNC', True)
+    def test_vpn_client_cert_async(self):
+        vpn = self._create_vpn()
+        t = self._create_template(
+            name='vpn-test', type='vpn', vpn=vpn, auto_cert=True, config={}
+        )
+        c = self._create_config(organization=self._get_org())
+        c.set_status_applied()
+        cert_count = Cert.objects.count()
+        with mock.patch.object(create_vpn_client_cert, 'delay') as delay:
+            c.templates.add(t)
+        vpnclient = c.vpnclient_set.get()
+        delay.assert_called_once_with(vpnclient.pk)
+        self.assertIsNone(vpnclient.cert)
+        self.assertEqual(Cert.objects.count(), cert_count)
+        # the certificate is not included in the configuration yet
+        context_keys = vpn._get_auto_context_keys()
+        c = Config.objects.get(pk=c.pk)
+        self.assertNotIn(context_keys['cert_contents'], c.get_context())
+        checksum = c.checksum
+
+        create_vpn_client_cert.delay(vpnclient.pk)
+        vpnclient.refresh_from_db()
+        self.assertIsNotNone(vpnclient.cert)
+        self.assertEqual(vpnclient.cert.ca, vpn.ca)
+        self.assertEqual(vpnclient.cert.organization, c.device.organization)
+        c = Config.objects.get(pk=c.pk)
+        self.assertEqual(c.status, 'modified')
+        self.assertIn(context_keys['cert_contents'], c.get_context())
+        self.assertNotEqual(c.checksum, checksum)
+        self.assertEqual(c.get_cached_checksum(), c.checksum)
+
+        with self.subTest('certificate is issued only once'):
+            create_vpn_client_cert.delay(vpnclient.pk)
+            self.assertEqual(Cert.objects.count(), cert_count + 1)
+
+        with self.subTest('client without certificate is deleted'):
+            with mock.patch.object(create_vpn_client_cert, 'delay'):
+                c2 = self._create_config(
+                    device=self._create_device(
+                        name='test-async', mac_address='00:11:22:33:44:66'
+                    )
+                )
+                c2.templates.add(t)
+            c2.delete()
+            self.assertEqual(VpnClient.objects.count(), 1)
+
+        with self.subTest('client deleted before the certificate is issued'):
+            with mock.patch('logging.Logger.warning') as mocked_warning:
+                create_vpn_client_cert.delay(vpnclient.pk + 1000)
+            mocked_warning.assert_called_once()
@@ -3,9 +3,16 @@ test utilities shared among test classes
 these mixins are reused also in openwisp2
 change with care.
 """
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
 from unittest import mock
 from uuid import uuid4
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from swapper import load_model
 
 from ...pki.tests.utils import TestPkiMixin
@@ -17,6 +24,8 @@ Vpn = load_model('config', 'Vpn')
 Ca = load_model('django_x509', 'Ca')
 Cert = load_model('django_x509', 'Cert')
 
+logger = logging.getLogger(__name__)
+
 
 class CreateDeviceMixin(object):
     TEST_MAC_ADDRESS = '00:11:22:33:44:55'
@@ -144,3 +153,122 @@ class CreateConfigTemplateMixin(CreateTemplateMixin, CreateConfigMixin):
                 name='test-device', organization=kwargs.pop('organization')
             )
         return super()._create_config(**kwargs)
+
+
+def create_fleet(organization, devices=20, templates=5, vpns=2):
+    """
+    creates a realistic fleet of devices: each device uses
+    all the generic templates and the template of one of the VPNs
+    (the devices are distributed evenly among the VPNs);
+    the objects are created through the same save path used by
+    the admin and the API, returns a dict which can be extended
+    with ``add_fleet_devices``
+    """
+    fleet = {
+        'organization': organization,
+        'devices': [],
+        'templates': [],
+        'vpn_templates': [],
+    }
+    for i in range(templates):
+        template = Template(
+            name=f'template-{i}',
+            backend='netjsonconfig.OpenWrt',
+            config={'interfaces': [{'name': f'eth{i}', 'type': 'ethernet'}]},
+        )
+        template.full_clean()
+        template.save()
+        fleet['templates'].append(template)
+    for i in range(vpns):
+        ca = Ca(name=f'fleet-ca-{i}', key_length='512', digest='sha256')
+        ca.full_clean()
+        ca.save()
+        vpn = Vpn(
+            name=f'vpn-{i}',
+            host=f'vpn{i}.test.com',
+            ca=ca,
+            backend='openwisp_controller.vpn_backends.OpenVpn',
+            config=CreateVpnMixin._vpn_config,
+            dh=CreateVpnMixin._dh,
+        )
+        vpn.full_clean()
+        vpn.save()
+        # certificates are not needed to measure the queries
+        template = Template(
+            name=f'vpn-{i}',
+            type='vpn',
+            vpn=vpn,
+            auto_cert=False,
+            backend='netjsonconfig.OpenWrt',
+            config={},
+        )
+        template.full_clean()
+        template.save()
+        fleet['vpn_templates'].append(template)
+    add_fleet_devices(fleet, devices)
+    return fleet
+
+
+def add_fleet_devices(fleet, count):
+    """
+    adds ``count`` devices to ``fleet`` (see ``create_fleet``)
+    """
+    templates = fleet['templates']
+    vpn_templates = fleet['vpn_templates']
+    devices = []
+    for n in range(len(fleet['devices']), len(fleet['devices']) + count):
+        device = Device(
+            name=f'device-{n}',
+            mac_address=_get_fleet_mac(n),
+            organization=fleet['organization'],
+        )
+        device.full_clean()
+        device.save()
+        config = Config(
+            device=device, backend='netjsonconfig.OpenWrt', config={'general': {}}
+        )
+        config.full_clean()
+        config.save()
+        config.templates.add(*templates, vpn_templates[n % len(vpn_templates)])
+        devices.append(device)
+    fleet['devices'] += devices
+    return devices
+
+
+def _get_fleet_mac(n):
+    return '00:11:22:{0}'.format(':'.join(re.findall('..', f'{n:06x}')))
+
+
+class QueryBudgetMixin(object):
+    """
+    provides ``assertQueryBudget``, which fails if the
+    code in its block does not execute exactly ``budget``
+    queries and logs the wall-clock time of the block
+    """
+
+    # the repeated queries are grouped by their shape
+    # (literal values are replaced by placeholders)
+    _literal_regex = re.compile(r"'[^']*'|\b\d+\b")
+
+    @contextmanager
+    def assertQueryBudget(self, budget, label):
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        elapsed = time.perf_counter() - start
+        logger.info(f'{label}: {len(context)} queries in {elapsed:.3f}s')
+        if len(context) != budget:
+            self.fail(self._format_query_report(label, budget, context))
+
+    def _format_query_report(self, label, budget, context):
+        queries = [query['sql'] for query in context.captured_queries]
+        shapes = Counter(self._literal_regex.sub('?', sql) for sql in queries)
+        lines = [
+            f'{label}: {len(queries)} queries executed, the budget is {budget}',
+            'queries grouped by shape (most repeated first):',
+        ]
+        for shape, count in shapes.most_common():
+            lines.append(f'  {count}x {shape}')
+        lines.append('executed queries:')
+        lines += [f'  {i}. {sql}' for i, sql in enumerate(queries, 1)]
+        return '\n'.join(lines)
@@ -1,10 +1,25 @@
+import hashlib
+import json
 import logging
+import numbers
+from collections import OrderedDict, defaultdict
+from ipaddress import ip_address
 
 from django.conf.urls import url
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db.models import Q
-from django.http import Http404, HttpResponse
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import get_object_or_404 as base_get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from jsonschema import Draft4Validator, draft4_format_checker
+from jsonschema.exceptions import UnknownType
+from swapper import load_model
+
+from . import settings as app_settings
+from .exceptions import ChecksumNotReady
+from .tasks import flush_ip_updates
 
 logger = logging.getLogger(__name__)
 
@@ -31,24 +46,70 @@ class ControllerResponse(HttpResponse):
         self['X-Openwisp-Controller'] = 'true'
 
 
+class ControllerFileResponse(FileResponse):
+    """
+    extends ``django.http.FileResponse`` by adding a custom HTTP header
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self['X-Openwisp-Controller'] = 'true'
+
+
 def send_file(filename, contents):
     """
-    returns a ``ControllerResponse`` object with an attachment
+    returns a ``ControllerResponse`` object with an attachment;
+    if ``contents`` is a file object, the attachment is streamed
     """
-    response = ControllerResponse(contents, content_type='application/octet-stream')
+    if isinstance(contents, (bytes, str)):
+        response = ControllerResponse(contents, content_type='application/octet-stream')
+    else:
+        response = ControllerFileResponse(
+            contents, content_type='application/octet-stream'
+        )
     response['Content-Disposition'] = 'attachment; filename={0}'.format(filename)
     return response
 
 
+def send_archive(config):
+    """
+    returns a ``ControllerResponse`` which includes the configuration
+    tar.gz of ``config`` as attachment; the archive is streamed
+    from the archive store if supported (see ``get_archive_file``)
+    """
+    filename = '{0}.tar.gz'.format(config.name)
+    archive = config.get_archive_file()
+    if archive is None:
+        contents = config.get_archive()
+        checksum = hashlib.md5(contents).hexdigest()
+    else:
+        checksum, contents = archive
+    response = send_file(filename=filename, contents=contents)
+    response['ETag'] = quote_etag(checksum)
+    return response
+
+
 def send_device_config(config, request):
     """
     calls ``update_last_ip`` and returns a ``ControllerResponse``
-    which includes the configuration tar.gz as attachment
+    which includes the configuration tar.gz as attachment;
+    the checksum of the configuration is sent as ``ETag``
+    and if it matches the ``If-None-Match`` header of the
+    request, the configuration is not generated and
+    the response has status ``304 Not Modified``
     """
     update_last_ip(config.device, request)
-    return send_file(
-        filename='{0}.tar.gz'.format(config.name), contents=config.generate().getvalue()
-    )
+    if request.META.get('HTTP_IF_NONE_MATCH'):
+        try:
+            etag = quote_etag(config.get_cached_checksum())
+        except ChecksumNotReady:
+            return send_archive(config)
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            response['ETag'] = etag
+            response['X-Openwisp-Controller'] = 'true'
+            return response
+    return send_archive(config)
 
 
 def send_vpn_config(vpn, request):
@@ -64,6 +125,7 @@ def send_vpn_config(vpn, request):
 def update_last_ip(device, request):
     """
     updates ``last_ip`` if necessary
+    (the update is buffered if ``IP_UPDATE_BUFFER`` is enabled)
     """
     ip = request.META.get('REMOTE_ADDR')
     management_ip = request.GET.get('management_ip')
@@ -76,11 +138,154 @@ def update_last_ip(device, request):
         device.management_ip = management_ip
         update_fields.append('management_ip')
     if update_fields:
-        device.save(update_fields=update_fields)
+        if app_settings.IP_UPDATE_BUFFER:
+            buffer_ip_update(device)
+        else:
+            device.save(update_fields=update_fields)
 
     return bool(update_fields)
 
 
+_IP_BUFFER_PREFIX = 'openwisp_controller.ip_buffer'
+_IP_BUFFER_TIMEOUT = 60 * 60 * 24
+_IP_BUFFER_FLUSH_TIMEOUT = 60 * 20
+
+
+def _ip_buffer_key(suffix):
+    return f'{_IP_BUFFER_PREFIX}.{suffix}'
+
+
+def buffer_ip_update(device):
+    """
+    stores the addresses of ``device`` in the ip update buffer,
+    subsequent updates of the same device are coalesced until
+    ``flush_ip_update_buffer`` is called, which happens at most
+    ``IP_UPDATE_BUFFER_MAX_STALENESS`` seconds later
+    """
+    pk = device.pk.hex
+    cache.set(
+        _ip_buffer_key(f'device-{pk}'),
+        {'last_ip': device.last_ip, 'management_ip': device.management_ip},
+        _IP_BUFFER_TIMEOUT,
+    )
+    staleness = app_settings.IP_UPDATE_BUFFER_MAX_STALENESS
+    # the device is added to the queue only once per flush, the flag
+    # doesn't outlive the flush interval: if the slot of the device is
+    # lost (eg: evicted), the next update of the device is queued again
+    # (the flush ignores the devices which are queued more than once)
+    if cache.add(_ip_buffer_key(f'pending-{pk}'), True, staleness):
+        # the index may have been evicted from the cache,
+        # in that case the count of flushed slots restarts too
+        if cache.add(_ip_buffer_key('index'), 0, None):
+            cache.set(_ip_buffer_key('flushed'), 0, None)
+        slot = cache.incr(_ip_buffer_key('index'))
+        cache.set(_ip_buffer_key(f'slot-{slot}'), pk, _IP_BUFFER_TIMEOUT)
+    if cache.add(_ip_buffer_key('flush-scheduled'), True, staleness):
+        flush_ip_updates.apply_async(countdown=staleness)
+
+
+def flush_ip_update_buffer():
+    """
+    writes the buffered ip updates to the database with a bulk update,
+    then removes duplicated addresses with one update query per
+    organization, returns the number of updated devices or ``None``
+    if another flush is already running
+    """
+    if not cache.add(_ip_buffer_key('flush-running'), True, _IP_BUFFER_FLUSH_TIMEOUT):
+        return None
+    try:
+        # updates buffered from now on will schedule another flush
+        cache.delete(_ip_buffer_key('flush-scheduled'))
+        return _flush_ip_update_buffer()
+    finally:
+        cache.delete(_ip_buffer_key('flush-running'))
+
+
+def _flush_ip_update_buffer():
+    from .controller.views import DeviceChecksumView
+
+    index = cache.get(_ip_buffer_key('index'), 0)
+    flushed = cache.get(_ip_buffer_key('flushed'), 0)
+    # the index is never lower than the flushed count
+    # unless it has been evicted from the cache meanwhile
+    if flushed > index:
+        flushed = 0
+    if index <= flushed:
+        return 0
+    slot_keys = [_ip_buffer_key(f'slot-{n}') for n in range(flushed + 1, index + 1)]
+    slots = cache.get_many(slot_keys)
+    pks = list(OrderedDict.fromkeys(slots[key] for key in slot_keys if key in slots))
+    # updates received from now on are queued again
+    cache.delete_many([_ip_buffer_key(f'pending-{pk}') for pk in pks])
+    entries = cache.get_many([_ip_buffer_key(f'device-{pk}') for pk in pks])
+    cache.set(_ip_buffer_key('flushed'), index, None)
+    cache.delete_many(slot_keys)
+
+    Device = load_model('config', 'Device')
+    queryset = Device.objects.filter(pk__in=pks).only(
+        'pk', 'organization_id', 'last_ip', 'management_ip'
+    )
+    order = {pk: position for position, pk in enumerate(pks)}
+    devices = sorted(queryset, key=lambda device: order[device.pk.hex])
+    changed = []
+    for device in devices:
+        entry = entries.get(_ip_buffer_key(f'device-{device.pk.hex}'))
+        if entry is None or (
+            device.last_ip == entry['last_ip']
+            and device.management_ip == entry['management_ip']
+        ):
+            continue
+        device.last_ip = entry['last_ip']
+        device.management_ip = entry['management_ip']
+        changed.append(device)
+    if not changed:
+        return 0
+    Device.objects.bulk_update(changed, ['last_ip', 'management_ip'])
+    cleared = _remove_duplicated_ips(Device, changed)
+    for device in changed + cleared:
+        device.check_management_ip_changed()
+        DeviceChecksumView.invalidate_get_device_cache(instance=device)
+    logger.debug(f'flushed ip updates of {len(changed)} devices')
+    return len(changed)
+
+
+def _remove_duplicated_ips(Device, devices):
+    """
+    avoids that other devices of the same organization keep the
+    addresses of the updated ``devices``; the management IP is
+    always unique while the last IP is unique only if private
+    (see ``UpdateLastIpMixin``), when two of the updated devices
+    share an address, the most recent update wins;
+    returns the devices which were not among ``devices``
+    but whose addresses have been cleared
+    """
+    updated = {device.pk: device for device in devices}
+    owners = {'management_ip': defaultdict(dict), 'last_ip': defaultdict(dict)}
+    for device in devices:
+        if device.management_ip:
+            owners['management_ip'][device.organization_id][
+                device.management_ip
+            ] = device.pk
+        if device.last_ip and ip_address(device.last_ip).is_private:
+            owners['last_ip'][device.organization_id][device.last_ip] = device.pk
+    cleared = {}
+    for field, organizations in owners.items():
+        for organization_id, addresses in organizations.items():
+            queryset = Device.objects.filter(
+                organization_id=organization_id, **{f'{field}__in': list(addresses)}
+            ).exclude(pk__in=addresses.values())
+            dupes = list(queryset.only('pk', 'last_ip', 'management_ip'))
+            if not dupes:
+                continue
+            Device.objects.filter(pk__in=[dupe.pk for dupe in dupes]).update(
+                **{field: ''}
+            )
+            for dupe in dupes:
+                dupe = updated.get(dupe.pk) or cleared.setdefault(dupe.pk, dupe)
+                setattr(dupe, field, '')
+    return list(cleared.values())
+
+
 def forbid_unallowed(request, param_group, param, allowed_values=None):
     """
     checks for malformed requests - eg: missing parameters (HTTP 400)
@@ -176,6 +381,18 @@ def get_controller_urls(views_module):
             name='register_legacy',
         ),
     ]
+    # the views modules of third party apps
+    # may not implement the bulk checksum view
+    device_checksum_bulk = getattr(views_module, 'device_checksum_bulk', None)
+    if device_checksum_bulk:
+        urls.insert(
+            0,
+            url(
+                r'^controller/device/checksum/$',
+                device_checksum_bulk,
+                name='device_checksum_bulk',
+            ),
+        )
     return urls
 
 
@@ -199,3 +416,68 @@ def get_default_templates_queryset(
     if backend:
         queryset = queryset.filter(backend=backend)
     return queryset
+
+
+_TYPE_CHECKS = {
+    'array': lambda instance: isinstance(instance, list),
+    'boolean': lambda instance: isinstance(instance, bool),
+    'integer': lambda instance: (
+        isinstance(instance, int) and not isinstance(instance, bool)
+    ),
+    'null': lambda instance: instance is None,
+    'number': lambda instance: (
+        isinstance(instance, numbers.Number) and not isinstance(instance, bool)
+    ),
+    'object': lambda instance: isinstance(instance, dict),
+    'string': lambda instance: isinstance(instance, str),
+}
+
+
+class BackendValidator(Draft4Validator):
+    """
+    JSON-schema validator used for netjsonconfig backends, it performs
+    the same checks of ``Draft4Validator`` but the JSON types are
+    checked with plain lookups, which is noticeably faster
+    on the large schemas of netjsonconfig
+    """
+
+    def is_type(self, instance, type):
+        try:
+            check = _TYPE_CHECKS[type]
+        except KeyError:
+            raise UnknownType(type, instance, self.schema)
+        return check(instance)
+
+
+_backend_validators = {}
+
+
+def get_backend_validator(backend_class):
+    """
+    returns the validator of the schema of ``backend_class``,
+    validators are built once per backend and reused
+    """
+    validator = _backend_validators.get(backend_class)
+    if validator is None:
+        validator = BackendValidator(
+            backend_class.schema, format_checker=draft4_format_checker
+        )
+        _backend_validators[backend_class] = validator
+    return validator
+
+
+def sanitize_config(value):
+    """
+    returns a copy of ``value`` which contains only JSON
+    types (eg: ``OrderedDict`` is converted to ``dict``,
+    tuples are converted to lists, keys are converted to strings),
+    used to avoid cluttering validation errors
+    """
+    if isinstance(value, dict):
+        return {
+            key if isinstance(key, str) else json.dumps(key): sanitize_config(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [sanitize_config(item) for item in value]
+    return value
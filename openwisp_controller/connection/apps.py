@@ -1,4 +1,3 @@
-from celery.task.control import inspect
 from django.apps import AppConfig
 from django.db import transaction
 from django.db.models.signals import post_save
@@ -7,11 +6,9 @@ from openwisp_notifications.signals import notify
 from openwisp_notifications.types import register_notification_type
 from swapper import load_model
 
-from ..config.signals import config_modified
+from ..config.signals import config_modified, config_modified_bulk, devices_imported
 from .signals import is_working_changed
 
-_TASK_NAME = 'openwisp_controller.connection.tasks.update_config'
-
 
 class ConnectionConfig(AppConfig):
     name = 'openwisp_controller.connection'
@@ -28,6 +25,10 @@ class ConnectionConfig(AppConfig):
         config_modified.connect(
             self.config_modified_receiver, dispatch_uid='connection.update_config'
         )
+        config_modified_bulk.connect(
+            self.config_modified_bulk_receiver,
+            dispatch_uid='connection.update_config_bulk',
+        )
         Config = load_model('config', 'Config')
         Credentials = load_model('connection', 'Credentials')
         post_save.connect(
@@ -35,6 +36,10 @@ class ConnectionConfig(AppConfig):
             sender=Config,
             dispatch_uid='connection.auto_add_credentials',
         )
+        devices_imported.connect(
+            Credentials.auto_add_credentials_to_devices,
+            dispatch_uid='connection.auto_add_credentials_bulk',
+        )
         is_working_changed.connect(
             self.is_working_changed_receiver,
             sender=load_model('connection', 'DeviceConnection'),
@@ -43,6 +48,9 @@ class ConnectionConfig(AppConfig):
 
     @classmethod
     def config_modified_receiver(cls, **kwargs):
+        # handled in bulk by config_modified_bulk_receiver
+        if kwargs.get('action') == 'related_template_changed':
+            return
         device = kwargs['device']
         conn_count = device.deviceconnection_set.count()
         # if device has no connection specified stop here
@@ -50,29 +58,29 @@ class ConnectionConfig(AppConfig):
             return
         transaction.on_commit(lambda: cls._launch_update_config(device.pk))
 
+    @classmethod
+    def config_modified_bulk_receiver(cls, instances, **kwargs):
+        DeviceConnection = load_model('connection', 'DeviceConnection')
+        device_pks = set(
+            DeviceConnection.objects.filter(
+                device_id__in=[config.device_id for config in instances]
+            ).values_list('device_id', flat=True)
+        )
+        for device_pk in device_pks:
+            transaction.on_commit(
+                lambda device_pk=device_pk: cls._launch_update_config(device_pk)
+            )
+
     @classmethod
     def _launch_update_config(cls, device_pk):
         """
         Calls the background task update_config only if
-        no other tasks are running for the same device
+        no other tasks are queued or running for the same
+        device (see ``tasks.launch_update_config``)
         """
-        if cls._is_update_in_progress(device_pk):
-            return
-        from .tasks import update_config
+        from .tasks import launch_update_config
 
-        update_config.delay(device_pk)
-
-    @classmethod
-    def _is_update_in_progress(cls, device_pk):
-        active = inspect().active()
-        if not active:
-            return False
-        # check if there's any other running task before adding it
-        for task_list in active.values():
-            for task in task_list:
-                if task['name'] == _TASK_NAME and str(device_pk) in task['args']:
-                    return True
-        return False
+        launch_update_config(device_pk)
 
     @classmethod
     def is_working_changed_receiver(
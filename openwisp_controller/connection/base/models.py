@@ -16,6 +16,7 @@ from openwisp_utils.base import TimeStampedEditableModel
 
 from ...base import ShareableOrgMixinUniqueName
 from .. import settings as app_settings
+from ..connectors.keys import invalidate_private_keys
 from ..signals import is_working_changed
 
 logger = logging.getLogger(__name__)
@@ -54,11 +55,20 @@ class ConnectorMixin(object):
         connector = self._get_connector()
         return import_string(connector)
 
+    def get_credentials_pk(self):
+        return None
+
+    def get_device_id(self):
+        return None
+
     @cached_property
     def connector_instance(self):
-        return self.connector_class(
+        connector = self.connector_class(
             params=self.get_params(), addresses=self.get_addresses()
         )
+        connector.credentials_pk = self.get_credentials_pk()
+        connector.device_id = self.get_device_id()
+        return connector
 
 
 class AbstractCredentials(ConnectorMixin, ShareableOrgMixinUniqueName, BaseModel):
@@ -101,8 +111,19 @@ class AbstractCredentials(ConnectorMixin, ShareableOrgMixinUniqueName, BaseModel
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
+        # the private key may have changed
+        invalidate_private_keys(self.pk)
         self.auto_add_to_devices()
 
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        invalidate_private_keys(pk)
+        return result
+
+    def get_credentials_pk(self):
+        return self.pk
+
     def auto_add_to_devices(self):
         """
         When ``auto_add`` is ``True``, adds the credentials
@@ -151,6 +172,36 @@ class AbstractCredentials(ConnectorMixin, ShareableOrgMixinUniqueName, BaseModel
             conn.full_clean()
             conn.save()
 
+    @classmethod
+    def auto_add_credentials_to_devices(cls, instances, organization, **kwargs):
+        """
+        Adds relevant credentials as ``DeviceConnection`` objects
+        to devices created in bulk, this is called from
+        a receiver of the ``devices_imported`` signal
+        """
+        if not instances:
+            return
+        conditions = models.Q(organization=organization) | models.Q(organization=None)
+        credentials = cls.objects.filter(conditions).filter(auto_add=True)
+        DeviceConnection = load_model('connection', 'DeviceConnection')
+        connections = []
+        for cred in credentials:
+            # the validation gives the same result for each device
+            # of the organization, hence only the first one is validated
+            conn = DeviceConnection(device=instances[0], credentials=cred, enabled=True)
+            conn.full_clean()
+            connections.append(conn)
+            for device in instances[1:]:
+                connections.append(
+                    DeviceConnection(
+                        device=device,
+                        credentials=cred,
+                        enabled=True,
+                        update_strategy=conn.update_strategy,
+                    )
+                )
+        DeviceConnection.objects.bulk_create(connections)
+
 
 class AbstractDeviceConnection(ConnectorMixin, TimeStampedEditableModel):
     _connector_field = 'update_strategy'
@@ -244,6 +295,12 @@ class AbstractDeviceConnection(ConnectorMixin, TimeStampedEditableModel):
             address_list.append(self.device.last_ip)
         return address_list
 
+    def get_credentials_pk(self):
+        return self.credentials_id
+
+    def get_device_id(self):
+        return self.device_id
+
     def get_params(self):
         params = self.credentials.params.copy()
         params.update(self.params)
@@ -0,0 +1,59 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from io import StringIO
+
+import paramiko
+
+# supported private key types, in the order in which they're tried
+PRIVATE_KEY_CLASSES = (paramiko.RSAKey, paramiko.Ed25519Key, paramiko.ECDSAKey)
+
+# parsed private keys, indexed by credentials PK and content hash
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_MAX_SIZE = 1000
+
+
+def parse_private_key(key):
+    """
+    parses a private key in PEM (or OpenSSH) format,
+    RSA, Ed25519 and ECDSA keys are supported
+    """
+    errors = []
+    for key_class in PRIVATE_KEY_CLASSES:
+        try:
+            return key_class.from_private_key(StringIO(key))
+        except (paramiko.SSHException, ValueError) as e:
+            errors.append(f'{key_class.__name__}: {e}')
+    raise paramiko.SSHException(
+        'unsupported or invalid private key ({0})'.format('; '.join(errors))
+    )
+
+
+def get_private_key(key, credentials_pk=None):
+    """
+    returns the parsed private key, which is cached in
+    memory so that the same key is not parsed again
+    for each device which uses the same credentials
+    """
+    cache_key = (credentials_pk, hashlib.sha256(key.encode()).hexdigest())
+    with _cache_lock:
+        pkey = _cache.get(cache_key)
+        if pkey is not None:
+            _cache.move_to_end(cache_key)
+            return pkey
+    pkey = parse_private_key(key)
+    with _cache_lock:
+        _cache[cache_key] = pkey
+        while len(_cache) > _CACHE_MAX_SIZE:
+            _cache.popitem(last=False)
+    return pkey
+
+
+def invalidate_private_keys(credentials_pk):
+    """
+    removes the cached private keys of the specified credentials
+    """
+    with _cache_lock:
+        for cache_key in [k for k in _cache.keys() if k[0] == credentials_pk]:
+            del _cache[cache_key]
@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+
+from .. import settings as app_settings
+
+logger = logging.getLogger(__name__)
+
+
+class PooledConnection(object):
+    """
+    authenticated SSH client kept in ``SshConnectionPool``
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+    def is_usable(self, now):
+        """
+        returns ``False`` if the connection is closed, older
+        than ``SSH_POOL_MAX_AGE`` or idle since longer
+        than ``SSH_POOL_IDLE_TIMEOUT``
+        """
+        transport = self.client.get_transport()
+        return (
+            transport is not None
+            and transport.is_active()
+            and now - self.created < app_settings.SSH_POOL_MAX_AGE
+            and now - self.last_used < app_settings.SSH_POOL_IDLE_TIMEOUT
+        )
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception as e:  # pragma: no cover
+            logger.warning(f'error while closing pooled SSH connection: {e}')
+
+
+class SshConnectionPool(object):
+    """
+    thread safe pool of idle authenticated SSH connections, a connection
+    is checked out with ``acquire`` (so that it's never used by more than
+    one connector at the same time) and given back with ``release``;
+    connections which are closed or expired are evicted lazily
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    def acquire(self, key):
+        """
+        returns an idle usable connection for ``key``
+        or ``None`` if there aren't any
+        """
+        with self._lock:
+            self._evict()
+            connections = self._idle.get(key)
+            if not connections:
+                return None
+            connection = connections.pop()
+            if not connections:
+                del self._idle[key]
+            return connection
+
+    def release(self, key, connection):
+        """
+        gives back ``connection`` to the pool (the connection
+        is closed if it's not usable anymore)
+        """
+        connection.last_used = time.monotonic()
+        if not connection.is_usable(connection.last_used):
+            connection.close()
+            return
+        with self._lock:
+            self._idle.setdefault(key, []).append(connection)
+            self._evict()
+
+    def clear(self):
+        """
+        closes all the idle connections
+        """
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle = {}
+
+    def __len__(self):
+        return sum(len(connections) for connections in self._idle.values())
+
+    def _evict(self):
+        now = time.monotonic()
+        for key, connections in list(self._idle.items()):
+            usable = []
+            for connection in connections:
+                if connection.is_usable(now):
+                    usable.append(connection)
+                else:
+                    connection.close()
+            if usable:
+                self._idle[key] = usable
+            else:
+                del self._idle[key]
+
+
+# the SSH connections can't be shared among processes,
+# each process (eg: celery worker) has its own pool
+ssh_pool = SshConnectionPool()
@@ -1,6 +1,6 @@
 import logging
 import socket
-from io import BytesIO, StringIO
+from io import BytesIO
 
 import paramiko
 from django.utils.functional import cached_property
@@ -10,6 +10,8 @@ from scp import SCPClient
 
 from .. import settings as app_settings
 from .exceptions import CommandFailedException
+from .keys import get_private_key
+from .pool import PooledConnection, ssh_pool
 
 logger = logging.getLogger(__name__)
 
@@ -53,11 +55,23 @@ class Ssh(object):
         ],
     }
 
+    # set by ``ConnectorMixin.connector_instance``, used to cache
+    # the parsed private key and as key of the connection pool
+    credentials_pk = None
+    device_id = None
+
     def __init__(self, params, addresses):
         self._params = params
         self.addresses = addresses
-        self.shell = paramiko.SSHClient()
-        self.shell.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.shell = self._get_client()
+        self._pooled_connection = None
+        # whether the connection has been taken from the pool
+        self._reused = False
+
+    def _get_client(self):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        return client
 
     @classmethod
     def validate(cls, params):
@@ -73,11 +87,55 @@ class Ssh(object):
     def params(self):
         params = self._params.copy()
         if 'key' in params:
-            key_fileobj = StringIO(params.pop('key'))
-            params['pkey'] = paramiko.RSAKey.from_private_key(key_fileobj)
+            params['pkey'] = get_private_key(params.pop('key'), self.credentials_pk)
         return params
 
+    @property
+    def pool_key(self):
+        """
+        key of the connections of the device in the connection pool,
+        ``None`` if the connector is not bound to a device connection
+        (in which case the connection is not pooled)
+        """
+        if self.device_id is None or self.credentials_pk is None:
+            return None
+        return (self.device_id, self.credentials_pk)
+
+    @property
+    def _use_pool(self):
+        return app_settings.SSH_CONNECTION_POOL and self.pool_key is not None
+
     def connect(self):
+        self._reused = False
+        if self._use_pool:
+            pooled_connection = ssh_pool.acquire(self.pool_key)
+            if pooled_connection:
+                logger.debug('Reusing pooled SSH connection')
+                self.shell = pooled_connection.client
+                self._pooled_connection = pooled_connection
+                self._reused = True
+                return
+        self._open()
+
+    def _open(self):
+        self._connect()
+        if self._use_pool:
+            transport = self.shell.get_transport()
+            transport.set_keepalive(app_settings.SSH_POOL_KEEPALIVE)
+            self._pooled_connection = PooledConnection(self.shell)
+
+    def _reconnect(self):
+        """
+        discards the pooled connection in use, which
+        is not working anymore, and opens a new one
+        """
+        self._pooled_connection.close()
+        self._pooled_connection = None
+        self._reused = False
+        self.shell = self._get_client()
+        self._open()
+
+    def _connect(self):
         success = False
         exception = None
         addresses = self.addresses
@@ -90,7 +148,7 @@ class Ssh(object):
                     auth_timeout=app_settings.SSH_AUTH_TIMEOUT,
                     banner_timeout=app_settings.SSH_BANNER_TIMEOUT,
                     timeout=app_settings.SSH_CONNECTION_TIMEOUT,
-                    **self.params
+                    **self.params,
                 )
             except Exception as e:
                 exception = e
@@ -101,6 +159,19 @@ class Ssh(object):
             raise exception
 
     def disconnect(self):
+        """
+        closes the connection, or gives it back to
+        the connection pool if the pool is enabled
+        """
+        pooled_connection = self._pooled_connection
+        self._reused = False
+        if pooled_connection and self._use_pool:
+            self._pooled_connection = None
+            # the pooled client may be used by other connectors from now on
+            self.shell = self._get_client()
+            ssh_pool.release(self.pool_key, pooled_connection)
+            return
+        self._pooled_connection = None
         self.shell.close()
 
     def exec_command(
@@ -117,6 +188,8 @@ class Ssh(object):
         - logs standard error
         - aborts on exceptions
         - raises socket.timeout exceptions
+        - retries once on a new connection if the
+          connection taken from the pool is dead
         """
         logger.info('Executing command: {0}'.format(command))
         # execute commmand
@@ -128,8 +201,17 @@ class Ssh(object):
             raise socket.timeout()
         # any other exception will abort the operation
         except Exception as e:
-            logger.exception(e)
-            raise e
+            if not self._reused:
+                logger.exception(e)
+                raise e
+            logger.info(f'Pooled SSH connection not working ({e}), reconnecting')
+            self._reconnect()
+            return self.exec_command(
+                command,
+                timeout=timeout,
+                exit_codes=exit_codes,
+                raise_unexpected_exit=raise_unexpected_exit,
+            )
         # store command exit status
         exit_status = stdout.channel.recv_exit_status()
         # log standard output
@@ -0,0 +1,221 @@
+import logging
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.db import transaction
+from django.utils import timezone
+from swapper import load_model
+
+from . import settings as app_settings
+from .tasks import acquire_update_config_lock, release_update_config_lock
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigPusher(object):
+    """
+    pushes the configuration to many devices concurrently
+    (see ``bulk_update_config``)
+    """
+
+    def __init__(self, max_workers=None, max_workers_per_org=None, progress=None):
+        self.device_connection_model = load_model('connection', 'DeviceConnection')
+        self.config_model = load_model('config', 'Config')
+        self.max_workers = max_workers or app_settings.BULK_UPDATE_MAX_WORKERS
+        self.max_workers_per_org = (
+            max_workers_per_org or app_settings.BULK_UPDATE_MAX_WORKERS_PER_ORG
+        )
+        self.progress = progress
+        self.stats = Counter()
+
+    def get_connections(self, devices):
+        """
+        returns the first enabled connection of each
+        device which can be updated (like the
+        ``update_config`` background task does)
+        """
+        queryset = (
+            self.device_connection_model.objects.filter(
+                device__in=devices, device__config__isnull=False, enabled=True
+            )
+            .select_related('device__config', 'credentials')
+            .order_by('device_id', 'pk')
+        )
+        connections = OrderedDict()
+        for connection in queryset:
+            device = connection.device
+            if device.pk in connections or not device.can_be_updated():
+                continue
+            connections[device.pk] = connection
+        return list(connections.values())
+
+    def update_config(self, connection):
+        """
+        executed in the worker threads: connects to the device and
+        launches the update strategy, the database is not accessed;
+        returns the values of ``is_working``, ``failure_reason``,
+        ``last_attempt`` and whether the update succeeded
+        """
+        connector = connection.connector_instance
+        try:
+            connector.connect()
+        except Exception as e:
+            return False, str(e), timezone.now(), False
+        last_attempt = timezone.now()
+        try:
+            connector.update_config()
+        except Exception as e:
+            logger.exception(e)
+            return True, '', last_attempt, False
+        finally:
+            connector.disconnect()
+        return True, '', last_attempt, True
+
+    def _get_stats(self, start):
+        elapsed = time.perf_counter() - start
+        stats = dict(self.stats)
+        stats['elapsed'] = elapsed
+        stats['throughput'] = stats['completed'] / elapsed if elapsed else 0
+        return stats
+
+    def _record(self, connection, result):
+        (
+            connection.is_working,
+            connection.failure_reason,
+            connection.last_attempt,
+            updated,
+        ) = result
+        self.stats['completed'] += 1
+        if updated:
+            self.stats['updated'] += 1
+        elif connection.is_working:
+            self.stats['failed'] += 1
+        else:
+            self.stats['unreachable'] += 1
+        return updated
+
+    def run(self, connections):
+        """
+        updates the devices of ``connections`` using a pool of
+        ``max_workers`` threads, at most ``max_workers_per_org``
+        devices of the same organization are updated at the same time;
+        each device is updated while holding its ``update_config`` lock
+        (see ``tasks.launch_update_config``), the devices which are
+        being updated by the ``update_config`` task are skipped
+        """
+        queues = OrderedDict()
+        for connection in connections:
+            org_id = connection.device.organization_id
+            queues.setdefault(org_id, deque()).append(connection)
+            # the connectors are instantiated in the main thread
+            connection.connector_instance
+        self.stats = Counter(
+            total=len(connections),
+            completed=0,
+            updated=0,
+            failed=0,
+            unreachable=0,
+            skipped=0,
+        )
+        running = {}
+        org_running = Counter()
+        processed = []
+        updated = []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while queues or running:
+                for org_id, queue in list(queues.items()):
+                    while (
+                        queue
+                        and len(running) < self.max_workers
+                        and org_running[org_id] < self.max_workers_per_org
+                    ):
+                        connection = queue.popleft()
+                        if not acquire_update_config_lock(connection.device_id):
+                            self.stats['skipped'] += 1
+                            continue
+                        future = executor.submit(self.update_config, connection)
+                        running[future] = connection
+                        org_running[org_id] += 1
+                    if not queue:
+                        del queues[org_id]
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    connection = running.pop(future)
+                    org_running[connection.device.organization_id] -= 1
+                    processed.append(connection)
+                    if self._record(connection, future.result()):
+                        updated.append(connection.device.config)
+                    # launches the updates of the modifications
+                    # received while the device was being updated
+                    release_update_config_lock(connection.device_id)
+                    if self.progress:
+                        self.progress(self._get_stats(start))
+        self.save(processed, updated)
+        stats = self._get_stats(start)
+        logger.info(
+            'bulk update of {total} devices completed in {elapsed:.2f}s '
+            '({throughput:.2f} devices/s), updated: {updated}, '
+            'failed: {failed}, unreachable: {unreachable}, '
+            'skipped: {skipped}'.format(**stats)
+        )
+        return stats
+
+    def save(self, connections, configs):
+        """
+        stores the outcome of the connection attempts in bulk
+        (only ``connections`` which have been processed must be passed,
+        the skipped ones may be being updated by the ``update_config`` task)
+        and flags the configurations which have been updated as applied,
+        sending the related signals; configurations whose status has
+        changed during the push (eg: modified again) are left untouched
+        """
+        self.device_connection_model.objects.bulk_update(
+            connections, ['is_working', 'failure_reason', 'last_attempt']
+        )
+        for connection in connections:
+            if connection.is_working != connection._initial_is_working:
+                connection.send_is_working_changed_signal()
+            connection._initial_is_working = connection.is_working
+        groups = OrderedDict()
+        for config in configs:
+            groups.setdefault(config.status, []).append(config)
+        applied = set()
+        for status, group in groups.items():
+            with transaction.atomic():
+                queryset = self.config_model.objects.filter(
+                    pk__in=[config.pk for config in group], status=status
+                )
+                pks = list(queryset.select_for_update().values_list('pk', flat=True))
+                self.config_model.objects.filter(pk__in=pks).update(status='applied')
+            applied.update(pks)
+        for config in configs:
+            if config.pk not in applied:
+                continue
+            config.status = 'applied'
+            config._send_config_status_changed_signal()
+
+
+def bulk_update_config(
+    devices, max_workers=None, max_workers_per_org=None, progress=None
+):
+    """
+    pushes the configuration to the ``devices`` (queryset) which can be
+    updated concurrently, using a pool of ``max_workers`` threads and
+    updating at most ``max_workers_per_org`` devices of the same
+    organization at the same time; ``progress`` is called with the
+    current statistics each time a device is processed;
+    returns the statistics of the operation (``total``, ``completed``,
+    ``updated``, ``failed``, ``unreachable``, ``skipped``, ``elapsed``,
+    ``throughput``), devices which are being updated by the
+    ``update_config`` task are skipped
+    """
+    pusher = ConfigPusher(
+        max_workers=max_workers,
+        max_workers_per_org=max_workers_per_org,
+        progress=progress,
+    )
+    return pusher.run(pusher.get_connections(devices))
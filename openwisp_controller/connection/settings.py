@@ -29,6 +29,18 @@ SSH_AUTH_TIMEOUT = getattr(settings, 'OPENWISP_SSH_AUTH_TIMEOUT', 2)
 SSH_BANNER_TIMEOUT = getattr(settings, 'OPENWISP_SSH_BANNER_TIMEOUT', 60)
 SSH_COMMAND_TIMEOUT = getattr(settings, 'OPENWISP_SSH_COMMAND_TIMEOUT', 30)
 SSH_CONNECTION_TIMEOUT = getattr(settings, 'OPENWISP_SSH_CONNECTION_TIMEOUT', 5)
+SSH_CONNECTION_POOL = getattr(settings, 'OPENWISP_SSH_CONNECTION_POOL', False)
+SSH_POOL_IDLE_TIMEOUT = getattr(settings, 'OPENWISP_SSH_POOL_IDLE_TIMEOUT', 60)
+SSH_POOL_MAX_AGE = getattr(settings, 'OPENWISP_SSH_POOL_MAX_AGE', 600)
+SSH_POOL_KEEPALIVE = getattr(settings, 'OPENWISP_SSH_POOL_KEEPALIVE', 15)
+UPDATE_CONFIG_DEBOUNCE = getattr(settings, 'OPENWISP_UPDATE_CONFIG_DEBOUNCE', 2)
+UPDATE_CONFIG_LOCK_TIMEOUT = getattr(
+    settings, 'OPENWISP_UPDATE_CONFIG_LOCK_TIMEOUT', 600
+)
+BULK_UPDATE_MAX_WORKERS = getattr(settings, 'OPENWISP_BULK_UPDATE_MAX_WORKERS', 20)
+BULK_UPDATE_MAX_WORKERS_PER_ORG = getattr(
+    settings, 'OPENWISP_BULK_UPDATE_MAX_WORKERS_PER_ORG', 10
+)
 
 # this may get overridden by openwisp-monitoring
 UPDATE_CONFIG_MODEL = getattr(settings, 'OPENWISP_UPDATE_CONFIG_MODEL', 'config.Device')
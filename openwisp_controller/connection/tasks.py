@@ -3,6 +3,7 @@ import time
 
 import swapper
 from celery import shared_task
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 
 from . import settings as app_settings
@@ -10,16 +11,115 @@ from . import settings as app_settings
 logger = logging.getLogger(__name__)
 
 
+def _get_update_config_cache_key(device_id, suffix):
+    return f'openwisp_controller.connection.update_config.{device_id}.{suffix}'
+
+
+def acquire_update_config_lock(device_id):
+    """
+    Acquires the per-device lock used by ``launch_update_config``
+    without scheduling the ``update_config`` task (eg: the configuration
+    is pushed by ``openwisp_controller.connection.push``), returns
+    ``False`` if an update of the device is already queued or running;
+    the lock must be released with ``release_update_config_lock``
+    """
+    return cache.add(
+        _get_update_config_cache_key(device_id, 'lock'),
+        True,
+        app_settings.UPDATE_CONFIG_LOCK_TIMEOUT,
+    )
+
+
+def launch_update_config(device_id):
+    """
+    Schedules the ``update_config`` task of a device after the
+    debounce delay unless another one is already queued or running
+    for the same device (per-device lock), in which case:
+        * if the task has not started yet, it's postponed
+          (its deadline is extended by the debounce delay)
+        * the device is flagged as pending: the modifications received
+          while updating it are coalesced into one more update
+          which is launched when the lock is released
+    """
+    timeout = app_settings.UPDATE_CONFIG_LOCK_TIMEOUT
+    deadline = time.time() + app_settings.UPDATE_CONFIG_DEBOUNCE
+    lock_key = _get_update_config_cache_key(device_id, 'lock')
+    deadline_key = _get_update_config_cache_key(device_id, 'deadline')
+    if acquire_update_config_lock(device_id):
+        cache.set(deadline_key, deadline, timeout)
+        _schedule_update_config(device_id, deadline)
+        return True
+    cache.set(_get_update_config_cache_key(device_id, 'pending'), True, timeout)
+    # the lock may have been released after the first attempt but
+    # before the device was flagged as pending, in which case nobody
+    # would launch the pending update: the lock is acquired again
+    if acquire_update_config_lock(device_id):
+        cache.set(deadline_key, deadline, timeout)
+        _schedule_update_config(device_id, deadline)
+        return True
+    if cache.get(deadline_key):
+        cache.set(deadline_key, deadline, timeout)
+        # the lock must not expire while the task is postponed,
+        # otherwise another task could be launched meanwhile
+        cache.touch(lock_key, timeout)
+    return False
+
+
+def _schedule_update_config(device_id, deadline):
+    update_config.apply_async(
+        args=[device_id],
+        kwargs={'deadline': deadline},
+        countdown=max(deadline - time.time(), 0),
+    )
+
+
+def release_update_config_lock(device_id):
+    """
+    Releases the lock acquired by ``launch_update_config``
+    and launches the pending update of the device, if any
+    """
+    cache.delete_many(
+        [
+            _get_update_config_cache_key(device_id, 'lock'),
+            _get_update_config_cache_key(device_id, 'deadline'),
+        ]
+    )
+    pending_key = _get_update_config_cache_key(device_id, 'pending')
+    if cache.get(pending_key):
+        cache.delete(pending_key)
+        launch_update_config(device_id)
+
+
 @shared_task
-def update_config(device_id):
+def update_config(device_id, deadline=None):
     """
     Launches the ``update_config()`` operation
-    of a specific device in the background
+    of a specific device in the background;
+    ``deadline`` is the time the task has been scheduled for
+    by ``launch_update_config``: if the device has been modified
+    again in the meantime the task is postponed to the new deadline
     """
+    if deadline is not None:
+        deadline_key = _get_update_config_cache_key(device_id, 'deadline')
+        current_deadline = cache.get(deadline_key)
+        if current_deadline and current_deadline > deadline:
+            _schedule_update_config(device_id, current_deadline)
+            return
+    try:
+        _update_config(device_id)
+    finally:
+        release_update_config_lock(device_id)
+
+
+def _update_config(device_id):
     Device = swapper.load_model(*swapper.split(app_settings.UPDATE_CONFIG_MODEL))
-    # wait for the saving operations of this device to complete
-    # (there may be multiple ones happening at the same time)
-    time.sleep(2)
+    # the modifications received up to now are applied by this execution
+    cache.delete_many(
+        [
+            _get_update_config_cache_key(device_id, 'deadline'),
+            _get_update_config_cache_key(device_id, 'pending'),
+        ]
+    )
     try:
         device = Device.objects.select_related('config').get(pk=device_id)
         # abort operation if device shouldn't be updated
@@ -34,3 +134,15 @@ def update_config(device_id):
     if conn:
         logger.info(f'Updating {device} (pk: {device_id})')
         conn.update_config()
+
+
+@shared_task
+def bulk_update_config(device_ids):
+    """
+    Pushes the configuration to many devices concurrently
+    (see ``openwisp_controller.connection.push``)
+    """
+    from .push import bulk_update_config
+
+    Device = swapper.load_model(*swapper.split(app_settings.UPDATE_CONFIG_MODEL))
+    return bulk_update_config(Device.objects.filter(pk__in=device_ids))
@@ -0,0 +1,216 @@
+import threading
+import time
+from collections import Counter
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from swapper import load_model
+
+from openwisp_utils.tests import catch_signal
+
+from ...config.signals import config_status_changed
+from ..push import ConfigPusher, bulk_update_config
+from ..signals import is_working_changed
+from ..tasks import _get_update_config_cache_key
+from ..tasks import bulk_update_config as bulk_update_config_task
+from ..tasks import launch_update_config, update_config
+from .utils import CreateConnectionsMixin
+
+Config = load_model('config', 'Config')
+Device = load_model('config', 'Device')
+DeviceConnection = load_model('connection', 'DeviceConnection')
+
+_connect_path = 'paramiko.SSHClient.connect'
+_exec_command_path = 'paramiko.SSHClient.exec_command'
+
+
+class TestBulkUpdateConfig(CreateConnectionsMixin, TestCase):
+    app_label = 'connection'
+    _UNREACHABLE_IP = '10.0.1.3'
+
+    def _create_fleet(self, orgs=2, devices=5):
+        for org_index in range(orgs):
+            org = self._create_org(name=f'org{org_index}', slug=f'org{org_index}')
+            credentials = self._create_credentials(organization=org)
+            for index in range(devices):
+                ip = f'10.0.{org_index}.{index}'
+                device = self._create_device(
+                    organization=org,
+                    name=f'device-{org_index}-{index}',
+                    mac_address=f'00:11:22:33:{org_index:02x}:{index:02x}',
+                    management_ip=ip,
+                    last_ip=ip,
+                )
+                self._create_config(device=device)
+                self._create_device_connection(device=device, credentials=credentials)
+
+    def _get_exec_command_return_value(self):
+        stdout = mock.Mock()
+        stdout.read().decode('utf8').strip.return_value = 'mocked'
+        stdout.channel.recv_exit_status.return_value = 0
+        stderr = mock.Mock()
+        stderr.read().decode('utf8').strip.return_value = ''
+        return mock.Mock(), stdout, stderr
+
+    def test_bulk_update_config(self):
+        self._create_fleet()
+        # the configuration of this device is already applied
+        applied = Device.objects.get(name='device-0-4')
+        applied.config.set_status_applied()
+        lock = threading.Lock()
+        running = Counter()
+        peaks = Counter()
+
+        def connect(address, **kwargs):
+            org = address.split('.')[2]
+            with lock:
+                running[org] += 1
+                running['all'] += 1
+                peaks[org] = max(peaks[org], running[org])
+                peaks['all'] = max(peaks['all'], running['all'])
+            time.sleep(0.02)
+            with lock:
+                running[org] -= 1
+                running['all'] -= 1
+            if address == self._UNREACHABLE_IP:
+                raise Exception('timed out')
+
+        progress = mock.Mock()
+        with mock.patch(_connect_path, side_effect=connect), mock.patch(
+            _exec_command_path, return_value=self._get_exec_command_return_value()
+        ), catch_signal(is_working_changed) as handler:
+            stats = bulk_update_config(
+                Device.objects.all(),
+                max_workers=3,
+                max_workers_per_org=2,
+                progress=progress,
+            )
+        self.assertEqual(stats['total'], 9)
+        self.assertEqual(stats['completed'], 9)
+        self.assertEqual(stats['updated'], 8)
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual(stats['unreachable'], 1)
+        self.assertGreater(stats['throughput'], 0)
+        self.assertEqual(progress.call_count, 9)
+        self.assertEqual(progress.call_args[0][0]['completed'], 9)
+        self.assertLessEqual(peaks['all'], 3)
+        self.assertLessEqual(peaks['0'], 2)
+        self.assertLessEqual(peaks['1'], 2)
+        self.assertEqual(handler.call_count, 9)
+
+        unreachable = DeviceConnection.objects.get(
+            device__management_ip=self._UNREACHABLE_IP
+        )
+        self.assertFalse(unreachable.is_working)
+        self.assertEqual(unreachable.failure_reason, 'timed out')
+        self.assertIsNotNone(unreachable.last_attempt)
+        self.assertEqual(unreachable.device.config.status, 'modified')
+        connections = DeviceConnection.objects.exclude(pk=unreachable.pk).exclude(
+            device=applied
+        )
+        self.assertEqual(connections.filter(is_working=True).count(), 8)
+        self.assertEqual(connections.filter(last_attempt=None).count(), 0)
+        self.assertEqual(Config.objects.filter(status='applied').count(), 9)
+        self.assertIsNone(DeviceConnection.objects.get(device=applied).is_working)
+
+    def test_bulk_update_config_failure(self):
+        self._create_fleet(orgs=1, devices=2)
+        with mock.patch(_connect_path), mock.patch(
+            _exec_command_path, side_effect=Exception('command failed')
+        ), mock.patch('logging.Logger.exception'):
+            stats = bulk_update_config(Device.objects.all())
+        self.assertEqual(stats['failed'], 2)
+        self.assertEqual(DeviceConnection.objects.filter(is_working=True).count(), 2)
+        self.assertEqual(Config.objects.filter(status='modified').count(), 2)
+
+    def test_bulk_update_config_status_changed(self):
+        self._create_fleet(orgs=1, devices=2)
+        changed, device = Device.objects.order_by('name')
+
+        original_save = ConfigPusher.save
+
+        def save(pusher, *args, **kwargs):
+            # the status of the configuration changes during the push
+            Config.objects.filter(device=changed).update(status='error')
+            return original_save(pusher, *args, **kwargs)
+
+        with mock.patch(_connect_path), mock.patch(
+            _exec_command_path, return_value=self._get_exec_command_return_value()
+        ), mock.patch.object(
+            ConfigPusher, 'save', side_effect=save, autospec=True
+        ), catch_signal(
+            config_status_changed
+        ) as handler:
+            stats = bulk_update_config(Device.objects.all())
+        self.assertEqual(stats['updated'], 2)
+        handler.assert_called_once()
+        self.assertEqual(handler.call_args[1]['instance'].device_id, device.pk)
+        changed.config.refresh_from_db()
+        self.assertEqual(changed.config.status, 'error')
+        device.config.refresh_from_db()
+        self.assertEqual(device.config.status, 'applied')
+
+    def test_bulk_update_config_task(self):
+        self._create_fleet(orgs=1, devices=2)
+        device = Device.objects.first()
+        with mock.patch(_connect_path), mock.patch(
+            _exec_command_path, return_value=self._get_exec_command_return_value()
+        ):
+            bulk_update_config_task.delay([device.pk])
+        self.assertEqual(Config.objects.filter(status='applied').count(), 1)
+        device.config.refresh_from_db()
+        self.assertEqual(device.config.status, 'applied')
+
+    def test_bulk_update_config_lock(self):
+        self._create_fleet(orgs=1, devices=2)
+        locked, device = Device.objects.order_by('name')
+        locked_key = _get_update_config_cache_key(locked.pk, 'lock')
+        lock_key = _get_update_config_cache_key(device.pk, 'lock')
+        # an update of the device is already queued
+        cache.set(locked_key, True)
+
+        original_save = ConfigPusher.save
+
+        def save(pusher, *args, **kwargs):
+            # the update_config task stores its result meanwhile
+            DeviceConnection.objects.filter(device=locked).update(
+                is_working=False, failure_reason='task result'
+            )
+            return original_save(pusher, *args, **kwargs)
+
+        def exec_command(*args, **kwargs):
+            # the device is locked during the bulk update
+            self.assertTrue(cache.get(lock_key))
+            # modifications received meanwhile are not pushed
+            # concurrently but are coalesced in a pending update
+            with mock.patch.object(update_config, 'apply_async') as mocked:
+                self.assertFalse(launch_update_config(device.pk))
+            mocked.assert_not_called()
+            return self._get_exec_command_return_value()
+
+        with mock.patch(_connect_path), mock.patch(
+            _exec_command_path, side_effect=exec_command
+        ), mock.patch.object(
+            update_config, 'apply_async'
+        ) as mocked_apply_async, mock.patch.object(
+            ConfigPusher, 'save', side_effect=save, autospec=True
+        ), catch_signal(
+            is_working_changed
+        ) as handler:
+            stats = bulk_update_config(Device.objects.all())
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(stats['skipped'], 1)
+        # the skipped connection is not overwritten
+        handler.assert_called_once()
+        self.assertEqual(handler.call_args[1]['instance'].device_id, device.pk)
+        connection = DeviceConnection.objects.get(device=locked)
+        self.assertFalse(connection.is_working)
+        self.assertEqual(connection.failure_reason, 'task result')
+        # the pending update is launched when the lock is released
+        mocked_apply_async.assert_called_once()
+        self.assertEqual(mocked_apply_async.call_args[1]['args'], [device.pk])
+        locked.config.refresh_from_db()
+        self.assertEqual(locked.config.status, 'modified')
+        self.assertTrue(cache.get(locked_key))
+        cache.delete_many([locked_key, lock_key])
@@ -1,10 +1,16 @@
 import os
+import time
+import uuid
+from io import BytesIO
 from unittest import mock
 
+import paramiko
 from django.conf import settings
 from django.test import TestCase
 from swapper import load_model
 
+from .. import settings as app_settings
+from ..connectors.pool import ssh_pool
 from .utils import CreateConnectionsMixin, SshServer
 
 Config = load_model('config', 'Config')
@@ -61,3 +67,116 @@ class TestSsh(CreateConnectionsMixin, TestCase):
         fl = open(os.path.join(settings.BASE_DIR, '../media/floorplan.jpg'), 'rb')
         dc.connector_instance.upload(fl, '/tmp/test')
         putfo_mocked.assert_called_once()
+
+    @mock.patch.object(app_settings, 'SSH_CONNECTION_POOL', True)
+    @mock.patch('scp.SCPClient.putfo')
+    def test_connection_pool(self, putfo_mocked):
+        self.addCleanup(ssh_pool.clear)
+        ckey = self._create_credentials_with_key(port=self.ssh_server.port)
+        dc = self._create_device_connection(credentials=ckey)
+        connect = paramiko.SSHClient.connect
+        with mock.patch.object(
+            paramiko.SSHClient, 'connect', autospec=True, side_effect=connect
+        ) as mocked_connect:
+            dc.connector_instance.connect()
+            dc.connector_instance.exec_command('echo test')
+            dc.connector_instance.disconnect()
+            self.assertEqual(len(ssh_pool), 1)
+            # another connector of the same device reuses the connection
+            del dc.connector_instance
+            connector = dc.connector_instance
+            connector.connect()
+            self.assertEqual(len(ssh_pool), 0)
+            output, exit_code = connector.exec_command('echo test')
+            self.assertEqual(output, 'test\n')
+            connector.upload(BytesIO(b'test'), '/tmp/test')
+            putfo_mocked.assert_called_once()
+            connector.disconnect()
+            mocked_connect.assert_called_once()
+            self.assertEqual(len(ssh_pool), 1)
+
+            with self.subTest('different credentials'):
+                self.assertEqual(connector.pool_key, (dc.device_id, ckey.pk))
+                self.assertIsNone(ssh_pool.acquire((dc.device_id, uuid.uuid4())))
+                self.assertEqual(len(ssh_pool), 1)
+
+            with self.subTest('connectors not bound to a device are not pooled'):
+                connector = dc.connector_class(
+                    params=dc.get_params(), addresses=dc.get_addresses()
+                )
+                self.assertIsNone(connector.pool_key)
+                connector.connect()
+                connector.disconnect()
+                self.assertEqual(mocked_connect.call_count, 2)
+                self.assertEqual(len(ssh_pool), 1)
+
+            with self.subTest('expired connection'):
+                monotonic = time.monotonic() + app_settings.SSH_POOL_MAX_AGE
+                with mock.patch('time.monotonic', return_value=monotonic):
+                    dc.connector_instance.connect()
+                self.assertEqual(mocked_connect.call_count, 3)
+                self.assertEqual(len(ssh_pool), 0)
+                dc.connector_instance.disconnect()
+                self.assertEqual(len(ssh_pool), 1)
+
+    @mock.patch.object(app_settings, 'SSH_CONNECTION_POOL', True)
+    def test_connection_pool_dead_connection(self):
+        self.addCleanup(ssh_pool.clear)
+        ckey = self._create_credentials_with_key(port=self.ssh_server.port)
+        dc = self._create_device_connection(credentials=ckey)
+        connector = dc.connector_instance
+        connector.connect()
+        dead_client = connector.shell
+        connector.disconnect()
+        self.assertEqual(len(ssh_pool), 1)
+        connector.connect()
+        self.assertIs(connector.shell, dead_client)
+        exec_command = paramiko.SSHClient.exec_command
+
+        def fail_on_dead_client(client, *args, **kwargs):
+            if client is dead_client:
+                raise paramiko.SSHException('SSH session not active')
+            return exec_command(client, *args, **kwargs)
+
+        with mock.patch.object(
+            paramiko.SSHClient,
+            'exec_command',
+            autospec=True,
+            side_effect=fail_on_dead_client,
+        ):
+            output, exit_code = connector.exec_command('echo test')
+        self.assertEqual(output, 'test\n')
+        self.assertIsNot(connector.shell, dead_client)
+        self.assertIsNone(dead_client.get_transport())
+        connector.disconnect()
+        # the new connection is pooled
+        self.assertEqual(len(ssh_pool), 1)
+
+        with self.subTest('new connections are not retried'):
+            del dc.connector_instance
+            connector = dc.connector_instance
+            with mock.patch.object(
+                paramiko.SSHClient,
+                'exec_command',
+                side_effect=paramiko.SSHException('failure'),
+            ), mock.patch('logging.Logger.exception'):
+                connector._open()
+                with self.assertRaises(paramiko.SSHException):
+                    connector.exec_command('echo test')
+            connector.disconnect()
+
+    @mock.patch.object(app_settings, 'SSH_CONNECTION_POOL', True)
+    def test_connection_pool_idle_timeout(self):
+        self.addCleanup(ssh_pool.clear)
+        ckey = self._create_credentials_with_key(port=self.ssh_server.port)
+        dc = self._create_device_connection(credentials=ckey)
+        connector = dc.connector_instance
+        connector.connect()
+        client = connector.shell
+        connector.disconnect()
+        self.assertEqual(len(ssh_pool), 1)
+        monotonic = time.monotonic() + app_settings.SSH_POOL_IDLE_TIMEOUT
+        with mock.patch('time.monotonic', return_value=monotonic):
+            self.assertIsNone(ssh_pool.acquire(connector.pool_key))
+        self.assertEqual(len(ssh_pool), 0)
+        self.assertIsNone(client.get_transport())
@@ -0,0 +1,98 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from swapper import load_model
+
+from openwisp_controller.config.tests.utils import (
+    QueryBudgetMixin,
+    add_fleet_devices,
+    create_fleet,
+)
+from openwisp_users.tests.utils import TestOrganizationMixin
+
+from ...tests.utils import TestAdminMixin
+
+Location = load_model('geo', 'Location')
+DeviceLocation = load_model('geo', 'DeviceLocation')
+Organization = load_model('openwisp_users', 'Organization')
+
+
+class TestQueryBudget(
+    QueryBudgetMixin, TestAdminMixin, TestOrganizationMixin, TestCase,
+):
+    """
+    query budgets of the geo API, measured on a small fleet
+    of devices which is then doubled, the budgets must not
+    change with the size of the fleet (see
+    ``openwisp_controller.config.tests.test_performance``)
+    """
+
+    # the budgets are checked with each of these fleet sizes
+    fleet_sizes = (20, 40)
+    fleet_locations = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        org = Organization.objects.create(name='fleet', slug='fleet')
+        cls.fleet = create_fleet(org, devices=cls.fleet_sizes[0])
+        cls.locations = []
+        for i in range(cls.fleet_locations):
+            location = Location(
+                name=f'location-{i}',
+                address='Via del Corso, Roma, Italia',
+                geometry='SRID=4326;POINT (12.512124 41.898903)',
+                type='outdoor',
+                organization=org,
+            )
+            location.full_clean()
+            location.save()
+            cls.locations.append(location)
+        cls._add_device_locations(cls.fleet['devices'])
+
+    @classmethod
+    def _add_device_locations(cls, devices, start=0):
+        """
+        distributes the devices evenly among the locations
+        """
+        for n, device in enumerate(devices, start):
+            device_location = DeviceLocation(
+                content_object=device, location=cls.locations[n % cls.fleet_locations]
+            )
+            device_location.full_clean()
+            device_location.save()
+
+    def setUp(self):
+        # the devices added by each test are rolled back
+        self.fleet = dict(self.fleet, devices=list(self.fleet['devices']))
+        # the budgets are measured with cold caches
+        self._clear_caches()
+
+    def _clear_caches(self):
+        cache.clear()
+        ContentType.objects.clear_cache()
+
+    def _get_fleet_sizes(self):
+        """
+        yields each of ``fleet_sizes``, after having added
+        the missing devices (and their locations) to the fleet
+        """
+        for size in self.fleet_sizes:
+            start = len(self.fleet['devices'])
+            devices = add_fleet_devices(self.fleet, size - start)
+            self._add_device_locations(devices, start)
+            self._clear_caches()
+            yield size
+
+    def test_geojson_list(self):
+        self._create_admin()
+        self._login()
+        url = reverse('geo:api_location_geojson')
+        for size in self._get_fleet_sizes():
+            with self.assertQueryBudget(4, f'geojson location list ({size})'):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], self.fleet_locations)
+            device_count = size // self.fleet_locations
+            for feature in response.data['features']:
+                self.assertEqual(feature['properties']['device_count'], device_count)
@@ -2,10 +2,14 @@ from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django_x509.base.models import AbstractCa as BaseCa
 from django_x509.base.models import AbstractCert as BaseCert
+from django_x509.base.models import datetime_to_string
+from OpenSSL import crypto
 from swapper import get_model_name
 
 from openwisp_users.mixins import ShareableOrgMixin
 
+from ..key_pool import get_private_key
+
 
 class AbstractCa(ShareableOrgMixin, BaseCa):
     class Meta(BaseCa.Meta):
@@ -23,5 +27,36 @@ class AbstractCert(ShareableOrgMixin, BaseCert):
     class Meta(BaseCert.Meta):
         abstract = True
 
+    def _generate(self):
+        """
+        same as ``django_x509``'s ``_generate`` but the private
+        key is taken from the pool when available (the private
+        keys of CAs are always generated on demand instead),
+        see ``openwisp_controller.pki.key_pool``
+        """
+        key = get_private_key(self.key_length)
+        cert = crypto.X509()
+        subject = self._fill_subject(cert.get_subject())
+        cert.set_version(0x2)  # version 3 (0 indexed counting)
+        cert.set_subject(subject)
+        cert.set_serial_number(int(self.serial_number))
+        cert.set_notBefore(bytes(str(datetime_to_string(self.validity_start)), 'utf8'))
+        cert.set_notAfter(bytes(str(datetime_to_string(self.validity_end)), 'utf8'))
+        cert.set_issuer(self.ca.x509.get_subject())
+        cert.set_pubkey(key)
+        cert = self._add_extensions(cert)
+        cert.sign(self.ca.pkey, str(self.digest))
+        self.certificate = crypto.dump_certificate(crypto.FILETYPE_PEM, cert).decode(
+            'utf-8'
+        )
+        key_args = (crypto.FILETYPE_PEM, key)
+        key_kwargs = {}
+        if self.passphrase:
+            key_kwargs['passphrase'] = self.passphrase.encode('utf-8')
+            key_kwargs['cipher'] = 'DES-EDE3-CBC'
+        self.private_key = crypto.dump_privatekey(*key_args, **key_kwargs).decode(
+            'utf-8'
+        )
+
     def clean(self):
         self._validate_org_relation('ca')
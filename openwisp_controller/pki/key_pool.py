@@ -0,0 +1,151 @@
+"""
+Pool of pre-generated private keys stored in the cache defined in
+``OPENWISP_CONTROLLER_PRIVATE_KEY_POOL_CACHE``, the pool is refilled
+in the background by the
+``openwisp_controller.pki.tasks.refill_private_key_pool`` task
+(see ``OPENWISP_CONTROLLER_PRIVATE_KEY_POOL``)
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from OpenSSL import crypto
+
+from . import settings as app_settings
+
+logger = logging.getLogger(__name__)
+
+# django_x509 generates only RSA keys
+ALGORITHMS = {'rsa': crypto.TYPE_RSA}
+# keys which are never consumed (eg: the pool has been
+# resized) expire eventually instead of filling the cache
+_KEY_TIMEOUT = 60 * 60 * 24
+# amount of keys being generated, the counter expires
+# after the soft time limit of the generation tasks
+_PENDING_TIMEOUT = 1200
+# the keys are stored encrypted with a passphrase derived from SECRET_KEY
+_KEY_CIPHER = 'aes-256-cbc'
+
+
+def _get_cache():
+    return caches[app_settings.PRIVATE_KEY_POOL_CACHE]
+
+
+def _get_cache_key(key_length, algorithm, suffix):
+    return f'openwisp_controller.pki.key_pool.{algorithm}.{key_length}.{suffix}'
+
+
+def _get_passphrase():
+    value = f'openwisp_controller.pki.key_pool.{settings.SECRET_KEY}'
+    return hashlib.sha256(value.encode()).hexdigest().encode()
+
+
+def _incr(key):
+    cache = _get_cache()
+    cache.add(key, 0, timeout=None)
+    return cache.incr(key)
+
+
+def _get_indexes(key_length, algorithm):
+    head_key = _get_cache_key(key_length, algorithm, 'head')
+    tail_key = _get_cache_key(key_length, algorithm, 'tail')
+    values = _get_cache().get_many([head_key, tail_key])
+    return values.get(head_key, 0), values.get(tail_key, 0)
+
+
+def is_pool_enabled(key_length, algorithm='rsa'):
+    return algorithm == 'rsa' and str(key_length) in app_settings.PRIVATE_KEY_POOL
+
+
+def get_pool_depth(key_length, algorithm='rsa'):
+    """
+    returns the amount of keys available in the pool
+    """
+    head, tail = _get_indexes(key_length, algorithm)
+    return max(head - tail, 0)
+
+
+def get_pending_count(key_length, algorithm='rsa'):
+    """
+    returns the amount of keys which are being generated
+    """
+    key = _get_cache_key(key_length, algorithm, 'pending')
+    return max(_get_cache().get(key, 0), 0)
+
+
+def add_pending_count(count, key_length, algorithm='rsa'):
+    """
+    increments (or decrements, if ``count`` is negative)
+    atomically the amount of keys which are being generated
+    """
+    cache = _get_cache()
+    key = _get_cache_key(key_length, algorithm, 'pending')
+    cache.add(key, 0, _PENDING_TIMEOUT)
+    try:
+        cache.incr(key, count)
+    except ValueError:
+        # the counter has expired in the meantime
+        cache.add(key, max(count, 0), _PENDING_TIMEOUT)
+
+
+def generate_private_key(key_length, algorithm='rsa'):
+    """
+    returns a new ``OpenSSL.crypto.PKey`` instance
+    """
+    key = crypto.PKey()
+    key.generate_key(ALGORITHMS[algorithm], int(key_length))
+    return key
+
+
+def add_private_keys(keys, key_length, algorithm='rsa'):
+    """
+    adds ``keys`` (``OpenSSL.crypto.PKey`` instances) to the pool
+    """
+    cache = _get_cache()
+    head_key = _get_cache_key(key_length, algorithm, 'head')
+    tail_key = _get_cache_key(key_length, algorithm, 'tail')
+    for key in keys:
+        pem = crypto.dump_privatekey(
+            crypto.FILETYPE_PEM, key, _KEY_CIPHER, _get_passphrase()
+        ).decode()
+        # the positions passed by consumers while the pool was empty
+        # are skipped, the head is only incremented (never set) because
+        # other generation tasks may be adding keys at the same time
+        index = _incr(head_key)
+        while index <= cache.get(tail_key, 0):
+            index = _incr(head_key)
+        cache.set(_get_cache_key(key_length, algorithm, index), pem, _KEY_TIMEOUT)
+
+
+def pop_private_key(key_length, algorithm='rsa'):
+    """
+    removes a key from the pool and returns it as an
+    ``OpenSSL.crypto.PKey`` instance, returns ``None``
+    if the pool is empty
+    """
+    if not get_pool_depth(key_length, algorithm):
+        return None
+    cache = _get_cache()
+    index = _incr(_get_cache_key(key_length, algorithm, 'tail'))
+    slot = _get_cache_key(key_length, algorithm, index)
+    pem = cache.get(slot)
+    # another consumer got the last key
+    # or the key has not been stored yet
+    if pem is None:
+        return None
+    cache.delete(slot)
+    return crypto.load_privatekey(crypto.FILETYPE_PEM, pem, _get_passphrase())
+
+
+def get_private_key(key_length, algorithm='rsa'):
+    """
+    returns a key of the pool if the pool of ``key_length``
+    is enabled and not empty, otherwise generates a new key
+    """
+    if is_pool_enabled(key_length, algorithm):
+        key = pop_private_key(key_length, algorithm)
+        if key is not None:
+            return key
+        logger.info(f'private key pool {algorithm}-{key_length} is empty')
+    return generate_private_key(key_length, algorithm)
@@ -0,0 +1,8 @@
+from ..config.settings import get_settings_value
+
+# number of private keys kept ready for each key length, eg: {'2048': 50}
+PRIVATE_KEY_POOL = get_settings_value('PRIVATE_KEY_POOL', {})
+PRIVATE_KEY_POOL_CHUNK_SIZE = get_settings_value('PRIVATE_KEY_POOL_CHUNK_SIZE', 10)
+PRIVATE_KEY_POOL_CACHE = get_settings_value(
+    'PRIVATE_KEY_POOL_CACHE', 'openwisp_controller_private_keys'
+)
@@ -0,0 +1,78 @@
+import logging
+import time
+
+from celery import group, shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+
+from . import settings as app_settings
+from .key_pool import (
+    add_pending_count,
+    add_private_keys,
+    generate_private_key,
+    get_pending_count,
+    get_pool_depth,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(soft_time_limit=1200)
+def generate_private_keys(key_length, count, algorithm='rsa'):
+    """
+    Generates ``count`` private keys and adds them to the key pool
+    """
+    keys = []
+    start = time.monotonic()
+    try:
+        for i in range(count):
+            keys.append(generate_private_key(key_length, algorithm))
+    except SoftTimeLimitExceeded:
+        logger.error(
+            'soft time limit hit while generating '
+            f'{count} private keys ({algorithm}-{key_length})'
+        )
+    add_private_keys(keys, key_length, algorithm)
+    add_pending_count(-count, key_length, algorithm)
+    elapsed = time.monotonic() - start
+    rate = len(keys) / elapsed if elapsed else 0
+    logger.info(
+        f'generated {len(keys)} private keys ({algorithm}-{key_length}) '
+        f'in {elapsed:.2f}s ({rate:.2f} keys/s), '
+        f'pool depth: {get_pool_depth(key_length, algorithm)}'
+    )
+    return {'generated': len(keys), 'seconds': elapsed}
+
+
+@shared_task(soft_time_limit=1200)
+def refill_private_key_pool():
+    """
+    Refills the key pool up to the size defined in
+    ``OPENWISP_CONTROLLER_PRIVATE_KEY_POOL``, the keys are generated
+    in chunks processed in parallel by the celery workers,
+    meant to be scheduled periodically with celery beat
+    """
+    chunk_size = app_settings.PRIVATE_KEY_POOL_CHUNK_SIZE
+    metrics = {}
+    for key_length, size in app_settings.PRIVATE_KEY_POOL.items():
+        depth = get_pool_depth(key_length)
+        pending = get_pending_count(key_length)
+        missing = max(size - depth - pending, 0)
+        metrics[key_length] = {
+            'size': size,
+            'depth': depth,
+            'pending': pending,
+            'scheduled': missing,
+        }
+        logger.info(
+            f'private key pool rsa-{key_length}: depth {depth}/{size}, '
+            f'{pending} being generated, {missing} scheduled'
+        )
+        if not missing:
+            continue
+        add_pending_count(missing, key_length)
+        tasks = []
+        for start in range(0, missing, chunk_size):
+            count = min(chunk_size, missing - start)
+            tasks.append(generate_private_keys.s(key_length, count))
+        group(tasks).apply_async()
+    return metrics
@@ -1,3 +1,6 @@
+from unittest import mock
+
+from django.core.cache import cache, caches
 from django.core.exceptions import ValidationError
 from django.test import TestCase
 from django.urls import reverse
@@ -6,6 +9,15 @@ from swapper import load_model
 
 from openwisp_users.tests.utils import TestOrganizationMixin
 
+from .. import settings as app_settings
+from ..key_pool import (
+    add_pending_count,
+    add_private_keys,
+    generate_private_key,
+    get_pending_count,
+    get_pool_depth,
+)
+from ..tasks import generate_private_keys, refill_private_key_pool
 from .utils import TestPkiMixin
 
 Ca = load_model('django_x509', 'Ca')
@@ -52,3 +64,90 @@ class TestModels(TestPkiMixin, TestOrganizationMixin, TestCase):
         crl = crypto.load_crl(crypto.FILETYPE_PEM, response.content)
         revoked_list = crl.get_revoked()
         self.assertIsNone(revoked_list)
+
+    @mock.patch.object(app_settings, 'PRIVATE_KEY_POOL', {'512': 3})
+    @mock.patch.object(app_settings, 'PRIVATE_KEY_POOL_CHUNK_SIZE', 2)
+    def test_private_key_pool(self):
+        pool_cache = caches[app_settings.PRIVATE_KEY_POOL_CACHE]
+        pool_cache.clear()
+        ca = self._create_ca(key_length='512')
+        self.assertEqual(get_pool_depth('512'), 0)
+
+        with self.subTest('refill'):
+            with mock.patch.object(
+                generate_private_keys, 's', wraps=generate_private_keys.s
+            ) as mocked_s:
+                metrics = refill_private_key_pool.delay().get()
+            # keys are generated in chunks by parallel tasks
+            self.assertEqual(mocked_s.call_count, 2)
+            self.assertEqual(get_pool_depth('512'), 3)
+            self.assertEqual(
+                metrics, {'512': {'size': 3, 'depth': 0, 'pending': 0, 'scheduled': 3}},
+            )
+            # the pool is full
+            metrics = refill_private_key_pool.delay().get()
+            self.assertEqual(metrics['512']['scheduled'], 0)
+
+        with self.subTest('certificates use the keys of the pool'):
+            key = generate_private_key('512')
+            pool_cache.clear()
+            add_private_keys([key], '512')
+            cert = self._create_cert(ca=ca, key_length='512')
+            self.assertEqual(get_pool_depth('512'), 0)
+            self.assertEqual(
+                cert.private_key,
+                crypto.dump_privatekey(crypto.FILETYPE_PEM, key).decode(),
+            )
+            self.assertEqual(cert.x509.get_pubkey().bits(), 512)
+            self.assertEqual(cert.x509.get_issuer(), ca.x509.get_subject())
+            store = crypto.X509Store()
+            store.add_cert(ca.x509)
+            crypto.X509StoreContext(store, cert.x509).verify_certificate()
+
+        with self.subTest('keys are generated when the pool is empty'):
+            cert = self._create_cert(ca=ca, key_length='512', name='empty')
+            self.assertEqual(cert.pkey.bits(), 512)
+            self.assertEqual(get_pool_depth('512'), 0)
+            # the new keys are not skipped
+            add_private_keys([key], '512')
+            self.assertEqual(get_pool_depth('512'), 1)
+
+        with self.subTest('other key lengths do not use the pool'):
+            cert = self._create_cert(ca=ca, key_length='1024', name='other')
+            self.assertEqual(cert.pkey.bits(), 1024)
+            self.assertEqual(get_pool_depth('512'), 1)
+
+        with self.subTest('CAs do not use the pool'):
+            other_ca = self._create_ca(key_length='512', name='other')
+            self.assertEqual(other_ca.pkey.bits(), 512)
+            self.assertEqual(get_pool_depth('512'), 1)
+
+        with self.subTest('keys are stored encrypted in the dedicated cache'):
+            pem = crypto.dump_privatekey(crypto.FILETYPE_PEM, key).decode()
+            prefix = 'openwisp_controller.pki.key_pool.rsa.512'
+            head = pool_cache.get(f'{prefix}.head')
+            stored = pool_cache.get(f'{prefix}.{head}')
+            self.assertIn('ENCRYPTED', stored)
+            self.assertNotEqual(stored, pem)
+            self.assertIsNone(cache.get(f'{prefix}.head'))
+
+        with self.subTest('pending count'):
+            pool_cache.clear()
+            add_pending_count(3, '512')
+            add_pending_count(-1, '512')
+            self.assertEqual(get_pending_count('512'), 2)
+            pool_cache.clear()
+            # the counter has expired
+            add_pending_count(-2, '512')
+            self.assertEqual(get_pending_count('512'), 0)
+
+        with self.subTest('positions passed by consumers are skipped'):
+            pool_cache.clear()
+            # consumers passed the head while the pool was empty
+            pool_cache.set('openwisp_controller.pki.key_pool.rsa.512.tail', 2, None)
+            add_private_keys([key], '512')
+            add_private_keys([key], '512')
+            self.assertEqual(get_pool_depth('512'), 2)
+            cert = self._create_cert(ca=ca, key_length='512', name='passed')
+            self.assertEqual(cert.private_key, pem)
+            self.assertEqual(get_pool_depth('512'), 1)
@@ -0,0 +1,3 @@
+from openwisp_controller.config.management.commands.import_devices import (  # noqa
+    Command,
+)
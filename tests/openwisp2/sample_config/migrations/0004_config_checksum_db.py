@@ -0,0 +1,34 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample_config', '0003_name_unique_per_organization'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='config',
+            name='checksum_db',
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=32,
+                null=True,
+                verbose_name='configuration checksum',
+            ),
+        ),
+        migrations.AddField(
+            model_name='config',
+            name='checksum_updated',
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                null=True,
+                verbose_name='checksum last updated',
+            ),
+        ),
+    ]
@@ -3,10 +3,19 @@ from openwisp_controller.config.tests.test_config import TestConfig as BaseTestC
 from openwisp_controller.config.tests.test_controller import (
     TestController as BaseTestController,
 )
+from openwisp_controller.config.tests.test_controller import (
+    TestControllerTransaction as BaseTestControllerTransaction,
+)
 from openwisp_controller.config.tests.test_device import TestDevice as BaseTestDevice
+from openwisp_controller.config.tests.test_importer import (
+    TestDeviceImporter as BaseTestDeviceImporter,
+)
 from openwisp_controller.config.tests.test_notifications import (
     TestNotifications as BaseTestNotifications,
 )
+from openwisp_controller.config.tests.test_performance import (
+    TestQueryBudget as BaseTestQueryBudget,
+)
 from openwisp_controller.config.tests.test_tag import TestTag as BaseTestTag
 from openwisp_controller.config.tests.test_template import (
     TestTemplate as BaseTestTemplate,
@@ -33,10 +42,22 @@ class TestController(BaseTestController):
     pass
 
 
+class TestControllerTransaction(BaseTestControllerTransaction):
+    pass
+
+
 class TestDevice(BaseTestDevice):
     pass
 
 
+class TestDeviceImporter(BaseTestDeviceImporter):
+    pass
+
+
+class TestQueryBudget(BaseTestQueryBudget):
+    app_label = 'sample_config'
+
+
 class TestTag(BaseTestTag):
     pass
 
@@ -68,7 +89,10 @@ class TestVpnTransaction(BaseTestVpnTransaction):
 del BaseTestAdmin
 del BaseTestConfig
 del BaseTestController
+del BaseTestControllerTransaction
 del BaseTestDevice
+del BaseTestDeviceImporter
+del BaseTestQueryBudget
 del BaseTestTag
 del BaseTestTemplate
 del BaseTestTemplateTransaction
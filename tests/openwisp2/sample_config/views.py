@@ -1,5 +1,8 @@
 from swapper import load_model
 
+from openwisp_controller.config.controller.views import (
+    DeviceChecksumBulkView as BaseDeviceChecksumBulkView,
+)
 from openwisp_controller.config.controller.views import (
     DeviceChecksumView as BaseDeviceChecksumView,
 )
@@ -31,6 +34,11 @@ class DeviceChecksumView(BaseDeviceChecksumView):
     model = Device
 
 
+class DeviceChecksumBulkView(BaseDeviceChecksumBulkView):
+    model = Device
+    checksum_view_class = DeviceChecksumView
+
+
 class DeviceDownloadConfigView(BaseDeviceDownloadConfigView):
     model = Device
 
@@ -57,6 +65,7 @@ class VpnDownloadConfigView(BaseVpnDownloadConfigView):
 
 
 device_checksum = DeviceChecksumView.as_view()
+device_checksum_bulk = DeviceChecksumBulkView.as_view()
 device_download_config = DeviceDownloadConfigView.as_view()
 device_update_info = DeviceUpdateInfoView.as_view()
 device_report_status = DeviceReportStatusView.as_view()
@@ -8,6 +8,9 @@ from openwisp_controller.connection.tests.test_models import (
 from openwisp_controller.connection.tests.test_notifications import (
     TestNotifications as BaseTestNotifications,
 )
+from openwisp_controller.connection.tests.test_push import (
+    TestBulkUpdateConfig as BaseTestBulkUpdateConfig,
+)
 from openwisp_controller.connection.tests.test_ssh import TestSsh as BaseTestSsh
 
 
@@ -24,6 +27,10 @@ class TestModelsTransaction(BaseTestModelsTransaction):
     app_label = 'sample_connection'
 
 
+class TestBulkUpdateConfig(BaseTestBulkUpdateConfig):
+    app_label = 'sample_connection'
+
+
 class TestSsh(BaseTestSsh):
     pass
 
@@ -35,5 +42,6 @@ class TestNotifications(BaseTestNotifications):
 del BaseTestAdmin
 del BaseTestModels
 del BaseTestModelsTransaction
+del BaseTestBulkUpdateConfig
 del BaseTestSsh
 del BaseTestNotifications
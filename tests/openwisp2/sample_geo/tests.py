@@ -4,6 +4,9 @@ from openwisp_controller.geo.tests.test_admin_inline import (
 )
 from openwisp_controller.geo.tests.test_api import TestApi as BaseTestApi
 from openwisp_controller.geo.tests.test_models import TestModels as BaseTestModels
+from openwisp_controller.geo.tests.test_performance import (
+    TestQueryBudget as BaseTestQueryBudget,
+)
 
 
 class TestAdmin(BaseTestAdmin):
@@ -22,7 +25,12 @@ class TestModels(BaseTestModels):
     pass
 
 
+class TestQueryBudget(BaseTestQueryBudget):
+    pass
+
+
 del BaseTestAdmin
 del BaseTestAdminInline
 del BaseTestApi
 del BaseTestModels
+del BaseTestQueryBudget
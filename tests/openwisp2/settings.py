@@ -142,6 +142,18 @@ else:
     CELERY_TASK_EAGER_PROPAGATES = True
     CELERY_BROKER_URL = 'memory://'
 
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'openwisp_controller_archives': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'openwisp-controller-archives',
+    },
+    'openwisp_controller_private_keys': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'openwisp-controller-private-keys',
+    },
+}
+
 LOGGING = {
     'version': 1,
     'filters': {'require_debug_true': {'()': 'django.utils.log.RequireDebugTrue'}},